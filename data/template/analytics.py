@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+
+from columnar_store import FLAG_GAME, month_label
+
+
+def game_spending_frame(columns, platforms, categories):
+    # One row per game purchase, built from the columnar replica without
+    # touching the transaction dicts. Codes of 0 (none/unknown) become "Other".
+    game = (columns["flags"] & FLAG_GAME) != 0
+    months = columns["day"][game].astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+    return pd.DataFrame({
+        "amount": columns["amount"][game] / 100,
+        "month": months,
+        "platform": pd.Categorical.from_codes(
+            columns["platform"][game].astype(np.int16) - 1, categories=platforms
+        ).add_categories(["Other"] if "Other" not in platforms else []).fillna("Other"),
+        "category": pd.Categorical.from_codes(
+            columns["category"][game].astype(np.int16) - 1, categories=categories
+        ).add_categories(["Other"] if "Other" not in categories else []).fillna("Other"),
+    })
+
+
+def share_table(totals, total):
+    # {name: {"amount", "percentage"}}, largest first
+    totals = totals[totals > 0].sort_values(ascending=False)
+    return {
+        name: {"amount": float(amount), "percentage": (float(amount) / total * 100) if total else 0}
+        for name, amount in totals.items()
+    }
+
+
+def game_spending_summary(frame):
+    # Every figure the analytics page shows, from grouped sums over one frame
+    total = float(frame["amount"].sum())
+    count = len(frame)
+    monthly = frame.groupby("month")["amount"].sum().sort_index()
+    return {
+        "total_game_spent": total,
+        "game_transaction_count": count,
+        "avg_transaction": total / count if count else 0,
+        "category_data": share_table(frame.groupby("category", observed=True)["amount"].sum(), total),
+        "platform_data": share_table(frame.groupby("platform", observed=True)["amount"].sum(), total),
+        "monthly_trend": {month_label(int(month)): float(amount) for month, amount in monthly.items()},
+    }
+
+
+def chart_series(summary):
+    # {chart kind: {label: amount}} for the time, category and platform charts
+    return {
+        "time": summary["monthly_trend"],
+        "category": {name: data["amount"] for name, data in summary["category_data"].items()},
+        "platform": {name: data["amount"] for name, data in summary["platform_data"].items()},
+    }
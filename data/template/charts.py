@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# A render lock older than this is left over from a crashed worker
+RENDER_TIMEOUT = 120
+
+# A chart whose render failed is not retried for this many seconds
+FAILURE_BACKOFF = 300
+
+CHART_KINDS = ["time", "category", "platform"]
+
+
+def render_chart(kind, series, path):
+    # Runs in a pool process. Writes the PNG next to its final name and moves
+    # it into place, so a half-written chart is never served.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    try:
+        import seaborn
+        seaborn.set_theme(style="whitegrid")
+    except ImportError:  # plain matplotlib styling
+        pass
+
+    labels = list(series)
+    values = [series[label] for label in labels]
+    if kind == "time":
+        fig, ax = plt.subplots(figsize=(10, 4))
+        ax.plot(labels, values, marker="o")
+        ax.set_ylabel("Amount (₹)")
+        ax.tick_params(axis="x", rotation=45)
+    else:
+        fig, ax = plt.subplots(figsize=(6, 4))
+        ax.barh(labels[::-1], values[::-1])
+        ax.set_xlabel("Amount (₹)")
+    fig.tight_layout()
+    tmp_file = f"{path}.{os.getpid()}.tmp.png"
+    fig.savefig(tmp_file, dpi=100)
+    plt.close(fig)
+    os.replace(tmp_file, path)
+
+
+class ChartRenderer:
+    # Analytics charts rendered off the request path in a process pool and
+    # cached as static/charts/<user key>-<kind>-<content hash>.png. The hash
+    # covers the user, their data version and the plotted series, so a file
+    # never goes stale; older files for the same user and chart are evicted
+    # once a newer one is written. Each render is single-flighted: within a
+    # process by the in-flight table, across processes by a lock file. A failed
+    # render leaves a .failed marker next to where the chart would be, and the
+    # chart is not resubmitted until the marker is FAILURE_BACKOFF old.
+
+    def __init__(self, chart_dir, max_workers=2):
+        self.chart_dir = chart_dir
+        self.max_workers = max_workers
+        self._pool = None
+        self._pool_pid = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        if not os.path.exists(chart_dir):
+            os.makedirs(chart_dir)
+
+    def _executor(self):
+        # Pools must not cross a fork, so one is started per worker pid
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._pool_pid = os.getpid()
+            self._inflight = {}
+        return self._pool
+
+    def chart_file(self, username, version, kind, series):
+        user_key = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+        content = json.dumps({"user": username, "version": version, "kind": kind, "series": series}, sort_keys=True)
+        content_key = hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+        return f"{user_key}-{kind}-{content_key}.png"
+
+    def charts_for(self, username, version, series):
+        # {kind: file name} for the charts already rendered, and None for those
+        # whose render recently failed. Missing ones are queued and show up on
+        # a later request; this never waits on a render.
+        charts = {}
+        for kind in CHART_KINDS:
+            if not series.get(kind):
+                continue
+            filename = self.chart_file(username, version, kind, series[kind])
+            if os.path.exists(os.path.join(self.chart_dir, filename)):
+                charts[kind] = filename
+            elif self._failed(filename):
+                charts[kind] = None
+            else:
+                self._submit(filename, kind, series[kind])
+        return charts
+
+    def _failed(self, filename):
+        failed_file = os.path.join(self.chart_dir, filename + ".failed")
+        try:
+            if time.time() - os.path.getmtime(failed_file) < FAILURE_BACKOFF:
+                return True
+            os.remove(failed_file)
+        except FileNotFoundError:
+            pass
+        return False
+
+    def _claim(self, filename):
+        lock_file = os.path.join(self.chart_dir, filename + ".lock")
+        try:
+            os.close(os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_file) > RENDER_TIMEOUT:
+                    os.remove(lock_file)
+                    return self._claim(filename)
+            except FileNotFoundError:
+                return self._claim(filename)
+            return False
+
+    def _submit(self, filename, kind, series):
+        with self._lock:
+            executor = self._executor()
+            if filename in self._inflight or not self._claim(filename):
+                return
+            future = executor.submit(render_chart, kind, series, os.path.join(self.chart_dir, filename))
+            self._inflight[filename] = future
+        future.add_done_callback(lambda f: self._finish(filename, f))
+
+    def _finish(self, filename, future):
+        with self._lock:
+            self._inflight.pop(filename, None)
+        if future.exception() is not None:
+            open(os.path.join(self.chart_dir, filename + ".failed"), 'w').close()
+        lock_file = os.path.join(self.chart_dir, filename + ".lock")
+        if os.path.exists(lock_file):
+            os.remove(lock_file)
+        if os.path.exists(os.path.join(self.chart_dir, filename)):
+            self.evict_stale(filename)
+
+    def evict_stale(self, filename):
+        # Drop the older renders of the same user's chart and their failure markers
+        prefix = filename.rsplit("-", 1)[0] + "-"
+        for entry in os.scandir(self.chart_dir):
+            if entry.name.startswith(prefix) and entry.name.endswith((".png", ".failed")) and entry.name != filename:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
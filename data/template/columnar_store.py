@@ -0,0 +1,154 @@
+import os
+import json
+import shutil
+import hashlib
+import datetime
+
+import numpy as np
+
+# Bits of the per-transaction flags column
+FLAG_GAME = 1
+FLAG_APPROVED = 2
+FLAG_DELETED = 4  # tombstone left by a denied transaction, dropped on rebuild
+
+# One raw, fixed-width file per column, appended to in place
+COLUMNS = {
+    "key": np.uint64,       # 64-bit hash of the transaction id
+    "amount": np.int64,     # paise
+    "day": np.int32,        # days since 1970-01-01
+    "platform": np.uint8,   # 1-based index into the platform list, 0 for none/unknown
+    "category": np.uint8,   # 1-based index into the category list, 0 for none/unknown
+    "flags": np.uint8,
+}
+
+EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def transaction_key(transaction_id):
+    digest = hashlib.blake2b(str(transaction_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+def epoch_day(date):
+    # ISO dates, with or without a time part
+    return datetime.date.fromisoformat(date[:10]).toordinal() - EPOCH_ORDINAL
+
+
+def month_label(month_index):
+    # Months since 1970-01 -> "YYYY-MM"
+    return f"{1970 + month_index // 12:04d}-{month_index % 12 + 1:02d}"
+
+
+class ColumnarReplica:
+    # Analytics copy of every user's transaction history, stored column by
+    # column under <replica_dir>/<sha256(username)[:16]>/ and read through np.memmap, so
+    # rollups are NumPy reductions instead of loops over transaction dicts.
+    # The storage engine keeps it in sync on every write, under its own lock
+    # for that user. A user's replica is built from the full history the first
+    # time it is read and only appended to after that.
+
+    def __init__(self, replica_dir, platforms, categories):
+        self.replica_dir = replica_dir
+        self.platforms = list(platforms)
+        self.categories = list(categories)
+        self._platform_codes = {name: i + 1 for i, name in enumerate(self.platforms)}
+        self._category_codes = {name: i + 1 for i, name in enumerate(self.categories)}
+        if not os.path.exists(replica_dir):
+            os.makedirs(replica_dir)
+
+    def user_dir(self, username):
+        # Named by a hash, so no username can point outside replica_dir
+        user_key = hashlib.sha256(username.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.replica_dir, user_key)
+
+    def _column_file(self, username, column):
+        return os.path.join(self.user_dir(username), column + ".bin")
+
+    def _meta_file(self, username):
+        return os.path.join(self.user_dir(username), "meta.json")
+
+    def has(self, username):
+        return os.path.exists(self._meta_file(username))
+
+    def _encode(self, transactions):
+        rows = {column: [] for column in COLUMNS}
+        for t in transactions:
+            flags = 0
+            if t.get("is_game_purchase", False):
+                flags |= FLAG_GAME
+            if t.get("approved_by_parent", True):
+                flags |= FLAG_APPROVED
+            rows["key"].append(transaction_key(t.get("id")))
+            rows["amount"].append(round(float(t.get("amount", 0)) * 100))
+            rows["day"].append(epoch_day(t.get("date", "1970-01-01")))
+            rows["platform"].append(self._platform_codes.get(t.get("game_platform"), 0))
+            rows["category"].append(self._category_codes.get(t.get("game_category"), 0))
+            rows["flags"].append(flags)
+        return {column: np.array(values, dtype=COLUMNS[column]) for column, values in rows.items()}
+
+    # Writes (the storage engine holds the user's lock)
+
+    def rebuild(self, username, transactions):
+        # Rewrites the user's columns from the full history. The meta file is
+        # written last, so a half-written replica is never treated as built.
+        user_dir = self.user_dir(username)
+        if os.path.dirname(os.path.realpath(user_dir)) != os.path.realpath(self.replica_dir):
+            raise ValueError(f"Replica directory outside {self.replica_dir}: {user_dir}")
+        tmp_dir = f"{user_dir}.{os.getpid()}.tmp"
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        encoded = self._encode(transactions)
+        for column, values in encoded.items():
+            values.tofile(os.path.join(tmp_dir, column + ".bin"))
+        with open(os.path.join(tmp_dir, "meta.json"), 'w') as f:
+            json.dump({"platforms": self.platforms, "categories": self.categories}, f)
+        if os.path.exists(user_dir):
+            shutil.rmtree(user_dir)
+        os.replace(tmp_dir, user_dir)
+
+    def append(self, username, transactions):
+        if not self.has(username):
+            return
+        for column, values in self._encode(transactions).items():
+            with open(self._column_file(username, column), 'ab') as f:
+                values.tofile(f)
+
+    def _set_flag(self, username, transaction_id, flag):
+        if not self.has(username):
+            return
+        keys = self._map(username, "key")
+        flags = np.memmap(self._column_file(username, "flags"), dtype=np.uint8, mode='r+')
+        rows = np.flatnonzero((keys == transaction_key(transaction_id)) & ((flags & FLAG_DELETED) == 0))
+        flags[rows] |= flag
+        flags.flush()
+
+    def approve(self, username, transaction_id):
+        self._set_flag(username, transaction_id, FLAG_APPROVED)
+
+    def remove(self, username, transaction_id):
+        self._set_flag(username, transaction_id, FLAG_DELETED)
+
+    # Reads
+
+    def _map(self, username, column):
+        path = self._column_file(username, column)
+        if os.path.getsize(path) == 0:
+            return np.empty(0, dtype=COLUMNS[column])
+        return np.memmap(path, dtype=COLUMNS[column], mode='r')
+
+    def load(self, username):
+        # Memory-mapped live rows of the user's columns, or None if the replica
+        # has not been built (or an append was cut short and it needs rebuilding)
+        if not self.has(username):
+            return None
+        try:
+            columns = {column: self._map(username, column) for column in COLUMNS}
+        except FileNotFoundError:
+            return None
+        if len({len(values) for values in columns.values()}) != 1:
+            return None
+        live = (columns["flags"] & FLAG_DELETED) == 0
+        if live.all():
+            return columns
+        return {column: values[live] for column, values in columns.items()}
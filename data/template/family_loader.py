@@ -0,0 +1,47 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+
+class FamilyLoader:
+    # Loads one document per family member (profile, history, ...) on a
+    # bounded thread pool, so a family view waits for its slowest member
+    # rather than for the sum of them. load() has a deadline: members still
+    # loading when it passes are reported as missing and the caller renders
+    # what arrived. Their loads finish in the background and warm the storage
+    # caches for the next request.
+
+    def __init__(self, max_workers=8, deadline=0.5):
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self._pool = None
+        self._pool_pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        # Pools must not cross a fork, so one is started per worker pid
+        with self._lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="family-loader")
+                self._pool_pid = os.getpid()
+            return self._pool
+
+    def load(self, load, usernames, deadline=None):
+        # ({username: load(username)} for the members loaded within the
+        # deadline (seconds, default self.deadline), [usernames still loading]).
+        # An exception raised by load() is raised here.
+        usernames = list(dict.fromkeys(usernames))
+        if not usernames:
+            return {}, []
+        futures = {username: self._executor().submit(load, username) for username in usernames}
+        wait(futures.values(), timeout=self.deadline if deadline is None else deadline)
+        results = {username: future.result() for username, future in futures.items() if future.done()}
+        return results, [username for username in usernames if username not in results]
+
+    def load_all(self, load, usernames):
+        # {username: load(username)} for every member, however long it takes
+        usernames = list(dict.fromkeys(usernames))
+        if not usernames:
+            return {}
+        futures = {username: self._executor().submit(load, username) for username in usernames}
+        return {username: future.result() for username, future in futures.items()}
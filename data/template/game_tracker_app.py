@@ -1,9 +1,28 @@
-from flask import Flask, render_template_string, request, redirect, url_for, flash, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, make_response
 import os
-import json
 import datetime
 import uuid
+import json
+import base64
+import hashlib
+import math
+import time
+import queue
+import click
+from jinja2 import DictLoader, FileSystemBytecodeCache
+from markupsafe import Markup
 from werkzeug.security import generate_password_hash, check_password_hash
+from storage import get_storage, game_limits, approver_for
+from user_registry import UserRegistry, valid_username
+from user_cache import UserDocumentCache
+from columnar_store import ColumnarReplica
+from analytics import game_spending_frame, game_spending_summary, chart_series
+from charts import ChartRenderer, CHART_KINDS
+from search_index import SearchIndex
+from transaction_export import EXPORT_FORMATS, format_available, export_chunks
+from transaction_import import CsvImporter
+from notifications import EventBroker, sse_message
+from family_loader import FamilyLoader
 
 app = Flask(__name__)
 app.secret_key = "gamespendingtrackersecretkey"  # For session and flash messages
@@ -13,7 +32,10 @@ DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 if not os.path.exists(DATA_DIR):
     os.makedirs(DATA_DIR)
 
+# Account registry (sharded, one file per user); users.json is imported once if present
+USERS_DIR = os.path.join(DATA_DIR, "users")
 USERS_FILE = os.path.join(DATA_DIR, "users.json")
+registry = UserRegistry(USERS_DIR, legacy_file=USERS_FILE)
 
 # Game categories and platforms
 GAME_CATEGORIES = [
@@ -27,44 +49,69 @@ GAME_PLATFORMS = [
     "Xbox", "Nintendo Switch", "App Store", "Google Play", "Other"
 ]
 
-# Helper functions
-def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r') as f:
-            return json.load(f)
-    return {}
+# Storage engine for profiles and transactions: "json" (one file per user) or "sqlite"
+STORAGE_ENGINE = os.environ.get("STORAGE_ENGINE", "json")
+SQLITE_DB_FILE = os.environ.get("SQLITE_DB_FILE", os.path.join(DATA_DIR, "game_tracker.db"))
+
+# Parsed user documents cached in memory (JSON engine). "stat" validation is safe
+# with several worker processes, "version" skips the stat calls for a single worker.
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", 256))
+USER_CACHE_VALIDATION = os.environ.get("USER_CACHE_VALIDATION", "stat")
+
+# Rendered dashboard blocks, each kept until the inputs it was rendered from change
+FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 1024))
+fragment_cache = UserDocumentCache(FRAGMENT_CACHE_SIZE)
+
+# Columnar, memory-mapped copy of every transaction history for analytics,
+# kept in sync by the storage engine on every write
+COLUMNS_DIR = os.path.join(DATA_DIR, "columns")
+column_replica = ColumnarReplica(COLUMNS_DIR, GAME_PLATFORMS, GAME_CATEGORIES)
+
+# Analytics charts are drawn in the browser from the /api/charts series
+# ("browser"), or rendered in background processes into static/charts/ ("server")
+CHART_RENDERING = os.environ.get("CHART_RENDERING", "browser")
+CHART_DIR = os.path.join(app.static_folder, "charts")
+CHART_WORKERS = int(os.environ.get("CHART_WORKERS", 2))
+chart_renderer = ChartRenderer(CHART_DIR, max_workers=CHART_WORKERS)
+
+# Per-family full-text index over purchase descriptions, updated on every write
+SEARCH_DIR = os.path.join(DATA_DIR, "search")
+search_index = SearchIndex(SEARCH_DIR)
 
-def save_users(users):
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+# Family views load their members' documents concurrently. A member not loaded
+# within FAMILY_LOAD_DEADLINE seconds is left out of that page (shown by
+# username) rather than holding it up.
+FAMILY_LOAD_WORKERS = int(os.environ.get("FAMILY_LOAD_WORKERS", 8))
+FAMILY_LOAD_DEADLINE = float(os.environ.get("FAMILY_LOAD_DEADLINE", 0.5))
+family_loader = FamilyLoader(FAMILY_LOAD_WORKERS, FAMILY_LOAD_DEADLINE)
 
-def get_user_file(username):
-    return os.path.join(DATA_DIR, f"{username}_data.json")
+store = get_storage(
+    STORAGE_ENGINE, DATA_DIR,
+    db_file=SQLITE_DB_FILE,
+    cache_size=USER_CACHE_SIZE,
+    cache_validation=USER_CACHE_VALIDATION,
+    replica=column_replica,
+    search=search_index,
+    loader=family_loader
+)
 
+# Store CSV exports imported as purchase history
+csv_importer = CsvImporter(GAME_PLATFORMS, GAME_CATEGORIES)
+
+# Live approval notifications for parents (Server-Sent Events). Writes publish
+# to the approving parent's channel; streams also check the family version
+# every SSE_HEARTBEAT seconds to catch writes made by other worker processes,
+# and close after SSE_MAX_SECONDS so the browser reconnects.
+SSE_HEARTBEAT = int(os.environ.get("SSE_HEARTBEAT", 15))
+SSE_MAX_SECONDS = int(os.environ.get("SSE_MAX_SECONDS", 300))
+notifier = EventBroker()
+
+# Helper functions
 def load_user_data(username):
-    user_file = get_user_file(username)
-    if os.path.exists(user_file):
-        with open(user_file, 'r') as f:
-            return json.load(f)
-    return {
-        "profile": {
-            "name": "",
-            "account_balance": 0,
-            "monthly_budget": 0,
-            "parent_email": "",
-            "parent_mode": False,
-            "game_spending_limit": 0,
-            "child_name": "",
-            "is_child_account": False,
-            "parent_account": ""
-        },
-        "transactions": []
-    }
+    return store.load_user_data(username)
 
 def save_user_data(username, data):
-    user_file = get_user_file(username)
-    with open(user_file, 'w') as f:
-        json.dump(data, f, indent=4)
+    store.save_user_data(username, data)
 
 def get_gaming_tip():
     tips = [
@@ -83,6 +130,157 @@ def get_gaming_tip():
     import random
     return random.choice(tips)
 
+def child_accounts_of(profile):
+    # [{"username", "name"}] for a parent's children, profiles loaded in
+    # parallel; children whose profile misses the deadline show their username
+    children = profile.get("child_accounts", [])
+    profiles, _ = family_loader.load(store.load_profile, children)
+    return [
+        {"username": child, "name": profiles.get(child, {}).get("name") or child}
+        for child in children
+    ]
+
+# Transaction history paging
+HISTORY_PAGE_SIZE = 25
+HISTORY_MAX_PAGE_SIZE = 100
+HISTORY_FILTERS = ["platform", "category", "status", "date_from", "date_to"]
+
+def encode_cursor(key):
+    # Opaque, URL-safe form of a (date, id) history position
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor):
+    # Raises ValueError for anything encode_cursor did not produce
+    try:
+        date, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    return str(date), str(transaction_id)
+
+def history_filters_from(args):
+    # Raises ValueError for malformed dates or statuses
+    filters = {name: args.get(name) for name in HISTORY_FILTERS if args.get(name)}
+    for name in ["date_from", "date_to"]:
+        if name in filters:
+            datetime.date.fromisoformat(filters[name])
+    if filters.get("status") not in (None, "approved", "pending"):
+        raise ValueError("Status must be 'approved' or 'pending'")
+    return filters
+
+# JSON API (/api/v1)
+API_MAX_BATCH = int(os.environ.get("API_MAX_BATCH", 10000))
+
+def api_username():
+    # The session's user, or HTTP Basic credentials for integrations that keep no session
+    if 'username' in session:
+        return session['username']
+    auth = request.authorization
+    if auth is not None and auth.type == "basic":
+        user = registry.get(auth.username)
+        if user is not None and check_password_hash(user["password_hash"], auth.password or ""):
+            return auth.username
+    return None
+
+def purchase_from_json(item):
+    # A new game purchase from one API item; raises ValueError for the first bad field
+    if not isinstance(item, dict):
+        raise ValueError("Each transaction must be an object")
+    amount = item.get("amount")
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount) or amount <= 0:
+        raise ValueError("amount must be a number greater than 0")
+    description = item.get("description")
+    if not isinstance(description, str) or not description.strip():
+        raise ValueError("description is required")
+    if item.get("game_platform") not in GAME_PLATFORMS:
+        raise ValueError(f"Unknown game_platform: {item.get('game_platform')!r}")
+    if item.get("game_category") not in GAME_CATEGORIES:
+        raise ValueError(f"Unknown game_category: {item.get('game_category')!r}")
+    date = datetime.datetime.now()
+    if item.get("date") is not None:
+        try:
+            date = datetime.datetime.fromisoformat(item["date"])
+        except (TypeError, ValueError):
+            raise ValueError("date must be an ISO 8601 date or date and time")
+        if date.tzinfo is not None:
+            date = date.astimezone().replace(tzinfo=None)
+        if date > datetime.datetime.now():
+            raise ValueError("date cannot be in the future")
+    return {
+        "id": str(uuid.uuid4()),
+        "date": date.isoformat(),
+        "amount": float(amount),
+        "description": description,
+        "game_platform": item["game_platform"],
+        "game_category": item["game_category"],
+        "is_game_purchase": True,
+        "approved_by_parent": True
+    }
+
+def apply_decisions(parent_username, parent_profile, decisions):
+    # Approve/deny decisions [(username, transaction_id, action)] made by a
+    # parent, grouped by account so each one is loaded and written once.
+    # Returns one result per decision, in order; accounts other than the
+    # parent's own and their children's are "forbidden".
+    allowed = {parent_username, *parent_profile.get("child_accounts", [])}
+    groups = {}
+    for username, transaction_id, action in decisions:
+        if username in allowed:
+            groups.setdefault(username, []).append((transaction_id, action))
+    outcomes = {username: store.decide_transactions(username, group) for username, group in groups.items()}
+    if groups:
+        notifier.publish(parent_username, "changed")
+    return [
+        {
+            "username": username, "transaction_id": transaction_id, "action": action,
+            "status": outcomes[username][transaction_id] if username in allowed else "forbidden"
+        }
+        for username, transaction_id, action in decisions
+    ]
+
+# Conditional GETs for pages built from one user's (and their family's) data
+def page_validators(username, page, *extra):
+    # (ETag, Last-Modified) from version numbers alone, so an unchanged page is
+    # answered before anything else is read. A render that shows flashed
+    # messages must not be reused, so it gets no validators.
+    if session.get('_flashes'):
+        return None, None
+    versions = store.version_info(username)
+    key = ":".join(str(part) for part in [page, username, versions["user"], versions["family"], *extra])
+    etag = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+    last_modified = None
+    if versions["modified"]:
+        last_modified = datetime.datetime.fromtimestamp(
+            int(versions["modified"]), tz=datetime.timezone.utc
+        )
+    return etag, last_modified
+
+def not_modified(etag, last_modified):
+    if etag is None:
+        return False
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return bool(last_modified and request.if_modified_since and last_modified <= request.if_modified_since)
+
+def with_validators(response, etag, last_modified):
+    if etag is not None:
+        response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+# Page fragments
+def cached_fragment(template, owner, inputs, load=None):
+    # One rendered block of a page, cached per (template, owner). The inputs
+    # are both the cache key and the template context; load() supplies the
+    # context that is costly to build and is only called to re-render.
+    signature = tuple(sorted(inputs.items()))
+    html = fragment_cache.get((template, owner), signature)
+    if html is None:
+        html = Markup(render_template(template, **inputs, **(load() if load else {})))
+        fragment_cache.put((template, owner), signature, html)
+    return html
+
 # Add sample data for demonstration
 def add_sample_data(username):
     user_data = load_user_data(username)
@@ -306,6 +504,21 @@ base_template = '''
                             <i class="fas fa-coins me-1"></i>Record Spending
                         </a>
                     </li>
+                    <li class="nav-item">
+                        <a class="nav-link" href="{{ url_for('history') }}">
+                            <i class="fas fa-history me-1"></i>History
+                        </a>
+                    </li>
+                    <li class="nav-item">
+                        <a class="nav-link" href="{{ url_for('search') }}">
+                            <i class="fas fa-search me-1"></i>Search
+                        </a>
+                    </li>
+                    <li class="nav-item">
+                        <a class="nav-link" href="{{ url_for('game_analytics') }}">
+                            <i class="fas fa-chart-pie me-1"></i>Analytics
+                        </a>
+                    </li>
                     <li class="nav-item">
                         <a class="nav-link" href="{{ url_for('profile') }}">
                             <i class="fas fa-user-cog me-1"></i>Profile
@@ -315,6 +528,7 @@ base_template = '''
                     <li class="nav-item">
                         <a class="nav-link" href="{{ url_for('parent_approval') }}">
                             <i class="fas fa-check-circle me-1"></i>Approvals
+                            <span id="pending-badge" class="badge bg-danger d-none"></span>
                         </a>
                     </li>
                     {% endif %}
@@ -356,6 +570,7 @@ base_template = '''
                 {% endfor %}
             {% endif %}
         {% endwith %}
+        <div id="live-alerts"></div>
 
         <!-- Page Content -->
         {% block content %}{% endblock %}
@@ -372,6 +587,44 @@ base_template = '''
 
     <!-- Bootstrap JS Bundle -->
     <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js"></script>
+    {% block scripts %}{% endblock %}
+    {% if session.account_type == 'parent' %}
+    <!-- Live approval notifications -->
+    <script>
+        (function () {
+            if (!window.EventSource) return;
+            var badge = document.getElementById("pending-badge");
+            var alerts = document.getElementById("live-alerts");
+            var source = new EventSource({{ url_for('pending_events')|tojson }});
+            function showCount(count) {
+                badge.textContent = count;
+                badge.classList.toggle("d-none", !count);
+            }
+            source.addEventListener("count", function (e) {
+                showCount(JSON.parse(e.data).pending_count);
+            });
+            source.addEventListener("pending", function (e) {
+                var data = JSON.parse(e.data);
+                showCount(data.pending_count);
+                var alert = document.createElement("div");
+                alert.className = "alert alert-info alert-dismissible";
+                alert.textContent = data.name + " wants to buy " + data.description +
+                    " (" + data.game_platform + ", \u20b9" + data.amount.toFixed(2) + "). ";
+                var link = document.createElement("a");
+                link.href = {{ url_for('parent_approval')|tojson }};
+                link.className = "alert-link";
+                link.textContent = "Review";
+                alert.appendChild(link);
+                var close = document.createElement("button");
+                close.type = "button";
+                close.className = "btn-close";
+                close.setAttribute("data-bs-dismiss", "alert");
+                alert.appendChild(close);
+                alerts.prepend(alert);
+            });
+        })();
+    </script>
+    {% endif %}
 </body>
 </html>
 '''
@@ -583,6 +836,26 @@ dashboard_template = '''
 </div>
 
 <!-- Stats Overview -->
+{{ stats_fragment }}
+
+<!-- Budget Progress -->
+{{ budget_fragment }}
+
+<!-- Main Dashboard Content -->
+<div class="row">
+    <!-- Transactions Column -->
+    <div class="col-md-12">
+        {{ recent_fragment }}
+
+        <!-- Gaming Tip -->
+        {{ tip_fragment }}
+    </div>
+</div>
+{% endblock %}
+'''
+
+# Dashboard blocks, rendered and cached one by one (see cached_fragment)
+dashboard_stats_fragment = '''
 <div class="row mb-4">
     <div class="col-md-3">
         <div class="card stats-card">
@@ -613,8 +886,9 @@ dashboard_template = '''
         </div>
     </div>
 </div>
+'''
 
-<!-- Budget Progress -->
+dashboard_budget_fragment = '''
 <div class="row mb-4">
     <div class="col-12">
         <div class="card">
@@ -622,7 +896,7 @@ dashboard_template = '''
                 <h5 class="card-title">Monthly Budget</h5>
                 <div class="d-flex justify-content-between mb-1">
                     <span>₹{{ "%.2f"|format(monthly_spent) }} spent</span>
-                    <span>₹{{ "%.2f"|format(profile.monthly_budget) }} budget</span>
+                    <span>₹{{ "%.2f"|format(monthly_budget) }} budget</span>
                 </div>
                 <div class="progress budget-progress">
                     <div class="progress-bar {% if budget_percent > 80 %}bg-danger{% elif budget_percent > 60 %}bg-warning{% else %}bg-success{% endif %}" 
@@ -639,73 +913,74 @@ dashboard_template = '''
         </div>
     </div>
 </div>
+'''
 
-<!-- Main Dashboard Content -->
-<div class="row">
-    <!-- Transactions Column -->
-    <div class="col-md-12">
-        <div class="card mb-4">
-            <div class="card-header d-flex justify-content-between align-items-center">
-                <h5 class="mb-0">Recent Transactions</h5>
-                <a href="{{ url_for('game_spending') }}" class="btn btn-sm btn-primary">
-                    <i class="fas fa-plus me-1"></i>Add
-                </a>
-            </div>
-            <div class="card-body p-0">
-                {% if transactions %}
-                <div class="table-responsive">
-                    <table class="table table-hover mb-0">
-                        <thead class="table-light">
-                            <tr>
-                                <th>Date</th>
-                                <th>Description</th>
-                                <th>Platform</th>
-                                <th>Category</th>
-                                <th>Amount</th>
-                                <th>Status</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            {% for transaction in transactions %}
-                            <tr>
-                                <td>{{ transaction.date.split('T')[0] }}</td>
-                                <td>{{ transaction.description }}</td>
-                                <td>{{ transaction.game_platform }}</td>
-                                <td>{{ transaction.game_category }}</td>
-                                <td class="fw-bold">₹{{ "%.2f"|format(transaction.amount) }}</td>
-                                <td>
-                                    {% if transaction.approved_by_parent %}
-                                    <span class="badge bg-success">Approved</span>
-                                    {% else %}
-                                    <span class="badge bg-warning">Pending</span>
-                                    {% endif %}
-                                </td>
-                            </tr>
-                            {% endfor %}
-                        </tbody>
-                    </table>
-                </div>
-                {% else %}
-                <div class="p-4 text-center">
-                    <p class="text-muted">No transactions yet</p>
-                    <a href="{{ url_for('game_spending') }}" class="btn btn-sm btn-primary">
-                        <i class="fas fa-plus me-1"></i>Add First Transaction
-                    </a>
-                </div>
-                {% endif %}
-            </div>
+dashboard_recent_fragment = '''
+<div class="card mb-4">
+    <div class="card-header d-flex justify-content-between align-items-center">
+        <h5 class="mb-0">Recent Transactions</h5>
+        <div>
+            <a href="{{ url_for('history') }}" class="btn btn-sm btn-outline-primary">
+                <i class="fas fa-history me-1"></i>View All
+            </a>
+            <a href="{{ url_for('game_spending') }}" class="btn btn-sm btn-primary">
+                <i class="fas fa-plus me-1"></i>Add
+            </a>
         </div>
-
-        <!-- Gaming Tip -->
-        <div class="card tip-card">
-            <div class="card-body">
-                <h5 class="card-title"><i class="fas fa-lightbulb me-2 text-warning"></i>Gaming Tip</h5>
-                <p class="card-text">{{ gaming_tip }}</p>
-            </div>
+    </div>
+    <div class="card-body p-0">
+        {% if transactions %}
+        <div class="table-responsive">
+            <table class="table table-hover mb-0">
+                <thead class="table-light">
+                    <tr>
+                        <th>Date</th>
+                        <th>Description</th>
+                        <th>Platform</th>
+                        <th>Category</th>
+                        <th>Amount</th>
+                        <th>Status</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {% for transaction in transactions %}
+                    <tr>
+                        <td>{{ transaction.date.split('T')[0] }}</td>
+                        <td>{{ transaction.description }}</td>
+                        <td>{{ transaction.game_platform }}</td>
+                        <td>{{ transaction.game_category }}</td>
+                        <td class="fw-bold">₹{{ "%.2f"|format(transaction.amount) }}</td>
+                        <td>
+                            {% if transaction.approved_by_parent %}
+                            <span class="badge bg-success">Approved</span>
+                            {% else %}
+                            <span class="badge bg-warning">Pending</span>
+                            {% endif %}
+                        </td>
+                    </tr>
+                    {% endfor %}
+                </tbody>
+            </table>
         </div>
+        {% else %}
+        <div class="p-4 text-center">
+            <p class="text-muted">No transactions yet</p>
+            <a href="{{ url_for('game_spending') }}" class="btn btn-sm btn-primary">
+                <i class="fas fa-plus me-1"></i>Add First Transaction
+            </a>
+        </div>
+        {% endif %}
+    </div>
+</div>
+'''
+
+dashboard_tip_fragment = '''
+<div class="card tip-card">
+    <div class="card-body">
+        <h5 class="card-title"><i class="fas fa-lightbulb me-2 text-warning"></i>Gaming Tip</h5>
+        <p class="card-text">{{ gaming_tip }}</p>
     </div>
 </div>
-{% endblock %}
 '''
 
 game_spending_template = '''
@@ -784,6 +1059,495 @@ game_spending_template = '''
 {% endblock %}
 '''
 
+game_analytics_template = '''
+{% extends "base_template" %}
+
+{% block title %}Game Analytics - Game Spending Tracker{% endblock %}
+
+{% block content %}
+<div class="row mb-4">
+    <div class="col">
+        <h2>
+            {% if viewing_child %}
+            <i class="fas fa-chart-pie me-2"></i>{{ viewing_name }} Game Analytics
+            {% else %}
+            <i class="fas fa-chart-pie me-2"></i>Game Analytics
+            {% endif %}
+        </h2>
+        <p class="text-muted">Understand your game spending patterns</p>
+    </div>
+
+    {% if child_accounts %}
+    <div class="col-md-4">
+        <div class="card">
+            <div class="card-header">
+                <h5 class="mb-0">View Child Account</h5>
+            </div>
+            <div class="card-body">
+                <form method="GET" action="{{ url_for('game_analytics') }}">
+                    <div class="input-group">
+                        <select class="form-select" name="child">
+                            <option value="">Your Account</option>
+                            {% for child in child_accounts %}
+                            <option value="{{ child.username }}" {% if request.args.get('child') == child.username %}selected{% endif %}>
+                                {{ child.name }}
+                            </option>
+                            {% endfor %}
+                        </select>
+                        <button class="btn btn-primary" type="submit">View</button>
+                    </div>
+                </form>
+            </div>
+        </div>
+    </div>
+    {% endif %}
+</div>
+
+<!-- Statistics Overview -->
+<div class="row mb-4">
+    <div class="col-md-3">
+        <div class="card stats-card">
+            <i class="fas fa-money-bill-wave"></i>
+            <div class="stats-title">Total Game Spending</div>
+            <div class="stats-value">₹{{ "%.2f"|format(total_game_spent) }}</div>
+        </div>
+    </div>
+    <div class="col-md-3">
+        <div class="card stats-card">
+            <i class="fas fa-shopping-cart"></i>
+            <div class="stats-title">Purchases</div>
+            <div class="stats-value">{{ game_transaction_count }}</div>
+        </div>
+    </div>
+    <div class="col-md-3">
+        <div class="card stats-card">
+            <i class="fas fa-tags"></i>
+            <div class="stats-title">Average Purchase</div>
+            <div class="stats-value">₹{{ "%.2f"|format(avg_transaction) }}</div>
+        </div>
+    </div>
+    <div class="col-md-3">
+        <div class="card stats-card">
+            <i class="fas fa-ban"></i>
+            <div class="stats-title">Spending Limit</div>
+            <div class="stats-value">₹{{ "%.2f"|format(game_limit) }}</div>
+        </div>
+    </div>
+</div>
+
+<!-- Charts Row -->
+<div class="row mb-4">
+    {% if 'time' in browser_charts or charts.time %}
+    <div class="col-12 mb-4">
+        <div class="card">
+            <div class="card-header">
+                <h5 class="mb-0">Spending Over Time</h5>
+            </div>
+            <div class="card-body text-center">
+                {% if 'time' in browser_charts %}
+                <canvas data-chart-url="{{ url_for('chart_data', kind='time', child=request.args.get('child') or None) }}" data-chart-kind="time" height="80"></canvas>
+                {% else %}
+                <img src="{{ url_for('static', filename='charts/' + charts.time) }}" class="img-fluid" alt="Time Chart">
+                {% endif %}
+            </div>
+        </div>
+    </div>
+    {% endif %}
+    
+    <div class="col-md-6 mb-4">
+        <div class="card h-100">
+            <div class="card-header">
+                <h5 class="mb-0">Spending by Category</h5>
+            </div>
+            <div class="card-body">
+                {% if 'category' in browser_charts %}
+                <div class="text-center mb-3">
+                    <canvas data-chart-url="{{ url_for('chart_data', kind='category', child=request.args.get('child') or None) }}" data-chart-kind="category"></canvas>
+                </div>
+                {% elif charts.category %}
+                <div class="text-center mb-3">
+                    <img src="{{ url_for('static', filename='charts/' + charts.category) }}" class="img-fluid" alt="Category Chart">
+                </div>
+                {% endif %}
+                
+                {% if category_data %}
+                <div class="table-responsive">
+                    <table class="table table-sm">
+                        <thead>
+                            <tr>
+                                <th>Category</th>
+                                <th>Amount</th>
+                                <th>%</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                            {% for category, data in category_data.items() %}
+                            <tr>
+                                <td>{{ category }}</td>
+                                <td>₹{{ "%.2f"|format(data.amount) }}</td>
+                                <td>{{ "%.1f"|format(data.percentage) }}%</td>
+                            </tr>
+                            {% endfor %}
+                        </tbody>
+                    </table>
+                </div>
+                {% else %}
+                <p class="text-center text-muted">No category data available</p>
+                {% endif %}
+            </div>
+        </div>
+    </div>
+    
+    <div class="col-md-6 mb-4">
+        <div class="card h-100">
+            <div class="card-header">
+                <h5 class="mb-0">Spending by Platform</h5>
+            </div>
+            <div class="card-body">
+                {% if 'platform' in browser_charts %}
+                <div class="text-center mb-3">
+                    <canvas data-chart-url="{{ url_for('chart_data', kind='platform', child=request.args.get('child') or None) }}" data-chart-kind="platform"></canvas>
+                </div>
+                {% elif charts.platform %}
+                <div class="text-center mb-3">
+                    <img src="{{ url_for('static', filename='charts/' + charts.platform) }}" class="img-fluid" alt="Platform Chart">
+                </div>
+                {% endif %}
+                
+                {% if platform_data %}
+                <div class="table-responsive">
+                    <table class="table table-sm">
+                        <thead>
+                            <tr>
+                                <th>Platform</th>
+                                <th>Amount</th>
+                                <th>%</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                            {% for platform, data in platform_data.items() %}
+                            <tr>
+                                <td>{{ platform }}</td>
+                                <td>₹{{ "%.2f"|format(data.amount) }}</td>
+                                <td>{{ "%.1f"|format(data.percentage) }}%</td>
+                            </tr>
+                            {% endfor %}
+                        </tbody>
+                    </table>
+                </div>
+                {% else %}
+                <p class="text-center text-muted">No platform data available</p>
+                {% endif %}
+            </div>
+        </div>
+    </div>
+</div>
+
+<!-- Monthly Trend -->
+{% if monthly_trend %}
+<div class="row">
+    <div class="col-12">
+        <div class="card">
+            <div class="card-header">
+                <h5 class="mb-0">Monthly Spending Trends</h5>
+            </div>
+            <div class="card-body">
+                <div class="table-responsive">
+                    <table class="table">
+                        <thead>
+                            <tr>
+                                <th>Month</th>
+                                <th>Total Spent</th>
+                            </tr>
+                        </thead>
+                        <tbody>
+                            {% for month, amount in monthly_trend.items() %}
+                            <tr>
+                                <td>{{ month }}</td>
+                                <td>₹{{ "%.2f"|format(amount) }}</td>
+                            </tr>
+                            {% endfor %}
+                        </tbody>
+                    </table>
+                </div>
+            </div>
+        </div>
+    </div>
+</div>
+{% endif %}
+{% endblock %}
+
+{% block scripts %}
+{% if browser_charts %}
+<script src="https://cdn.jsdelivr.net/npm/chart.js@3.9.1/dist/chart.min.js"></script>
+<script>
+    // Each chart's series comes from /api/charts; the browser revalidates it
+    // with its ETag, so an unchanged series is a 304 from then on
+    document.querySelectorAll("canvas[data-chart-url]").forEach(function (canvas) {
+        fetch(canvas.dataset.chartUrl, {credentials: "same-origin"})
+            .then(function (response) { return response.ok ? response.json() : null; })
+            .then(function (series) {
+                if (!series || !series.labels.length) {
+                    canvas.parentElement.classList.add("d-none");
+                    return;
+                }
+                var time = canvas.dataset.chartKind === "time";
+                new Chart(canvas, {
+                    type: time ? "line" : "bar",
+                    data: {
+                        labels: series.labels,
+                        datasets: [{label: "Amount (\u20b9)", data: series.values, backgroundColor: "#0d6efd", borderColor: "#0d6efd"}]
+                    },
+                    options: {indexAxis: time ? "x" : "y", plugins: {legend: {display: false}}}
+                });
+            });
+    });
+</script>
+{% endif %}
+{% endblock %}
+'''
+
+history_template = '''
+{% extends "base_template" %}
+
+{% block title %}Transaction History - Game Spending Tracker{% endblock %}
+
+{% block content %}
+<div class="row mb-4">
+    <div class="col">
+        <h2><i class="fas fa-history me-2"></i>{% if viewing_child %}{{ viewing_name }} {% endif %}Transaction History</h2>
+        <p class="text-muted">Every purchase, newest first</p>
+    </div>
+    <div class="col-md-5 text-end">
+        <div class="btn-group">
+            {% for export_format in export_formats %}
+            <a href="{{ url_for('export_transactions', format=export_format, child=filters.child) }}" class="btn btn-sm btn-outline-primary">
+                <i class="fas fa-download me-1"></i>{{ export_format|upper }}
+            </a>
+            {% endfor %}
+        </div>
+        {% if child_accounts %}
+        <a href="{{ url_for('export_transactions', format='csv', scope='family') }}" class="btn btn-sm btn-outline-secondary ms-1">
+            <i class="fas fa-users me-1"></i>Family CSV
+        </a>
+        {% endif %}
+    </div>
+</div>
+
+<!-- Filters -->
+<div class="card mb-4">
+    <div class="card-body">
+        <form method="GET" action="{{ url_for('history') }}" class="row g-2 align-items-end">
+            {% if child_accounts %}
+            <div class="col-md-2">
+                <label for="child" class="form-label">Account</label>
+                <select class="form-select" id="child" name="child">
+                    <option value="">Your Account</option>
+                    {% for child in child_accounts %}
+                    <option value="{{ child.username }}" {% if filters.child == child.username %}selected{% endif %}>{{ child.name }}</option>
+                    {% endfor %}
+                </select>
+            </div>
+            {% endif %}
+            <div class="col-md-2">
+                <label for="platform" class="form-label">Platform</label>
+                <select class="form-select" id="platform" name="platform">
+                    <option value="">All</option>
+                    {% for platform in game_platforms %}
+                    <option value="{{ platform }}" {% if filters.platform == platform %}selected{% endif %}>{{ platform }}</option>
+                    {% endfor %}
+                </select>
+            </div>
+            <div class="col-md-2">
+                <label for="category" class="form-label">Category</label>
+                <select class="form-select" id="category" name="category">
+                    <option value="">All</option>
+                    {% for category in game_categories %}
+                    <option value="{{ category }}" {% if filters.category == category %}selected{% endif %}>{{ category }}</option>
+                    {% endfor %}
+                </select>
+            </div>
+            <div class="col-md-2">
+                <label for="status" class="form-label">Status</label>
+                <select class="form-select" id="status" name="status">
+                    <option value="">All</option>
+                    <option value="approved" {% if filters.status == 'approved' %}selected{% endif %}>Approved</option>
+                    <option value="pending" {% if filters.status == 'pending' %}selected{% endif %}>Pending</option>
+                </select>
+            </div>
+            <div class="col-md-2">
+                <label for="date_from" class="form-label">From</label>
+                <input type="date" class="form-control" id="date_from" name="date_from" value="{{ filters.date_from or '' }}">
+            </div>
+            <div class="col-md-2">
+                <label for="date_to" class="form-label">To</label>
+                <input type="date" class="form-control" id="date_to" name="date_to" value="{{ filters.date_to or '' }}">
+            </div>
+            <div class="col-12 text-end">
+                <a href="{{ url_for('history') }}" class="btn btn-outline-secondary">Clear</a>
+                <button type="submit" class="btn btn-primary"><i class="fas fa-filter me-1"></i>Filter</button>
+            </div>
+        </form>
+    </div>
+</div>
+
+<div class="card">
+    <div class="card-body p-0">
+        {% if transactions %}
+        <div class="table-responsive">
+            <table class="table table-hover mb-0">
+                <thead class="table-light">
+                    <tr>
+                        <th>Date</th>
+                        <th>Description</th>
+                        <th>Platform</th>
+                        <th>Category</th>
+                        <th>Amount</th>
+                        <th>Status</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {% for transaction in transactions %}
+                    <tr>
+                        <td>{{ transaction.date.split('T')[0] }}</td>
+                        <td>{{ transaction.description }}</td>
+                        <td>{{ transaction.game_platform }}</td>
+                        <td>{{ transaction.game_category }}</td>
+                        <td class="fw-bold">₹{{ "%.2f"|format(transaction.amount) }}</td>
+                        <td>
+                            {% if transaction.approved_by_parent %}
+                            <span class="badge bg-success">Approved</span>
+                            {% else %}
+                            <span class="badge bg-warning">Pending</span>
+                            {% endif %}
+                        </td>
+                    </tr>
+                    {% endfor %}
+                </tbody>
+            </table>
+        </div>
+        {% else %}
+        <div class="p-4 text-center">
+            <p class="text-muted">No transactions found</p>
+        </div>
+        {% endif %}
+    </div>
+    <div class="card-footer d-flex justify-content-between">
+        {% if cursor %}
+        <a href="{{ url_for('history', **filters) }}" class="btn btn-sm btn-outline-secondary">
+            <i class="fas fa-angle-double-left me-1"></i>Newest
+        </a>
+        {% else %}
+        <span></span>
+        {% endif %}
+        {% if next_cursor %}
+        <a href="{{ url_for('history', cursor=next_cursor, **filters) }}" class="btn btn-sm btn-outline-primary">
+            Older<i class="fas fa-angle-right ms-1"></i>
+        </a>
+        {% endif %}
+    </div>
+</div>
+
+<!-- Import -->
+<div class="card mt-4">
+    <div class="card-body">
+        <h5 class="card-title"><i class="fas fa-file-import me-2"></i>Import Purchase History</h5>
+        <p class="text-muted small">A CSV export from a store (Steam, PlayStation, App Store, ...) with at least a date and an amount column. Purchases already recorded are skipped.</p>
+        <form method="POST" action="{{ url_for('import_transactions') }}" enctype="multipart/form-data" class="row g-2 align-items-end">
+            {% if filters.child %}
+            <input type="hidden" name="child" value="{{ filters.child }}">
+            {% endif %}
+            <div class="col-md-5">
+                <input type="file" class="form-control" name="file" accept=".csv,text/csv" required>
+            </div>
+            <div class="col-md-4">
+                <select class="form-select" name="platform">
+                    <option value="">Platform for rows without one</option>
+                    {% for platform in game_platforms %}
+                    <option value="{{ platform }}">{{ platform }}</option>
+                    {% endfor %}
+                </select>
+            </div>
+            <div class="col-md-3">
+                <button type="submit" class="btn btn-primary w-100">
+                    <i class="fas fa-upload me-1"></i>Import {% if viewing_child %}for {{ viewing_name }}{% endif %}
+                </button>
+            </div>
+        </form>
+    </div>
+</div>
+{% endblock %}
+'''
+
+search_template = '''
+{% extends "base_template" %}
+
+{% block title %}Search Purchases - Game Spending Tracker{% endblock %}
+
+{% block content %}
+<div class="row mb-4">
+    <div class="col">
+        <h2><i class="fas fa-search me-2"></i>Search Purchases</h2>
+        <p class="text-muted">Find purchases by description{% if family_search %} across your family{% endif %}</p>
+    </div>
+</div>
+
+<div class="card mb-4">
+    <div class="card-body">
+        <form method="GET" action="{{ url_for('search') }}">
+            <div class="input-group">
+                <input type="text" class="form-control" name="q" value="{{ query }}" 
+                       placeholder="e.g., V-Bucks or Call of Duty" autofocus>
+                <button class="btn btn-primary" type="submit"><i class="fas fa-search me-1"></i>Search</button>
+            </div>
+        </form>
+    </div>
+</div>
+
+{% if query %}
+<div class="card">
+    <div class="card-header bg-light">
+        <h5 class="mb-0">{{ results|length }} result{% if results|length != 1 %}s{% endif %}</h5>
+    </div>
+    <div class="card-body p-0">
+        {% if results %}
+        <div class="table-responsive">
+            <table class="table table-hover mb-0">
+                <thead class="table-light">
+                    <tr>
+                        {% if family_search %}<th>Account</th>{% endif %}
+                        <th>Date</th>
+                        <th>Description</th>
+                        <th>Platform</th>
+                        <th>Category</th>
+                        <th>Amount</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    {% for result in results %}
+                    <tr>
+                        {% if family_search %}<td>{{ account_names.get(result.username, result.username) }}</td>{% endif %}
+                        <td>{{ result.date.split('T')[0] }}</td>
+                        <td>{{ result.description }}</td>
+                        <td>{{ result.game_platform }}</td>
+                        <td>{{ result.game_category }}</td>
+                        <td class="fw-bold">₹{{ "%.2f"|format(result.amount) }}</td>
+                    </tr>
+                    {% endfor %}
+                </tbody>
+            </table>
+        </div>
+        {% else %}
+        <div class="p-4 text-center">
+            <p class="text-muted">No purchases match "{{ query }}"</p>
+        </div>
+        {% endif %}
+    </div>
+</div>
+{% endif %}
+{% endblock %}
+'''
+
 parent_approval_template = '''
 {% extends "base_template" %}
 
@@ -800,15 +1564,25 @@ parent_approval_template = '''
 {% if pending_transactions %}
 <div class="row">
     <div class="col">
+        <form method="POST" action="{{ url_for('bulk_approval') }}">
         <div class="card shadow-sm">
-            <div class="card-header bg-light">
+            <div class="card-header bg-light d-flex justify-content-between align-items-center">
                 <h5 class="mb-0">Pending Approvals</h5>
+                <div>
+                    <button type="submit" name="action" value="approve" class="btn btn-sm btn-success">
+                        <i class="fas fa-check me-1"></i>Approve Selected
+                    </button>
+                    <button type="submit" name="action" value="deny" class="btn btn-sm btn-danger">
+                        <i class="fas fa-times me-1"></i>Deny Selected
+                    </button>
+                </div>
             </div>
             <div class="card-body p-0">
                 <div class="table-responsive">
                     <table class="table table-hover mb-0">
                         <thead>
                             <tr>
+                                <th></th>
                                 <th>Account</th>
                                 <th>Date</th>
                                 <th>Description</th>
@@ -821,6 +1595,10 @@ parent_approval_template = '''
                         <tbody>
                             {% for item in pending_transactions %}
                             <tr>
+                                <td>
+                                    <input type="checkbox" class="form-check-input" name="selected"
+                                           value="{{ item.username }}/{{ item.transaction.id }}">
+                                </td>
                                 <td>{{ item.user_display }}</td>
                                 <td>{{ item.transaction.date.split('T')[0] }}</td>
                                 <td>{{ item.transaction.description }}</td>
@@ -846,6 +1624,7 @@ parent_approval_template = '''
                 </div>
             </div>
         </div>
+        </form>
     </div>
 </div>
 {% else %}
@@ -912,6 +1691,21 @@ profile_template = '''
                         <div class="form-text">Maximum amount allowed for game purchases per month (0 for no limit)</div>
                     </div>
                     
+                    <div class="row">
+                        <div class="col-md-6 mb-3">
+                            <label for="game_spending_limit_weekly" class="form-label">Weekly Game Limit (₹)</label>
+                            <input type="number" step="0.01" class="form-control" id="game_spending_limit_weekly" 
+                                   name="game_spending_limit_weekly" value="{{ profile.game_spending_limit_weekly or 0 }}">
+                            <div class="form-text">Any 7 days in a row (0 for no limit)</div>
+                        </div>
+                        <div class="col-md-6 mb-3">
+                            <label for="game_spending_limit_daily" class="form-label">Daily Game Limit (₹)</label>
+                            <input type="number" step="0.01" class="form-control" id="game_spending_limit_daily" 
+                                   name="game_spending_limit_daily" value="{{ profile.game_spending_limit_daily or 0 }}">
+                            <div class="form-text">Per calendar day (0 for no limit)</div>
+                        </div>
+                    </div>
+                    
                     {% if not profile.is_child_account %}
                     <!-- Parent Email (only for parent accounts) -->
                     <div class="mb-3">
@@ -959,12 +1753,47 @@ profile_template = '''
 {% endblock %}
 '''
 
+# The embedded templates are served by name, so {% extends "base_template" %}
+# resolves. Each is compiled once here; the bytecode cache on disk lets new
+# worker processes skip compiling them at all.
+TEMPLATE_CACHE_DIR = os.path.join(DATA_DIR, "template_cache")
+if not os.path.exists(TEMPLATE_CACHE_DIR):
+    os.makedirs(TEMPLATE_CACHE_DIR)
+
+TEMPLATES = {
+    "base_template": base_template,
+    "index_template": index_template,
+    "login_template": login_template,
+    "register_template": register_template,
+    "dashboard_template": dashboard_template,
+    "dashboard_stats_fragment": dashboard_stats_fragment,
+    "dashboard_budget_fragment": dashboard_budget_fragment,
+    "dashboard_recent_fragment": dashboard_recent_fragment,
+    "dashboard_tip_fragment": dashboard_tip_fragment,
+    "game_spending_template": game_spending_template,
+    "game_analytics_template": game_analytics_template,
+    "history_template": history_template,
+    "search_template": search_template,
+    "parent_approval_template": parent_approval_template,
+    "profile_template": profile_template,
+}
+
+app.jinja_options = {
+    **app.jinja_options,
+    "loader": DictLoader(TEMPLATES),
+    # Named templates without an .html suffix are not autoescaped by default
+    "autoescape": True,
+    "bytecode_cache": FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+}
+for template_name in TEMPLATES:
+    app.jinja_env.get_template(template_name)
+
 # Routes
 @app.route('/')
 def index():
     if 'username' in session:
         return redirect(url_for('dashboard'))
-    return render_template_string(index_template, base_template=base_template)
+    return render_template("index_template")
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -974,57 +1803,63 @@ def register():
         confirm_password = request.form['confirm_password']
         account_type = request.form.get('account_type', 'parent')
         
+        if not valid_username(username):
+            flash('Usernames cannot be empty, start with a dot or contain slashes', 'danger')
+            return redirect(url_for('register'))
+        
         if password != confirm_password:
             flash('Passwords do not match', 'danger')
             return redirect(url_for('register'))
         
-        users = load_users()
-        
-        if username in users:
+        # Fast negative from the registry's Bloom filter for new usernames
+        if registry.exists(username):
             flash('Username already exists', 'danger')
             return redirect(url_for('register'))
         
         # Create new user
-        users[username] = {
+        user = {
             "password_hash": generate_password_hash(password),
             "created_at": datetime.datetime.now().isoformat(),
-            "account_type": account_type
+            "account_type": account_type,
+            "name": ""
         }
         
         # If it's a child account, link to parent
+        parent_username = None
         if account_type == 'child' and 'parent_username' in request.form:
             parent_username = request.form['parent_username']
-            if parent_username in users:
-                users[username]["parent_username"] = parent_username
-                
-                # Update child's profile
-                user_data = load_user_data(username)
-                user_data["profile"]["is_child_account"] = True
-                user_data["profile"]["parent_account"] = parent_username
-                save_user_data(username, user_data)
-                
-                # Update parent's profile to note they have a child account
-                parent_data = load_user_data(parent_username)
-                if "child_accounts" not in parent_data["profile"]:
-                    parent_data["profile"]["child_accounts"] = []
-                parent_data["profile"]["child_accounts"].append(username)
-                save_user_data(parent_username, parent_data)
-            else:
+            if registry.get(parent_username) is None:
                 flash('Parent account not found', 'danger')
                 return redirect(url_for('register'))
+            user["parent_username"] = parent_username
+        
+        # Exclusive create: a concurrent registration of the same name loses here
+        if not registry.create(username, user):
+            flash('Username already exists', 'danger')
+            return redirect(url_for('register'))
         
-        save_users(users)
+        if parent_username:
+            # Update child's profile
+            child_profile = store.load_profile(username)
+            child_profile["is_child_account"] = True
+            child_profile["parent_account"] = parent_username
+            store.save_profile(username, child_profile)
+            
+            # Update parent's profile to note they have a child account
+            def add_child(parent_profile):
+                parent_profile.setdefault("child_accounts", []).append(username)
+            store.update_profile(parent_username, add_child)
         
         # Create initial user data
-        user_data = load_user_data(username)
+        user_profile = store.load_profile(username)
         if account_type == 'parent':
-            user_data["profile"]["parent_mode"] = True
-        save_user_data(username, user_data)
+            user_profile["parent_mode"] = True
+        store.save_profile(username, user_profile)
         
         flash('Account created successfully! Please login.', 'success')
         return redirect(url_for('login'))
     
-    return render_template_string(register_template, base_template=base_template)
+    return render_template("register_template")
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -1032,19 +1867,19 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        users = load_users()
+        user = registry.get(username)
         
-        if username not in users or not check_password_hash(users[username]["password_hash"], password):
+        if user is None or not check_password_hash(user["password_hash"], password):
             flash('Invalid username or password', 'danger')
             return redirect(url_for('login'))
         
         session['username'] = username
         # Store account type in session for easy access
-        session['account_type'] = users[username].get("account_type", "parent")
+        session['account_type'] = user.get("account_type", "parent")
         
         return redirect(url_for('dashboard'))
     
-    return render_template_string(login_template, base_template=base_template)
+    return render_template("login_template")
 
 @app.route('/logout')
 def logout():
@@ -1059,69 +1894,58 @@ def dashboard():
         return redirect(url_for('login'))
     
     username = session['username']
-    user_data = load_user_data(username)
-    
-    # Get transactions, sorted by date (newest first)
-    transactions = sorted(
-        user_data["transactions"], 
-        key=lambda x: x.get("date", ""), 
-        reverse=True
-    )
+    current_month = datetime.datetime.now().strftime("%Y-%m")
+    etag, last_modified = page_validators(username, "dashboard", current_month)
+    if not_modified(etag, last_modified):
+        return with_validators(app.response_class(status=304), etag, last_modified)
     
-    # Calculate spending statistics
-    total_spent = sum(t["amount"] for t in user_data["transactions"])
+    profile = store.load_profile(username)
     
-    # Monthly spending
-    current_month = datetime.datetime.now().strftime("%Y-%m")
-    monthly_transactions = [
-        t for t in user_data["transactions"] 
-        if t["date"].startswith(current_month)
-    ]
-    monthly_spent = sum(t["amount"] for t in monthly_transactions)
+    # Calculate spending statistics (lifetime and current month)
+    total_spent, monthly_spent = store.spending_totals(username, current_month)
     
     # Budget calculations
-    budget = user_data["profile"]["monthly_budget"]
-    balance = user_data["profile"]["account_balance"]
+    budget = profile["monthly_budget"]
+    balance = profile["account_balance"]
     budget_percent = (monthly_spent / budget * 100) if budget > 0 else 0
     
     # Game spending limit
-    game_limit = user_data["profile"]["game_spending_limit"]
+    game_limit = profile["game_spending_limit"]
     
-    # Get pending approvals count (for parent accounts)
+    # Get pending approvals count (for parent accounts), covering own and child accounts
     pending_count = 0
-    if user_data["profile"]["parent_mode"]:
-        # Check for pending transactions in own account
-        pending_count = len([
-            t for t in user_data["transactions"] 
-            if not t.get("approved_by_parent", True)
-        ])
-        
-        # If there are child accounts, check their pending transactions too
-        if "child_accounts" in user_data["profile"]:
-            for child_username in user_data["profile"]["child_accounts"]:
-                child_data = load_user_data(child_username)
-                pending_count += len([
-                    t for t in child_data["transactions"] 
-                    if not t.get("approved_by_parent", True)
-                ])
+    if profile["parent_mode"]:
+        pending_count = store.pending_approval_count(username)
     
     # Get a gaming tip
     gaming_tip = get_gaming_tip()
     
-    return render_template_string(
-        dashboard_template,
-        base_template=base_template,
-        profile=user_data["profile"],
-        transactions=transactions[:10],  # Show only the 10 most recent
-        total_spent=total_spent,
-        monthly_spent=monthly_spent,
-        budget_percent=budget_percent,
-        balance=balance,
-        game_limit=game_limit,
-        pending_count=pending_count,
-        gaming_tip=gaming_tip,
-        is_child=user_data["profile"].get("is_child_account", False)
+    # Each block is only re-rendered when its own inputs change. The 10 most
+    # recent transactions are keyed by the data version, so they are only
+    # read again after a write.
+    stats_fragment = cached_fragment("dashboard_stats_fragment", username, {
+        "balance": balance, "total_spent": total_spent,
+        "monthly_spent": monthly_spent, "game_limit": game_limit
+    })
+    budget_fragment = cached_fragment("dashboard_budget_fragment", username, {
+        "monthly_spent": monthly_spent, "monthly_budget": budget, "budget_percent": budget_percent
+    })
+    recent_fragment = cached_fragment(
+        "dashboard_recent_fragment", username, {"data_version": store.data_version(username)},
+        lambda: {"transactions": store.recent_transactions(username, 10)}
     )
+    tip_fragment = cached_fragment("dashboard_tip_fragment", gaming_tip, {"gaming_tip": gaming_tip})
+    
+    return with_validators(make_response(render_template(
+        "dashboard_template",
+        profile=profile,
+        stats_fragment=stats_fragment,
+        budget_fragment=budget_fragment,
+        recent_fragment=recent_fragment,
+        tip_fragment=tip_fragment,
+        pending_count=pending_count,
+        is_child=profile.get("is_child_account", False)
+    )), etag, last_modified)
 
 @app.route('/profile', methods=['GET', 'POST'])
 def profile():
@@ -1129,46 +1953,48 @@ def profile():
         return redirect(url_for('login'))
     
     username = session['username']
-    user_data = load_user_data(username)
+    # Edit a copy so a rejected form never leaves the cached profile half-updated
+    profile = dict(store.load_profile(username))
     
     if request.method == 'POST':
         # Update profile
-        user_data["profile"]["name"] = request.form['name']
-        user_data["profile"]["account_balance"] = float(request.form['account_balance'])
-        user_data["profile"]["monthly_budget"] = float(request.form['monthly_budget'])
+        profile["name"] = request.form['name']
+        profile["account_balance"] = float(request.form['account_balance'])
+        profile["monthly_budget"] = float(request.form['monthly_budget'])
         
         # Parent-specific fields
-        if not user_data["profile"].get("is_child_account", False):
-            user_data["profile"]["parent_mode"] = 'parent_mode' in request.form
-            user_data["profile"]["parent_email"] = request.form['parent_email']
+        if not profile.get("is_child_account", False):
+            profile["parent_mode"] = 'parent_mode' in request.form
+            profile["parent_email"] = request.form['parent_email']
             
             # Child name (if parent manages a child's account)
             if 'child_name' in request.form:
-                user_data["profile"]["child_name"] = request.form['child_name']
+                profile["child_name"] = request.form['child_name']
         
-        # Game spending limit (can be set for both parent and child accounts)
-        try:
-            user_data["profile"]["game_spending_limit"] = float(request.form['game_spending_limit'])
-        except ValueError:
-            user_data["profile"]["game_spending_limit"] = 0
+        # Game spending limits (can be set for both parent and child accounts)
+        for field in ["game_spending_limit", "game_spending_limit_weekly", "game_spending_limit_daily"]:
+            try:
+                profile[field] = float(request.form.get(field, 0))
+            except ValueError:
+                profile[field] = 0
         
-        save_user_data(username, user_data)
+        store.save_profile(username, profile)
+        registry.update(username, name=profile["name"])
         flash('Profile updated successfully', 'success')
         return redirect(url_for('dashboard'))
     
     # If this is a child account, get the parent info
     parent_info = None
-    if user_data["profile"].get("is_child_account", False) and user_data["profile"].get("parent_account"):
-        parent_data = load_user_data(user_data["profile"]["parent_account"])
+    if profile.get("is_child_account", False) and profile.get("parent_account"):
+        parent_profile = store.load_profile(profile["parent_account"])
         parent_info = {
-            "username": user_data["profile"]["parent_account"],
-            "name": parent_data["profile"].get("name", "Parent")
+            "username": profile["parent_account"],
+            "name": parent_profile.get("name", "Parent")
         }
     
-    return render_template_string(
-        profile_template, 
-        base_template=base_template,
-        profile=user_data["profile"],
+    return render_template(
+        "profile_template",
+        profile=profile,
         parent_info=parent_info
     )
 
@@ -1178,11 +2004,11 @@ def game_spending():
         return redirect(url_for('login'))
     
     username = session['username']
-    user_data = load_user_data(username)
+    profile = store.load_profile(username)
     
     # Check if this is a child account to determine approval flow
-    is_child = user_data["profile"].get("is_child_account", False)
-    needs_approval = is_child or user_data["profile"].get("parent_mode", False)
+    is_child = profile.get("is_child_account", False)
+    needs_approval = is_child or profile.get("parent_mode", False)
     
     if request.method == 'POST':
         try:
@@ -1195,20 +2021,6 @@ def game_spending():
                 flash('Amount must be greater than 0', 'danger')
                 return redirect(url_for('game_spending'))
             
-            # Check if game spending limit would be exceeded
-            game_limit = user_data["profile"]["game_spending_limit"]
-            current_month = datetime.datetime.now().strftime("%Y-%m")
-            monthly_game_spending = sum([
-                t["amount"] for t in user_data["transactions"] 
-                if t["date"].startswith(current_month) and 
-                t.get("is_game_purchase", False) and
-                t.get("approved_by_parent", False) == False
-            ])
-            
-            if game_limit > 0 and (monthly_game_spending + amount) > game_limit:
-                flash(f'This purchase would exceed your monthly game spending limit of ₹{game_limit:.2f}', 'danger')
-                return redirect(url_for('game_spending'))
-            
             # Create game transaction
             transaction = {
                 "id": str(uuid.uuid4()),
@@ -1221,14 +2033,22 @@ def game_spending():
                 "approved_by_parent": not needs_approval  # Auto-approve if no approval needed
             }
             
-            # Update balance
-            user_data["profile"]["account_balance"] -= amount
-            
-            # Add transaction
-            user_data["transactions"].append(transaction)
-            save_user_data(username, user_data)
+            # Add transaction and update balance, unless it would exceed a game spending
+            # limit (approved and pending purchases both count towards it)
+            limits = game_limits(profile)
+            exceeded = store.add_transaction(username, transaction, limits)
+            if exceeded:
+                flash(f'This purchase would exceed your {exceeded} game spending limit of ₹{limits[exceeded]:.2f}', 'danger')
+                return redirect(url_for('game_spending'))
             
             if needs_approval:
+                notifier.publish(approver_for(username, profile), "pending", {
+                    "username": username,
+                    "name": profile.get("name") or username,
+                    "description": description,
+                    "amount": amount,
+                    "game_platform": game_platform
+                })
                 flash('Game purchase added! Waiting for parent approval.', 'info')
             else:
                 flash('Game purchase recorded successfully!', 'success')
@@ -1238,62 +2058,358 @@ def game_spending():
             flash('Invalid amount', 'danger')
             return redirect(url_for('game_spending'))
     
-    return render_template_string(
-        game_spending_template, 
-        base_template=base_template,
+    return render_template(
+        "game_spending_template",
         game_categories=GAME_CATEGORIES, 
         game_platforms=GAME_PLATFORMS,
-        profile=user_data["profile"],
+        profile=profile,
         needs_approval=needs_approval
     )
 
+@app.route('/game_analytics')
+def game_analytics():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    username = session['username']
+    profile = store.load_profile(username)
+    
+    # Parents can switch to one of their child accounts
+    child_accounts = child_accounts_of(profile)
+    viewing = username
+    viewing_child = False
+    viewing_name = profile.get("name") or username
+    child = request.args.get('child')
+    if child:
+        selected = [c for c in child_accounts if c["username"] == child]
+        if not selected:
+            flash('You can only view analytics for your own child accounts', 'danger')
+            return redirect(url_for('game_analytics'))
+        viewing = child
+        viewing_child = True
+        viewing_name = selected[0]["name"]
+        viewing_profile = store.load_profile(child)
+    else:
+        viewing_profile = profile
+    
+    # All figures come from one frame built over the columnar replica
+    frame = game_spending_frame(store.transaction_columns(viewing), GAME_PLATFORMS, GAME_CATEGORIES)
+    summary = game_spending_summary(frame)
+    
+    # Server-rendered charts come from the render cache; missing ones are
+    # rendered in the background. Otherwise, or while a chart's render is
+    # failing, the page draws it itself.
+    charts = {}
+    browser_charts = CHART_KINDS
+    if CHART_RENDERING == "server":
+        charts = chart_renderer.charts_for(viewing, store.data_version(viewing), chart_series(summary))
+        browser_charts = [kind for kind, filename in charts.items() if filename is None]
+    
+    return render_template(
+        "game_analytics_template",
+        child_accounts=child_accounts,
+        viewing_child=viewing_child,
+        viewing_name=viewing_name,
+        game_limit=viewing_profile["game_spending_limit"],
+        browser_charts=browser_charts,
+        charts=charts,
+        **summary
+    )
+
+@app.route('/api/charts/<kind>')
+def chart_data(kind):
+    # Chart series as JSON for drawing in the browser: {"labels": [...], "values": [...]}
+    if 'username' not in session:
+        return jsonify({"error": "Login required"}), 401
+    if kind not in CHART_KINDS:
+        return jsonify({"error": f"Unknown chart: {kind}"}), 404
+    
+    username = session['username']
+    viewing = request.args.get('child') or username
+    if viewing != username and viewing not in store.load_profile(username).get("child_accounts", []):
+        return jsonify({"error": "You can only view analytics for your own child accounts"}), 403
+    
+    # The ETag only depends on the data version, so unchanged charts are answered before any data is read
+    etag = hashlib.sha256(f"{viewing}:{store.data_version(viewing)}:{kind}".encode("utf-8")).hexdigest()[:32]
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        frame = game_spending_frame(store.transaction_columns(viewing), GAME_PLATFORMS, GAME_CATEGORIES)
+        series = chart_series(game_spending_summary(frame))[kind]
+        response = jsonify({"labels": list(series), "values": list(series.values())})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+@app.route('/history')
+def history():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    username = session['username']
+    profile = store.load_profile(username)
+    child_accounts = child_accounts_of(profile)
+    
+    try:
+        filters = history_filters_from(request.args)
+        cursor = request.args.get('cursor')
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        flash('Invalid history filter', 'danger')
+        return redirect(url_for('history'))
+    
+    viewing = username
+    viewing_name = profile.get("name") or username
+    child = request.args.get('child')
+    if child:
+        selected = [c for c in child_accounts if c["username"] == child]
+        if not selected:
+            flash('You can only view the history of your own child accounts', 'danger')
+            return redirect(url_for('history'))
+        viewing = child
+        viewing_name = selected[0]["name"]
+        filters["child"] = child
+    
+    transactions, next_key = store.transaction_page(viewing, HISTORY_PAGE_SIZE, before, filters)
+    
+    return render_template(
+        "history_template",
+        transactions=transactions,
+        filters=filters,
+        cursor=cursor,
+        next_cursor=encode_cursor(next_key) if next_key else None,
+        child_accounts=child_accounts,
+        viewing_child=viewing != username,
+        viewing_name=viewing_name,
+        game_platforms=GAME_PLATFORMS,
+        game_categories=GAME_CATEGORIES,
+        export_formats=[f for f in EXPORT_FORMATS if format_available(f)]
+    )
+
+@app.route('/export')
+@app.route('/api/v1/export')
+def export_transactions():
+    # Streams the history as ?format=csv|ndjson|parquet: your own, a child's
+    # (?child=...) or the whole family's (?scope=family). The body is sent in
+    # chunks as pages are read, so memory use does not grow with the history.
+    username = api_username()
+    if username is None:
+        return jsonify({"error": "Login required"}), 401
+    
+    export_format = request.args.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"Format must be one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    if not format_available(export_format):
+        return jsonify({"error": "Parquet export needs pyarrow installed on the server"}), 501
+    
+    child_accounts = store.load_profile(username).get("child_accounts", [])
+    child = request.args.get('child')
+    if child and child not in child_accounts:
+        return jsonify({"error": "You can only export the history of your own child accounts"}), 403
+    if request.args.get('scope') == 'family':
+        usernames, name = [username] + child_accounts, f"{username}-family"
+    else:
+        usernames, name = [child or username], child or username
+    
+    response = app.response_class(
+        export_chunks(store, usernames, export_format), mimetype=EXPORT_FORMATS[export_format][0]
+    )
+    response.headers["Content-Disposition"] = f'attachment; filename="transactions-{name}.{export_format}"'
+    return response
+
+@app.route('/import_transactions', methods=['POST'])
+def import_transactions():
+    # Upload form on the history page; imports into your own or a child's account
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    username = session['username']
+    child = request.form.get('child')
+    if child and child not in store.load_profile(username).get("child_accounts", []):
+        flash('You can only import into your own child accounts', 'danger')
+        return redirect(url_for('history'))
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        flash('Choose a CSV file to import', 'warning')
+        return redirect(url_for('history', child=child or None))
+    
+    try:
+        summary = csv_importer.import_file(store, child or username, upload.stream, request.form.get('platform'))
+    except ValueError as e:
+        flash(f'Could not import the file: {e}', 'danger')
+        return redirect(url_for('history', child=child or None))
+    
+    flash(f'Imported {summary["imported"]} purchase(s), skipped {summary["duplicates"]} already recorded', 'success')
+    if summary["invalid"]:
+        first = summary["errors"][0]
+        flash(f'{summary["invalid"]} row(s) were invalid, e.g. line {first["line"]}: {first["error"]}', 'warning')
+    return redirect(url_for('history', child=child or None))
+
+@app.route('/api/v1/import', methods=['POST'])
+def import_api():
+    # A CSV file, as the "file" form field or the raw request body:
+    # ?child=... imports into a child's account, ?platform=... names the
+    # platform for rows without one, ?dry_run=1 validates without writing.
+    # -> {"imported", "duplicates", "invalid", "errors": [{"line", "error"}]}
+    username = api_username()
+    if username is None:
+        return jsonify({"error": "Login required"}), 401
+    child = request.args.get('child')
+    if child and child not in store.load_profile(username).get("child_accounts", []):
+        return jsonify({"error": "You can only import into your own child accounts"}), 403
+    
+    upload = request.files.get('file')
+    try:
+        summary = csv_importer.import_file(
+            store, child or username, upload.stream if upload else request.stream,
+            request.args.get('platform'), dry_run=request.args.get('dry_run') in ("1", "true")
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Could not import the file: {e}"}), 400
+    return jsonify(summary)
+
+@app.route('/api/transactions')
+@app.route('/api/v1/transactions')
+def transactions_api():
+    # {"transactions": [...], "next_cursor": ...}; pass next_cursor back as ?cursor= for the next page
+    username = api_username()
+    if username is None:
+        return jsonify({"error": "Login required"}), 401
+    
+    viewing = request.args.get('child') or username
+    if viewing != username and viewing not in store.load_profile(username).get("child_accounts", []):
+        return jsonify({"error": "You can only view the history of your own child accounts"}), 403
+    
+    try:
+        filters = history_filters_from(request.args)
+        cursor = request.args.get('cursor')
+        before = decode_cursor(cursor) if cursor else None
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    transactions, next_key = store.transaction_page(viewing, limit, before, filters)
+    return jsonify({
+        "transactions": transactions,
+        "next_cursor": encode_cursor(next_key) if next_key else None
+    })
+
+@app.route('/api/v1/transactions', methods=['POST'])
+def ingest_transactions():
+    # Bulk ingestion of game purchases:
+    # {"transactions": [{"amount", "description", "game_platform", "game_category",
+    #                    optional "date" and "username" (own or a child account)}, ...]}
+    # The whole batch is validated before anything is written. Purchases are
+    # then added with one write per account, under the same approval and limit
+    # rules as game_spending, and the reply has one result per item, in order.
+    username = api_username()
+    if username is None:
+        return jsonify({"error": "Login required"}), 401
+    
+    body = request.get_json(silent=True)
+    items = body.get("transactions") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": 'Expected a JSON body of the form {"transactions": [...]}'}), 400
+    if len(items) > API_MAX_BATCH:
+        return jsonify({"error": f"At most {API_MAX_BATCH} transactions per request"}), 413
+    
+    child_accounts = store.load_profile(username).get("child_accounts", [])
+    batches = {}  # account -> [(position in the request, transaction)]
+    errors = []
+    for position, item in enumerate(items):
+        try:
+            transaction = purchase_from_json(item)
+            account = item.get("username") or username
+            if account != username and account not in child_accounts:
+                raise ValueError("You can only add purchases for your own child accounts")
+        except ValueError as e:
+            errors.append({"index": position, "error": str(e)})
+            continue
+        batches.setdefault(account, []).append((position, transaction))
+    if errors:
+        return jsonify({"error": "Invalid transactions, nothing was added", "errors": errors}), 400
+    
+    results = [None] * len(items)
+    for account, batch in batches.items():
+        profile = store.load_profile(account)
+        needs_approval = profile.get("is_child_account", False) or profile.get("parent_mode", False)
+        limits = game_limits(profile)
+        for _, transaction in batch:
+            transaction["approved_by_parent"] = not needs_approval
+        added, exceeded = store.add_transactions(account, [t for _, t in batch], limits)
+        if needs_approval and added:
+            notifier.publish(approver_for(account, profile), "changed")
+        for i, (position, transaction) in enumerate(batch):
+            if i in exceeded:
+                results[position] = {
+                    "index": position, "status": "rejected",
+                    "error": f"Would exceed the {exceeded[i]} game spending limit of ₹{limits[exceeded[i]]:.2f}"
+                }
+            else:
+                results[position] = {
+                    "index": position, "status": "added", "username": account,
+                    "id": transaction["id"], "approved_by_parent": transaction["approved_by_parent"]
+                }
+    
+    added_count = sum(1 for result in results if result["status"] == "added")
+    return jsonify({"added": added_count, "rejected": len(results) - added_count, "results": results})
+
+@app.route('/search')
+def search():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    username = session['username']
+    profile = store.load_profile(username)
+    query = request.args.get('q', '').strip()
+    
+    # Parents see results from their children too
+    account_names = {username: "Your Account"}
+    for child in child_accounts_of(profile):
+        account_names[child["username"]] = child["name"]
+    
+    results = store.search_transactions(username, query) if query else []
+    
+    return render_template(
+        "search_template",
+        query=query,
+        results=results,
+        account_names=account_names,
+        family_search=len(account_names) > 1
+    )
+
 @app.route('/parent_approval')
 def parent_approval():
     if 'username' not in session:
         return redirect(url_for('login'))
     
     username = session['username']
-    user_data = load_user_data(username)
+    # Polled by parents waiting on a purchase: unchanged pages cost one version lookup
+    etag, last_modified = page_validators(username, "parent_approval")
+    if not_modified(etag, last_modified):
+        return with_validators(app.response_class(status=304), etag, last_modified)
+    
+    profile = store.load_profile(username)
     
     # Only allow access if parent mode is enabled
-    if not user_data["profile"].get("parent_mode", False):
+    if not profile.get("parent_mode", False):
         flash('Parent mode is not enabled for this account', 'warning')
         return redirect(url_for('dashboard'))
     
-    # Get all pending transactions from own account
+    # Get all pending transactions from own and child accounts
     pending_transactions = [
         {
-            "username": username,
-            "user_display": "Your Account",
-            "transaction": t
+            "username": entry["username"],
+            "user_display": "Your Account" if entry["username"] == username else entry["name"],
+            "transaction": entry["transaction"]
         }
-        for t in user_data["transactions"] 
-        if t.get("is_game_purchase", False) and not t.get("approved_by_parent", True)
+        for entry in store.pending_approvals(username)
     ]
     
-    # Get pending transactions from child accounts
-    if "child_accounts" in user_data["profile"]:
-        for child_username in user_data["profile"]["child_accounts"]:
-            child_data = load_user_data(child_username)
-            child_display = child_data["profile"].get("name", child_username)
-            
-            child_transactions = [
-                {
-                    "username": child_username,
-                    "user_display": child_display,
-                    "transaction": t
-                }
-                for t in child_data["transactions"] 
-                if t.get("is_game_purchase", False) and not t.get("approved_by_parent", True)
-            ]
-            
-            pending_transactions.extend(child_transactions)
-    
-    return render_template_string(
-        parent_approval_template,
-        base_template=base_template,
+    return with_validators(make_response(render_template(
+        "parent_approval_template",
         pending_transactions=pending_transactions
-    )
+    )), etag, last_modified)
 
 @app.route('/approve_transaction/<username>/<transaction_id>')
 def approve_transaction(username, transaction_id):
@@ -1301,37 +2417,24 @@ def approve_transaction(username, transaction_id):
         return redirect(url_for('login'))
     
     parent_username = session['username']
-    parent_data = load_user_data(parent_username)
+    parent_profile = store.load_profile(parent_username)
     
     # Verify that this user can approve transactions
-    if not parent_data["profile"].get("parent_mode", False):
+    if not parent_profile.get("parent_mode", False):
         flash('You do not have permission to approve transactions', 'danger')
         return redirect(url_for('dashboard'))
     
     # Verify that this user is the parent of the child account (if applicable)
-    if username != parent_username and (
-        "child_accounts" not in parent_data["profile"] or 
-        username not in parent_data["profile"]["child_accounts"]
-    ):
+    if username != parent_username and username not in parent_profile.get("child_accounts", []):
         flash('You do not have permission to approve this transaction', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Load the target user data
-    user_data = load_user_data(username)
-    
     # Find and approve the transaction
-    transaction_found = False
-    for transaction in user_data["transactions"]:
-        if transaction.get("id") == transaction_id:
-            transaction["approved_by_parent"] = True
-            transaction_found = True
-            flash('Transaction approved', 'success')
-            break
-    
-    if not transaction_found:
-        flash('Transaction not found', 'danger')
+    if store.approve_transaction(username, transaction_id):
+        notifier.publish(parent_username, "changed")
+        flash('Transaction approved', 'success')
     else:
-        save_user_data(username, user_data)
+        flash('Transaction not found', 'danger')
     
     return redirect(url_for('parent_approval'))
 
@@ -1341,43 +2444,128 @@ def deny_transaction(username, transaction_id):
         return redirect(url_for('login'))
     
     parent_username = session['username']
-    parent_data = load_user_data(parent_username)
+    parent_profile = store.load_profile(parent_username)
     
     # Verify that this user can deny transactions
-    if not parent_data["profile"].get("parent_mode", False):
+    if not parent_profile.get("parent_mode", False):
         flash('You do not have permission to deny transactions', 'danger')
         return redirect(url_for('dashboard'))
     
     # Verify that this user is the parent of the child account (if applicable)
-    if username != parent_username and (
-        "child_accounts" not in parent_data["profile"] or 
-        username not in parent_data["profile"]["child_accounts"]
-    ):
+    if username != parent_username and username not in parent_profile.get("child_accounts", []):
         flash('You do not have permission to deny this transaction', 'danger')
         return redirect(url_for('dashboard'))
     
-    # Load the target user data
-    user_data = load_user_data(username)
-    
-    # Find the transaction
-    transaction_found = False
-    for i, transaction in enumerate(user_data["transactions"]):
-        if transaction.get("id") == transaction_id:
-            # Refund the amount
-            user_data["profile"]["account_balance"] += transaction["amount"]
-            # Remove the transaction
-            user_data["transactions"].pop(i)
-            transaction_found = True
-            flash('Transaction denied and amount refunded', 'warning')
-            break
-    
-    if not transaction_found:
+    # Remove the transaction and refund the amount
+    if store.deny_transaction(username, transaction_id):
+        notifier.publish(parent_username, "changed")
+        flash('Transaction denied and amount refunded', 'warning')
+    else:
         flash('Transaction not found', 'danger')
+    
+    return redirect(url_for('parent_approval'))
+
+@app.route('/bulk_approval', methods=['POST'])
+def bulk_approval():
+    # Approve or deny every purchase ticked on the approval page
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    parent_username = session['username']
+    parent_profile = store.load_profile(parent_username)
+    
+    if not parent_profile.get("parent_mode", False):
+        flash('You do not have permission to approve transactions', 'danger')
+        return redirect(url_for('dashboard'))
+    
+    action = request.form.get('action')
+    selected = [value.rsplit('/', 1) for value in request.form.getlist('selected') if '/' in value]
+    if action not in ("approve", "deny") or not selected:
+        flash('Select at least one purchase to approve or deny', 'warning')
+        return redirect(url_for('parent_approval'))
+    
+    results = apply_decisions(parent_username, parent_profile, [
+        (username, transaction_id, action) for username, transaction_id in selected
+    ])
+    done = sum(1 for result in results if result["status"] in ("approved", "denied"))
+    if action == "approve":
+        flash(f'{done} transaction(s) approved', 'success')
     else:
-        save_user_data(username, user_data)
+        flash(f'{done} transaction(s) denied and refunded', 'warning')
+    if done < len(results):
+        flash(f'{len(results) - done} transaction(s) could not be found or are not in your family', 'danger')
     
     return redirect(url_for('parent_approval'))
 
+@app.route('/api/v1/approvals', methods=['POST'])
+def approvals_api():
+    # {"decisions": [{"username", "transaction_id", "action": "approve" | "deny"}, ...]}
+    # -> {"results": [{..., "status": "approved" | "denied" | "not_found" | "forbidden"}, ...]}
+    username = api_username()
+    if username is None:
+        return jsonify({"error": "Login required"}), 401
+    parent_profile = store.load_profile(username)
+    if not parent_profile.get("parent_mode", False):
+        return jsonify({"error": "Parent mode is not enabled for this account"}), 403
+    
+    body = request.get_json(silent=True)
+    items = body.get("decisions") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": 'Expected a JSON body of the form {"decisions": [...]}'}), 400
+    if len(items) > API_MAX_BATCH:
+        return jsonify({"error": f"At most {API_MAX_BATCH} decisions per request"}), 413
+    
+    decisions = []
+    errors = []
+    for position, item in enumerate(items):
+        if (not isinstance(item, dict) or not isinstance(item.get("username"), str)
+                or not isinstance(item.get("transaction_id"), str)
+                or item.get("action") not in ("approve", "deny")):
+            errors.append({"index": position, "error": 'Each decision needs username, transaction_id and an action of "approve" or "deny"'})
+            continue
+        decisions.append((item["username"], item["transaction_id"], item["action"]))
+    if errors:
+        return jsonify({"error": "Invalid decisions, nothing was applied", "errors": errors}), 400
+    
+    return jsonify({"results": apply_decisions(username, parent_profile, decisions)})
+
+@app.route('/events/pending')
+def pending_events():
+    # Server-Sent Events stream for the approval badge and alerts:
+    #   "pending" - a purchase is waiting for this account's approval
+    #               (username, name, description, amount, game_platform)
+    #   "count"   - the number waiting changed (sent first on every connect)
+    # Every event carries the current pending_count.
+    if 'username' not in session:
+        return jsonify({"error": "Login required"}), 401
+    username = session['username']
+    
+    def stream():
+        deadline = time.monotonic() + SSE_MAX_SECONDS
+        with notifier.subscribe(username) as events:
+            family_version = store.version_info(username)["family"]
+            yield "retry: 5000\n" + sse_message("count", {"pending_count": store.pending_approval_count(username)})
+            while time.monotonic() < deadline:
+                try:
+                    event, data = events.get(timeout=min(SSE_HEARTBEAT, max(deadline - time.monotonic(), 0)))
+                except queue.Empty:
+                    # Nothing published here; another worker may still have written
+                    if store.version_info(username)["family"] == family_version:
+                        yield ": keep-alive\n\n"
+                        continue
+                    event, data = "changed", None
+                family_version = store.version_info(username)["family"]
+                pending_count = store.pending_approval_count(username)
+                if event == "pending":
+                    yield sse_message("pending", dict(data, pending_count=pending_count))
+                else:
+                    yield sse_message("count", {"pending_count": pending_count})
+    
+    response = app.response_class(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # don't let nginx buffer the stream
+    return response
+
 @app.route('/add_sample_data')
 def add_sample_data():
     if 'username' not in session:
@@ -1393,5 +2581,65 @@ def add_sample_data():
     
     return redirect(url_for('dashboard'))
 
+@app.route('/cache_stats')
+def cache_stats():
+    if 'username' not in session:
+        return redirect(url_for('login'))
+    
+    return jsonify({**store.cache_stats(), "fragments": fragment_cache.stats()})
+
+@app.cli.command('compact-journals')
+def compact_journals():
+    # Periodic maintenance, e.g. from cron: FLASK_APP=game_tracker_app flask compact-journals
+    store.compact_all()
+
+@app.cli.command('rebuild-aggregates')
+def rebuild_aggregates():
+    # Recompute every user's running totals from their transaction history
+    for username in store.usernames():
+        store.rebuild_aggregates(username)
+
+@app.cli.command('rebuild-columns')
+def rebuild_columns():
+    # Rewrite every user's columnar analytics replica from their transaction history
+    for username in store.usernames():
+        store.rebuild_columns(username)
+
+@app.cli.command('export-transactions')
+@click.argument('username')
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='csv')
+@click.option('--family', is_flag=True, help="Include the account's child accounts.")
+@click.option('--output', type=click.Path(dir_okay=False), help='File to write instead of stdout.')
+def export_transactions_command(username, export_format, family, output):
+    # Same stream as /export, e.g. flask export-transactions alice --family --format parquet --output family.parquet
+    if not format_available(export_format):
+        raise click.ClickException("Parquet export needs pyarrow installed")
+    usernames = [username]
+    if family:
+        usernames += store.load_profile(username).get("child_accounts", [])
+    f = open(output, 'wb') if output else click.get_binary_stream('stdout')
+    try:
+        for chunk in export_chunks(store, usernames, export_format):
+            f.write(chunk)
+    finally:
+        if output:
+            f.close()
+
+@app.cli.command('import-transactions')
+@click.argument('username')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--platform', type=click.Choice(GAME_PLATFORMS), help='Platform for rows without one.')
+@click.option('--dry-run', is_flag=True, help='Validate and count without writing anything.')
+def import_transactions_command(username, path, platform, dry_run):
+    # Import a store's CSV export, e.g. flask import-transactions alice steam.csv --platform Steam
+    try:
+        summary = csv_importer.import_file(store, username, path, platform, dry_run=dry_run)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{"Would import" if dry_run else "Imported"} {summary["imported"]}, '
+               f'skipped {summary["duplicates"]} duplicates and {summary["invalid"]} invalid rows')
+    for error in summary["errors"]:
+        click.echo(f'  line {error["line"]}: {error["error"]}', err=True)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,57 @@
+import json
+import queue
+import threading
+from contextlib import contextmanager
+
+# Events held for a subscriber that is not reading; the oldest are dropped first
+MAX_QUEUED_EVENTS = 100
+
+
+def sse_message(event, data):
+    # One Server-Sent Events message
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventBroker:
+    # In-process publish/subscribe with one channel per account. Every
+    # subscriber (an open event stream) gets its own bounded queue, so a
+    # publishing request never waits on a slow reader. Events only reach
+    # subscribers in the same worker process.
+
+    def __init__(self, max_queued=MAX_QUEUED_EVENTS):
+        self.max_queued = max_queued
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def subscribe(self, channel):
+        events = queue.Queue(maxsize=self.max_queued)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(events)
+        try:
+            yield events
+        finally:
+            with self._lock:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(events)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def publish(self, channel, event, data=None):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for events in subscribers:
+            while True:
+                try:
+                    events.put_nowait((event, data))
+                    break
+                except queue.Full:
+                    try:
+                        events.get_nowait()
+                    except queue.Empty:
+                        pass
+
+    def subscribers(self, channel):
+        with self._lock:
+            return len(self._channels.get(channel, ()))
@@ -0,0 +1,254 @@
+import os
+import re
+import json
+import time
+import bisect
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+from user_cache import UserDocumentCache
+from storage import file_signature
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Transaction fields kept with each indexed description, enough to list a result
+DOCUMENT_FIELDS = ["id", "date", "amount", "description", "game_platform", "game_category"]
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+# A build file older than this is left over from a crashed worker
+BUILD_TIMEOUT = 600
+
+
+def tokenize(text):
+    # NFKC folds compatibility characters ("™" -> "TM", full-width letters),
+    # casefold handles case beyond ASCII
+    return TOKEN_PATTERN.findall(unicodedata.normalize("NFKC", text or "").casefold())
+
+
+class FamilyIndex:
+    # In-memory inverted index of one family's purchase descriptions
+
+    def __init__(self):
+        self.documents = {}
+        self.postings = {}
+        self.tokens = []  # sorted, for prefix ranges
+
+    def apply(self, record):
+        if record["op"] == "add":
+            self.add(record["username"], record["transaction"])
+        elif record["op"] == "remove":
+            self.remove(record["id"])
+
+    def add(self, username, transaction):
+        document = {key: transaction.get(key) for key in DOCUMENT_FIELDS}
+        document["username"] = username
+        self.remove(document["id"])
+        self.documents[document["id"]] = document
+        for token in set(tokenize(document["description"])):
+            if token not in self.postings:
+                self.postings[token] = set()
+                bisect.insort(self.tokens, token)
+            self.postings[token].add(document["id"])
+
+    def remove(self, transaction_id):
+        document = self.documents.pop(transaction_id, None)
+        if document is None:
+            return
+        for token in set(tokenize(document["description"])):
+            ids = self.postings.get(token)
+            if ids is not None:
+                ids.discard(transaction_id)
+                if not ids:
+                    del self.postings[token]
+                    del self.tokens[bisect.bisect_left(self.tokens, token)]
+
+    def _prefix_matches(self, prefix):
+        ids = set()
+        start = bisect.bisect_left(self.tokens, prefix)
+        for token in self.tokens[start:]:
+            if not token.startswith(prefix):
+                break
+            ids |= self.postings[token]
+        return ids
+
+    def search(self, query, limit, usernames=None):
+        # Documents where every query word is a prefix of some description word, newest first
+        terms = tokenize(query)
+        if not terms:
+            return []
+        ids = None
+        for term in sorted(set(terms), key=len, reverse=True):
+            matches = self._prefix_matches(term)
+            ids = matches if ids is None else ids & matches
+            if not ids:
+                return []
+        documents = [self.documents[i] for i in ids]
+        if usernames is not None:
+            documents = [d for d in documents if d["username"] in usernames]
+        documents.sort(key=lambda d: (d.get("date") or "", d["id"]), reverse=True)
+        return documents[:limit]
+
+
+class SearchIndex:
+    # Per-family inverted indexes over purchase descriptions. A family is a
+    # parent account and its children (or a standalone account). Each family
+    # has an append-only log of add/remove operations under
+    # <index_dir>/<family>.jsonl that is replayed into a cached FamilyIndex;
+    # writes append to the log and update the cached index in place. A
+    # family's log is built from its histories the first time it is searched;
+    # until then writes for that family are not recorded. The log only
+    # appears once a build has completed.
+
+    def __init__(self, index_dir, cache_size=64):
+        self.index_dir = index_dir
+        self.cache = UserDocumentCache(cache_size)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        if not os.path.exists(index_dir):
+            os.makedirs(index_dir)
+
+    def get_log_file(self, family):
+        return os.path.join(self.index_dir, f"{family}.jsonl")
+
+    @contextmanager
+    def family_lock(self, family):
+        with self._locks_guard:
+            lock = self._locks.setdefault(family, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(self.index_dir, f"{family}.lock"), 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get_building_dir(self, family):
+        # One file per build in progress, collecting the writes made meanwhile
+        return os.path.join(self.index_dir, f"{family}.building")
+
+    def has(self, family):
+        return os.path.exists(self.get_log_file(family))
+
+    def _append(self, family, *records):
+        with self.family_lock(family):
+            building_dir = self.get_building_dir(family)
+            if os.path.isdir(building_dir):
+                for name in os.listdir(building_dir):
+                    with open(os.path.join(building_dir, name), 'a') as f:
+                        f.write("".join(json.dumps(record) + "\n" for record in records))
+            log_file = self.get_log_file(family)
+            if not os.path.exists(log_file):
+                return
+            cached = self.cache.peek(family, file_signature(log_file))
+            with open(log_file, 'a') as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+            if cached is not None:
+                for record in records:
+                    cached.apply(record)
+                self.cache.put(family, file_signature(log_file), cached)
+
+    def add(self, family, username, transaction):
+        self.add_many(family, username, [transaction])
+
+    def add_many(self, family, username, transactions):
+        self._append(family, *[
+            {"op": "add", "username": username, "transaction": {key: transaction.get(key) for key in DOCUMENT_FIELDS}}
+            for transaction in transactions
+        ])
+
+    def remove(self, family, transaction_id):
+        self.remove_many(family, [transaction_id])
+
+    def remove_many(self, family, transaction_ids):
+        self._append(family, *[{"op": "remove", "id": transaction_id} for transaction_id in transaction_ids])
+
+    def forget(self, family):
+        # Drop a family's index, and any build in progress, which may have
+        # read the histories before the change; the next search rebuilds it
+        with self.family_lock(family):
+            if os.path.exists(self.get_log_file(family)):
+                os.remove(self.get_log_file(family))
+            building_dir = self.get_building_dir(family)
+            if os.path.isdir(building_dir):
+                for name in os.listdir(building_dir):
+                    os.remove(os.path.join(building_dir, name))
+            self.cache.invalidate(family)
+
+    def build(self, family, load_histories):
+        # load_histories() -> {username: [transactions]} for every account in
+        # the family. Writes made while the histories load are collected in
+        # this build's file under <family>.building/ and replayed after the
+        # snapshot. The log is only put in place once it is complete, so a
+        # build that fails (or is dropped by forget) leaves no log behind.
+        log_file = self.get_log_file(family)
+        building_dir = self.get_building_dir(family)
+        build_file = os.path.join(building_dir, f"{int(time.time())}-{os.getpid()}-{threading.get_ident()}.jsonl")
+        with self.family_lock(family):
+            os.makedirs(building_dir, exist_ok=True)
+            for name in os.listdir(building_dir):
+                if time.time() - int(name.split("-", 1)[0]) > BUILD_TIMEOUT:
+                    os.remove(os.path.join(building_dir, name))
+            open(build_file, 'w').close()
+        try:
+            histories = load_histories()
+            with self.family_lock(family):
+                if os.path.exists(log_file) or not os.path.exists(build_file):
+                    # Another build finished first, or the index was forgotten meanwhile
+                    return
+                with open(build_file, 'r') as f:
+                    concurrent = [line for line in f if line.endswith("\n")]
+                self._write_log(family, histories, concurrent)
+        finally:
+            with self.family_lock(family):
+                if os.path.exists(build_file):
+                    os.remove(build_file)
+                if os.path.isdir(building_dir) and not os.listdir(building_dir):
+                    os.rmdir(building_dir)
+
+    def _write_log(self, family, histories, concurrent):
+        # Caller holds the family lock
+        log_file = self.get_log_file(family)
+        index = FamilyIndex()
+        tmp_file = log_file + ".tmp"
+        with open(tmp_file, 'w') as f:
+            for username, transactions in histories.items():
+                for transaction in transactions:
+                    record = {"op": "add", "username": username, "transaction": {
+                        key: transaction.get(key) for key in DOCUMENT_FIELDS
+                    }}
+                    f.write(json.dumps(record) + "\n")
+                    index.apply(record)
+            for line in concurrent:
+                f.write(line)
+                index.apply(json.loads(line))
+        os.replace(tmp_file, log_file)
+        self.cache.put(family, file_signature(log_file), index)
+
+    def load(self, family):
+        log_file = self.get_log_file(family)
+        signature = file_signature(log_file)
+        index = self.cache.get(family, signature)
+        if index is not None:
+            return index
+        index = FamilyIndex()
+        if signature is None:
+            # Forgotten while a build was running; the next search builds it again
+            return index
+        with open(log_file, 'r') as f:
+            for line in f:
+                # A torn last line from a crash mid-append is ignored
+                if line.endswith("\n"):
+                    index.apply(json.loads(line))
+        self.cache.put(family, signature, index)
+        return index
+
+    def search(self, family, query, limit=50, usernames=None):
+        return self.load(family).search(query, limit, usernames)
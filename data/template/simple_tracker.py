@@ -1,8 +1,9 @@
-from flask import Flask, render_template_string, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session
 import os
 import json
 import datetime
 import uuid
+from jinja2 import DictLoader, FileSystemBytecodeCache
 from werkzeug.security import generate_password_hash, check_password_hash
 
 app = Flask(__name__)
@@ -300,6 +301,21 @@ BASE_HTML = '''
 </html>
 '''
 
+# BASE_HTML is compiled once and kept in Jinja's template cache (and as bytecode
+# on disk for new worker processes) instead of being re-parsed on every render
+TEMPLATE_CACHE_DIR = os.path.join(DATA_DIR, "template_cache")
+if not os.path.exists(TEMPLATE_CACHE_DIR):
+    os.makedirs(TEMPLATE_CACHE_DIR)
+
+app.jinja_options = {
+    **app.jinja_options,
+    "loader": DictLoader({"base_html": BASE_HTML}),
+    # Named templates without an .html suffix are not autoescaped by default
+    "autoescape": True,
+    "bytecode_cache": FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+}
+app.jinja_env.get_template("base_html")
+
 # Routes
 @app.route('/')
 def index():
@@ -364,7 +380,7 @@ def index():
     </div>
     '''
     
-    return render_template_string(BASE_HTML, content=content)
+    return render_template("base_html", content=content)
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -499,7 +515,7 @@ def register():
     </script>
     '''
     
-    return render_template_string(BASE_HTML, content=content)
+    return render_template("base_html", content=content)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -550,7 +566,7 @@ def login():
     </div>
     '''
     
-    return render_template_string(BASE_HTML, content=content)
+    return render_template("base_html", content=content)
 
 @app.route('/logout')
 def logout():
@@ -748,7 +764,7 @@ def dashboard():
     </div>
     '''
     
-    return render_template_string(BASE_HTML, content=content)
+    return render_template("base_html", content=content)
 
 @app.route('/profile', methods=['GET', 'POST'])
 def profile():
@@ -886,7 +902,7 @@ def profile():
     </div>
     '''
     
-    return render_template_string(BASE_HTML, content=content, profile=user_data["profile"], parent_info=parent_info)
+    return render_template("base_html", content=content, profile=user_data["profile"], parent_info=parent_info)
 
 @app.route('/game_spending', methods=['GET', 'POST'])
 def game_spending():
@@ -1015,7 +1031,7 @@ def game_spending():
     </div>
     '''
     
-    return render_template_string(BASE_HTML, content=content, game_categories=GAME_CATEGORIES, game_platforms=GAME_PLATFORMS, profile=user_data["profile"], needs_approval=needs_approval)
+    return render_template("base_html", content=content, game_categories=GAME_CATEGORIES, game_platforms=GAME_PLATFORMS, profile=user_data["profile"], needs_approval=needs_approval)
 
 @app.route('/parent_approval')
 def parent_approval():
@@ -1145,7 +1161,7 @@ def parent_approval():
         </div>
         '''
     
-    return render_template_string(BASE_HTML, content=content, pending_transactions=pending_transactions)
+    return render_template("base_html", content=content, pending_transactions=pending_transactions)
 
 @app.route('/approve_transaction/<username>/<transaction_id>')
 def approve_transaction(username, transaction_id):
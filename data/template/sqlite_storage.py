@@ -0,0 +1,720 @@
+import os
+import json
+import queue
+import sqlite3
+import datetime
+import time
+import threading
+from contextlib import contextmanager
+
+from storage import (
+    default_profile, JsonStorage, daily_bucket_cutoff, exceeded_game_limit, game_spending_windows,
+    approver_for, needs_approval_entry, history_key, admit_transactions, empty_aggregates
+)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS profiles (
+        username TEXT PRIMARY KEY,
+        profile TEXT NOT NULL,
+        version INTEGER NOT NULL DEFAULT 0,
+        modified REAL NOT NULL DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS transactions (
+        id TEXT PRIMARY KEY,
+        username TEXT NOT NULL,
+        date TEXT NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT NOT NULL DEFAULT '',
+        game_platform TEXT NOT NULL DEFAULT '',
+        game_category TEXT NOT NULL DEFAULT '',
+        is_game_purchase INTEGER NOT NULL DEFAULT 1,
+        approved_by_parent INTEGER NOT NULL DEFAULT 1
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (username, date)',
+    # Keyset paging through a user's history by (date, id)
+    'CREATE INDEX IF NOT EXISTS idx_transactions_user_date_id ON transactions (username, date, id)',
+    'CREATE INDEX IF NOT EXISTS idx_transactions_user_approved ON transactions (username, approved_by_parent)',
+    # Running totals maintained on every write
+    '''CREATE TABLE IF NOT EXISTS user_totals (
+        username TEXT PRIMARY KEY,
+        total_spent REAL NOT NULL DEFAULT 0,
+        pending_count INTEGER NOT NULL DEFAULT 0
+    )''',
+    '''CREATE TABLE IF NOT EXISTS monthly_totals (
+        username TEXT NOT NULL,
+        month TEXT NOT NULL,
+        total REAL NOT NULL DEFAULT 0,
+        game_total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (username, month)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS daily_game_totals (
+        username TEXT NOT NULL,
+        day TEXT NOT NULL,
+        game_total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (username, day)
+    )''',
+    # Purchases waiting for approval, keyed by the approving parent
+    '''CREATE TABLE IF NOT EXISTS pending_approvals (
+        transaction_id TEXT PRIMARY KEY,
+        parent TEXT NOT NULL,
+        username TEXT NOT NULL,
+        name TEXT NOT NULL DEFAULT ''
+    )''',
+    'CREATE INDEX IF NOT EXISTS idx_pending_approvals_parent ON pending_approvals (parent)',
+    # Bumped whenever a parent's pending approvals change
+    '''CREATE TABLE IF NOT EXISTS family_versions (
+        parent TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        modified REAL NOT NULL DEFAULT 0
+    )''',
+]
+
+# Fills pending_approvals from existing data when the table is first created
+BACKFILL_PENDING_APPROVALS = '''
+    INSERT OR IGNORE INTO pending_approvals (transaction_id, parent, username, name)
+    SELECT t.id,
+           CASE WHEN json_extract(p.profile, '$.is_child_account')
+                     AND COALESCE(json_extract(p.profile, '$.parent_account'), '') != ''
+                THEN json_extract(p.profile, '$.parent_account') ELSE t.username END,
+           t.username,
+           COALESCE(NULLIF(json_extract(p.profile, '$.name'), ''), t.username)
+    FROM transactions t JOIN profiles p ON p.username = t.username
+    WHERE t.approved_by_parent = 0 AND t.is_game_purchase = 1
+'''
+
+TRANSACTION_COLUMNS = [
+    "id", "date", "amount", "description", "game_platform",
+    "game_category", "is_game_purchase", "approved_by_parent"
+]
+
+POOL_SIZE = 8
+
+
+def row_to_transaction(row):
+    transaction = dict(zip(TRANSACTION_COLUMNS, row))
+    transaction["is_game_purchase"] = bool(transaction["is_game_purchase"])
+    transaction["approved_by_parent"] = bool(transaction["approved_by_parent"])
+    return transaction
+
+
+class SQLiteStorage:
+    # Profiles and transactions in one indexed SQLite database (WAL mode).
+    # Each worker process keeps its own pool of connections. The optional
+    # columnar replica and search index are written inside the same write
+    # transaction, so writers of one database never interleave their updates.
+
+    def __init__(self, db_file, legacy_dir=None, replica=None, search=None, loader=None):
+        self.db_file = db_file
+        self.legacy_dir = legacy_dir
+        self.replica = replica
+        self.search = search
+        self.loader = loader
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        with self._connection() as conn:
+            upgrading = conn.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'user_totals'"
+            ).fetchone() and not conn.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'daily_game_totals'"
+            ).fetchone()
+            backfill = not conn.execute(
+                "SELECT name FROM sqlite_master WHERE name = 'pending_approvals'"
+            ).fetchone()
+            for statement in SCHEMA:
+                conn.execute(statement)
+            profile_columns = [row[1] for row in conn.execute("PRAGMA table_info(profiles)")]
+            if "version" not in profile_columns:
+                conn.execute("ALTER TABLE profiles ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            if "modified" not in profile_columns:
+                conn.execute("ALTER TABLE profiles ADD COLUMN modified REAL NOT NULL DEFAULT 0")
+            if backfill:
+                conn.execute(BACKFILL_PENDING_APPROVALS)
+            if upgrading:
+                # Totals from before daily buckets existed are rebuilt lazily per user
+                conn.execute("DELETE FROM user_totals")
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_file, timeout=30, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        # Connections must not cross a fork, so the pool is rebuilt per worker pid
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                self._pool = queue.LifoQueue(maxsize=POOL_SIZE)
+                self._pool_pid = os.getpid()
+            pool = self._pool
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._open()
+        try:
+            yield conn
+        finally:
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # Profiles
+
+    def _read_profile(self, conn, username):
+        row = conn.execute("SELECT profile FROM profiles WHERE username = ?", (username,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_profile(self, conn, username, profile):
+        # Every write bumps the user's data version
+        conn.execute(
+            "INSERT INTO profiles (username, profile, modified) VALUES (?, ?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET profile = excluded.profile, version = version + 1, "
+            "modified = excluded.modified",
+            (username, json.dumps(profile), time.time())
+        )
+
+    def _bump_version(self, conn, username):
+        conn.execute(
+            "UPDATE profiles SET version = version + 1, modified = ? WHERE username = ?",
+            (time.time(), username)
+        )
+
+    def _bump_family_version(self, conn, parent):
+        conn.execute(
+            "INSERT INTO family_versions (parent, version, modified) VALUES (?, 1, ?) "
+            "ON CONFLICT (parent) DO UPDATE SET version = version + 1, modified = excluded.modified",
+            (parent, time.time())
+        )
+
+    def _insert_transactions(self, conn, username, transactions):
+        conn.executemany(
+            "INSERT OR REPLACE INTO transactions (username, " + ", ".join(TRANSACTION_COLUMNS) + ") "
+            "VALUES (?, " + ", ".join("?" * len(TRANSACTION_COLUMNS)) + ")",
+            [
+                (username, t["id"], t["date"], t["amount"], t.get("description", ""),
+                 t.get("game_platform", ""), t.get("game_category", ""),
+                 int(t.get("is_game_purchase", False)), int(t.get("approved_by_parent", True)))
+                for t in transactions
+            ]
+        )
+
+    def _count_transaction(self, conn, username, transaction, sign=1):
+        # Add (sign=1) or remove (sign=-1) one transaction's share of the running totals
+        amount = transaction["amount"] * sign
+        game_amount = amount if transaction.get("is_game_purchase", False) else 0
+        pending = sign if not transaction.get("approved_by_parent", True) else 0
+        conn.execute(
+            "INSERT INTO user_totals (username, total_spent, pending_count) VALUES (?, ?, ?) "
+            "ON CONFLICT (username) DO UPDATE SET "
+            "total_spent = round(total_spent + excluded.total_spent, 2), "
+            "pending_count = pending_count + excluded.pending_count",
+            (username, amount, pending)
+        )
+        conn.execute(
+            "INSERT INTO monthly_totals (username, month, total, game_total) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (username, month) DO UPDATE SET "
+            "total = round(total + excluded.total, 2), "
+            "game_total = round(game_total + excluded.game_total, 2)",
+            (username, transaction["date"][:7], amount, game_amount)
+        )
+        day = transaction["date"][:10]
+        if game_amount and day >= daily_bucket_cutoff():
+            conn.execute(
+                "INSERT INTO daily_game_totals (username, day, game_total) VALUES (?, ?, ?) "
+                "ON CONFLICT (username, day) DO UPDATE SET "
+                "game_total = round(game_total + excluded.game_total, 2)",
+                (username, day, game_amount)
+            )
+
+    def _rebuild_aggregates(self, conn, username):
+        conn.execute("DELETE FROM user_totals WHERE username = ?", (username,))
+        conn.execute("DELETE FROM monthly_totals WHERE username = ?", (username,))
+        conn.execute("DELETE FROM daily_game_totals WHERE username = ?", (username,))
+        conn.execute(
+            "INSERT INTO user_totals (username, total_spent, pending_count) "
+            "SELECT ?, round(COALESCE(SUM(amount), 0), 2), COALESCE(SUM(approved_by_parent = 0), 0) "
+            "FROM transactions WHERE username = ?",
+            (username, username)
+        )
+        conn.execute(
+            "INSERT INTO monthly_totals (username, month, total, game_total) "
+            "SELECT username, substr(date, 1, 7), round(SUM(amount), 2), "
+            "round(SUM(CASE WHEN is_game_purchase THEN amount ELSE 0 END), 2) "
+            "FROM transactions WHERE username = ? GROUP BY substr(date, 1, 7)",
+            (username,)
+        )
+        conn.execute(
+            "INSERT INTO daily_game_totals (username, day, game_total) "
+            "SELECT username, substr(date, 1, 10), round(SUM(amount), 2) "
+            "FROM transactions WHERE username = ? AND is_game_purchase AND date >= ? "
+            "GROUP BY substr(date, 1, 10)",
+            (username, daily_bucket_cutoff())
+        )
+
+    def _index_pending(self, conn, username, profile, transactions):
+        parent = approver_for(username, profile)
+        rows = [
+            (t["id"], parent, username, profile.get("name") or username)
+            for t in transactions if needs_approval_entry(t)
+        ]
+        if rows:
+            conn.executemany(
+                "INSERT OR REPLACE INTO pending_approvals (transaction_id, parent, username, name) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._bump_family_version(conn, parent)
+
+    def _unindex_pending(self, conn, column, value):
+        # Drop pending entries by transaction_id or username, bumping each affected parent
+        parents = [row[0] for row in conn.execute(
+            f"SELECT DISTINCT parent FROM pending_approvals WHERE {column} = ?", (value,)
+        )]
+        conn.execute(f"DELETE FROM pending_approvals WHERE {column} = ?", (value,))
+        for parent in parents:
+            self._bump_family_version(conn, parent)
+
+    def _import_legacy(self, username):
+        # Pull in files written by the JSON engine the first time the user is seen
+        if not self.legacy_dir:
+            return None
+        json_storage = JsonStorage(self.legacy_dir, cache_size=0)
+        if not (os.path.exists(json_storage.get_profile_file(username)) or
+                os.path.exists(json_storage.get_user_file(username))):
+            return None
+        data = json_storage.load_user_data(username)
+        with self._transaction() as conn:
+            if self._read_profile(conn, username) is None:
+                self._write_profile(conn, username, data["profile"])
+                self._insert_transactions(conn, username, data["transactions"])
+                self._rebuild_aggregates(conn, username)
+                self._index_pending(conn, username, data["profile"], data["transactions"])
+        return data["profile"]
+
+    def load_profile(self, username):
+        with self._connection() as conn:
+            profile = self._read_profile(conn, username)
+        if profile is None:
+            profile = self._import_legacy(username)
+        return profile if profile is not None else default_profile()
+
+    def save_profile(self, username, profile):
+        with self._transaction() as conn:
+            self._write_profile(conn, username, profile)
+
+    def update_profile(self, username, update):
+        self.load_profile(username)
+        with self._transaction() as conn:
+            profile = self._read_profile(conn, username) or default_profile()
+            update(profile)
+            self._write_profile(conn, username, profile)
+            return profile
+
+    def load_user_data(self, username):
+        profile = self.load_profile(username)
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT " + ", ".join(TRANSACTION_COLUMNS) + " FROM transactions "
+                "WHERE username = ? ORDER BY date, rowid",
+                (username,)
+            ).fetchall()
+        return {
+            "profile": profile,
+            "transactions": [row_to_transaction(row) for row in rows]
+        }
+
+    def save_user_data(self, username, data):
+        with self._transaction() as conn:
+            self._write_profile(conn, username, data["profile"])
+            conn.execute("DELETE FROM transactions WHERE username = ?", (username,))
+            self._unindex_pending(conn, "username", username)
+            self._insert_transactions(conn, username, data["transactions"])
+            self._rebuild_aggregates(conn, username)
+            self._index_pending(conn, username, data["profile"], data["transactions"])
+            if self.replica:
+                self.replica.rebuild(username, data["transactions"])
+            if self.search:
+                self.search.forget(approver_for(username, data["profile"]))
+
+    def data_version(self, username):
+        # Changes whenever the profile or the transaction history does
+        self.load_profile(username)
+        with self._connection() as conn:
+            row = conn.execute("SELECT version FROM profiles WHERE username = ?", (username,)).fetchone()
+        return row[0] if row else 0
+
+    def version_info(self, username):
+        # Validators for the user's pages in one primary-key lookup: the user's
+        # data version, the family version (bumped whenever anything waiting
+        # for this user's approval changes) and the time either last changed
+        query = (
+            "SELECT p.version, p.modified, f.version, f.modified FROM profiles p "
+            "LEFT JOIN family_versions f ON f.parent = p.username WHERE p.username = ?"
+        )
+        with self._connection() as conn:
+            row = conn.execute(query, (username,)).fetchone()
+        if row is None:
+            self.load_profile(username)  # imports a legacy JSON document if needed
+            with self._connection() as conn:
+                row = conn.execute(query, (username,)).fetchone()
+        if row is None:
+            return {"user": 0, "family": None, "modified": None}
+        modified = max(row[1], row[3] or 0)
+        return {"user": row[0], "family": row[2], "modified": modified or None}
+
+    def load_aggregates(self, username):
+        total_spent, pending_count = self._user_totals(username)
+        with self._connection() as conn:
+            months = conn.execute(
+                "SELECT month, total, game_total FROM monthly_totals WHERE username = ?", (username,)
+            ).fetchall()
+            days = conn.execute(
+                "SELECT day, game_total FROM daily_game_totals WHERE username = ? AND day >= ?",
+                (username, daily_bucket_cutoff())
+            ).fetchall()
+        return {
+            "total_spent": total_spent,
+            "monthly": {month: total for month, total, _ in months},
+            "monthly_game": {month: game_total for month, _, game_total in months},
+            "daily_game": dict(days),
+            "pending_count": pending_count
+        }
+
+    def _window_aggregates(self, conn, username, day):
+        # Just the buckets the limit windows ending on `day` read
+        week_start = (datetime.date.fromisoformat(day) - datetime.timedelta(days=6)).isoformat()
+        days = conn.execute(
+            "SELECT day, game_total FROM daily_game_totals WHERE username = ? AND day >= ? AND day <= ?",
+            (username, week_start, day)
+        ).fetchall()
+        month = conn.execute(
+            "SELECT game_total FROM monthly_totals WHERE username = ? AND month = ?",
+            (username, day[:7])
+        ).fetchone()
+        return {"daily_game": dict(days), "monthly_game": {day[:7]: month[0] if month else 0}}
+
+    def _batch_aggregates(self, conn, username, transactions):
+        # The buckets the limit windows of a whole batch read, as an aggregates dict
+        days = sorted(t["date"][:10] for t in transactions)
+        week_start = (datetime.date.fromisoformat(days[0]) - datetime.timedelta(days=6)).isoformat()
+        aggregates = empty_aggregates()
+        aggregates["daily_game"] = dict(conn.execute(
+            "SELECT day, game_total FROM daily_game_totals WHERE username = ? AND day >= ? AND day <= ?",
+            (username, week_start, days[-1])
+        ))
+        aggregates["monthly_game"] = dict(conn.execute(
+            "SELECT month, game_total FROM monthly_totals WHERE username = ? AND month >= ? AND month <= ?",
+            (username, days[0][:7], days[-1][:7])
+        ))
+        return aggregates
+
+    def rebuild_aggregates(self, username):
+        with self._transaction() as conn:
+            self._rebuild_aggregates(conn, username)
+
+    def usernames(self):
+        with self._connection() as conn:
+            return [row[0] for row in conn.execute("SELECT username FROM profiles")]
+
+    def cache_stats(self):
+        # Nothing is cached in process; SQLite keeps its own page cache
+        return {}
+
+    def compact_all(self):
+        # Fold the write-ahead log back into the main database file
+        with self._connection() as conn:
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    # Transactions
+
+    def add_transaction(self, username, transaction, limits=None):
+        # The limit check and the insert share one write transaction, so two
+        # concurrent purchases cannot both slip under a limit.
+        # Returns the exceeded limit window, or None once the purchase is added.
+        self.load_profile(username)  # imports a legacy JSON document if needed
+        self._user_totals(username)
+        with self._transaction() as conn:
+            exceeded = exceeded_game_limit(
+                self._window_aggregates(conn, username, transaction["date"][:10]), transaction, limits
+            )
+            if exceeded:
+                return exceeded
+            profile = self._read_profile(conn, username) or default_profile()
+            profile["account_balance"] -= transaction["amount"]
+            self._write_profile(conn, username, profile)
+            self._insert_transactions(conn, username, [transaction])
+            self._count_transaction(conn, username, transaction)
+            self._index_pending(conn, username, profile, [transaction])
+            if self.replica:
+                self.replica.append(username, [transaction])
+            if self.search:
+                self.search.add(approver_for(username, profile), username, transaction)
+        return None
+
+    def add_transactions(self, username, transactions, limits=None, charge_balance=True):
+        # Batch form of add_transaction, in one write transaction. The limits
+        # are checked purchase by purchase, counting the earlier ones in the batch.
+        # charge_balance=False leaves the account balance alone (imported history).
+        # Returns (added transactions, {position in the batch: exceeded window}).
+        if not transactions:
+            return [], {}
+        self.load_profile(username)  # imports a legacy JSON document if needed
+        self._user_totals(username)
+        with self._transaction() as conn:
+            added, exceeded = admit_transactions(
+                self._batch_aggregates(conn, username, transactions), transactions, limits
+            )
+            if not added:
+                return added, exceeded
+            profile = self._read_profile(conn, username) or default_profile()
+            if charge_balance:
+                profile["account_balance"] -= sum(t["amount"] for t in added)
+            self._write_profile(conn, username, profile)
+            self._insert_transactions(conn, username, added)
+            for transaction in added:
+                self._count_transaction(conn, username, transaction)
+            self._index_pending(conn, username, profile, added)
+            if self.replica:
+                self.replica.append(username, added)
+            if self.search:
+                self.search.add_many(approver_for(username, profile), username, added)
+        return added, exceeded
+
+    def approve_transaction(self, username, transaction_id):
+        self.load_profile(username)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT approved_by_parent FROM transactions WHERE id = ? AND username = ?",
+                (transaction_id, username)
+            ).fetchone()
+            if row is None:
+                return False
+            if not row[0]:
+                conn.execute("UPDATE transactions SET approved_by_parent = 1 WHERE id = ?", (transaction_id,))
+                conn.execute(
+                    "UPDATE user_totals SET pending_count = pending_count - 1 WHERE username = ?",
+                    (username,)
+                )
+                self._unindex_pending(conn, "transaction_id", transaction_id)
+                self._bump_version(conn, username)
+                if self.replica:
+                    self.replica.approve(username, transaction_id)
+            return True
+
+    def deny_transaction(self, username, transaction_id):
+        self.load_profile(username)
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT " + ", ".join(TRANSACTION_COLUMNS) + " FROM transactions WHERE id = ? AND username = ?",
+                (transaction_id, username)
+            ).fetchone()
+            if row is None:
+                return None
+            transaction = row_to_transaction(row)
+            conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+            self._unindex_pending(conn, "transaction_id", transaction_id)
+            if self.replica:
+                self.replica.remove(username, transaction_id)
+            self._count_transaction(conn, username, transaction, -1)
+            profile = self._read_profile(conn, username) or default_profile()
+            if self.search:
+                self.search.remove(approver_for(username, profile), transaction_id)
+            profile["account_balance"] += transaction["amount"]
+            self._write_profile(conn, username, profile)
+            return transaction
+
+    def decide_transactions(self, username, decisions):
+        # Batch form of approve_transaction and deny_transaction for one account,
+        # in one write transaction. decisions is [(transaction_id, "approve" or
+        # "deny")]. Returns {transaction_id: "approved", "denied" or
+        # "not_found"}; only the first decision for an id counts.
+        self.load_profile(username)
+        with self._transaction() as conn:
+            profile = self._read_profile(conn, username) or default_profile()
+            results, denied, approved = {}, [], 0
+            for transaction_id, action in decisions:
+                if transaction_id in results:
+                    continue
+                row = conn.execute(
+                    "SELECT " + ", ".join(TRANSACTION_COLUMNS) + " FROM transactions WHERE id = ? AND username = ?",
+                    (transaction_id, username)
+                ).fetchone()
+                if row is None:
+                    results[transaction_id] = "not_found"
+                    continue
+                transaction = row_to_transaction(row)
+                if action == "approve":
+                    results[transaction_id] = "approved"
+                    if transaction["approved_by_parent"]:
+                        continue
+                    conn.execute("UPDATE transactions SET approved_by_parent = 1 WHERE id = ?", (transaction_id,))
+                    conn.execute(
+                        "UPDATE user_totals SET pending_count = pending_count - 1 WHERE username = ?",
+                        (username,)
+                    )
+                    if self.replica:
+                        self.replica.approve(username, transaction_id)
+                    approved += 1
+                else:
+                    results[transaction_id] = "denied"
+                    conn.execute("DELETE FROM transactions WHERE id = ?", (transaction_id,))
+                    if self.replica:
+                        self.replica.remove(username, transaction_id)
+                    self._count_transaction(conn, username, transaction, -1)
+                    profile["account_balance"] += transaction["amount"]
+                    denied.append(transaction_id)
+                self._unindex_pending(conn, "transaction_id", transaction_id)
+            if denied:
+                if self.search:
+                    self.search.remove_many(approver_for(username, profile), denied)
+                self._write_profile(conn, username, profile)
+            elif approved:
+                self._bump_version(conn, username)
+            return results
+
+    def recent_transactions(self, username, limit):
+        return self.transaction_page(username, limit)[0]
+
+    def transaction_page(self, username, limit, before=None, filters=None):
+        # One page of the history, newest first, and the (date, id) key to pass
+        # as `before` for the next page (None on the last page)
+        filters = filters or {}
+        where = ["username = ?"]
+        params = [username]
+        if before is not None:
+            where.append("(date, id) < (?, ?)")
+            params.extend(before)
+        if filters.get("date_from"):
+            where.append("date >= ?")
+            params.append(filters["date_from"])
+        if filters.get("date_to"):
+            where.append("date < ?")
+            params.append((datetime.date.fromisoformat(filters["date_to"]) + datetime.timedelta(days=1)).isoformat())
+        if filters.get("platform"):
+            where.append("game_platform = ?")
+            params.append(filters["platform"])
+        if filters.get("category"):
+            where.append("game_category = ?")
+            params.append(filters["category"])
+        if filters.get("status") == "approved":
+            where.append("approved_by_parent = 1")
+        elif filters.get("status") == "pending":
+            where.append("is_game_purchase = 1 AND approved_by_parent = 0")
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT " + ", ".join(TRANSACTION_COLUMNS) + " FROM transactions "
+                "WHERE " + " AND ".join(where) + " ORDER BY date DESC, id DESC LIMIT ?",
+                params + [limit + 1]
+            ).fetchall()
+        transactions = [row_to_transaction(row) for row in rows]
+        if len(transactions) <= limit:
+            return transactions, None
+        transactions = transactions[:limit]
+        return transactions, history_key(transactions[-1])
+
+    def _user_totals(self, username):
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT total_spent, pending_count FROM user_totals WHERE username = ?", (username,)
+            ).fetchone()
+        if row is None:
+            # Databases created before running totals existed get them once
+            self.rebuild_aggregates(username)
+            return self._user_totals(username)
+        return row
+
+    def spending_totals(self, username, month):
+        # (lifetime total, total for the given YYYY-MM month), both primary-key lookups
+        total_spent = self._user_totals(username)[0]
+        with self._connection() as conn:
+            row = conn.execute(
+                "SELECT total FROM monthly_totals WHERE username = ? AND month = ?", (username, month)
+            ).fetchone()
+        return total_spent, row[0] if row else 0
+
+    def game_spending_windows(self, username, day):
+        self._user_totals(username)
+        with self._connection() as conn:
+            return game_spending_windows(self._window_aggregates(conn, username, day), day)
+
+    def pending_count(self, username):
+        return self._user_totals(username)[1]
+
+    def pending_transactions(self, username):
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT " + ", ".join(TRANSACTION_COLUMNS) + " FROM transactions "
+                "WHERE username = ? AND approved_by_parent = 0 AND is_game_purchase = 1 "
+                "ORDER BY date",
+                (username,)
+            ).fetchall()
+        return [row_to_transaction(row) for row in rows]
+
+    def pending_approvals(self, parent):
+        # Everything waiting for this parent's approval, from the index
+        with self._connection() as conn:
+            rows = conn.execute(
+                "SELECT a.username, a.name, " + ", ".join("t." + c for c in TRANSACTION_COLUMNS) + " "
+                "FROM pending_approvals a JOIN transactions t ON t.id = a.transaction_id "
+                "WHERE a.parent = ? ORDER BY t.date",
+                (parent,)
+            ).fetchall()
+        return [
+            {"username": row[0], "name": row[1], "transaction": row_to_transaction(row[2:])}
+            for row in rows
+        ]
+
+    def pending_approval_count(self, parent):
+        with self._connection() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM pending_approvals WHERE parent = ?", (parent,)
+            ).fetchone()[0]
+
+    def transaction_columns(self, username):
+        # Memory-mapped columns from the analytics replica, built on first use
+        columns = self.replica.load(username)
+        if columns is None:
+            self.rebuild_columns(username)
+            columns = self.replica.load(username)
+        return columns
+
+    def rebuild_columns(self, username):
+        self.load_profile(username)  # imports a legacy JSON document if needed
+        with self._transaction() as conn:
+            rows = conn.execute(
+                "SELECT " + ", ".join(TRANSACTION_COLUMNS) + " FROM transactions "
+                "WHERE username = ? ORDER BY date, rowid",
+                (username,)
+            ).fetchall()
+            self.replica.rebuild(username, [row_to_transaction(row) for row in rows])
+
+    def _load_histories(self, usernames):
+        # {username: transactions}, read concurrently when a family loader is configured
+        def load(username):
+            return self.load_user_data(username)["transactions"]
+        if self.loader:
+            return self.loader.load_all(load, usernames)
+        return {username: load(username) for username in usernames}
+
+    def search_transactions(self, username, query, limit=50):
+        # Purchases whose descriptions match the query, from the family's index.
+        # Parents search their whole family, children only their own purchases.
+        profile = self.load_profile(username)
+        family = approver_for(username, profile)
+        if not self.search.has(family):
+            members = [family] + self.load_profile(family).get("child_accounts", [])
+            self.search.build(family, lambda: self._load_histories(members))
+        usernames = None if family == username else {username}
+        return self.search.search(family, query, limit, usernames)
@@ -0,0 +1,1127 @@
+import os
+import copy
+import json
+import time
+import datetime
+import bisect
+import heapq
+import threading
+from contextlib import contextmanager
+
+from user_cache import UserDocumentCache
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# The journal is folded back into the snapshot once it grows past this size
+JOURNAL_COMPACT_BYTES = 256 * 1024
+
+# Bumped whenever the shape of the running totals changes; older ones are rebuilt
+AGGREGATES_VERSION = 2
+
+# In-memory histories drop their tombstones once they make up this share of the slots
+TOMBSTONE_COMPACT_RATIO = 0.25
+
+# Daily game-spending buckets are kept long enough for the weekly window
+DAILY_BUCKET_DAYS = 35
+
+# Spending-limit windows checked on every purchase, and the profile field holding each limit
+GAME_LIMIT_FIELDS = {
+    "daily": "game_spending_limit_daily",
+    "weekly": "game_spending_limit_weekly",
+    "monthly": "game_spending_limit",
+}
+
+
+def default_profile():
+    return {
+        "name": "",
+        "account_balance": 0,
+        "monthly_budget": 0,
+        "parent_email": "",
+        "parent_mode": False,
+        "game_spending_limit": 0,
+        "child_name": "",
+        "is_child_account": False,
+        "parent_account": ""
+    }
+
+
+def default_user_data():
+    return {
+        "profile": default_profile(),
+        "transactions": []
+    }
+
+
+def empty_aggregates():
+    return {
+        "version": AGGREGATES_VERSION,
+        "total_spent": 0,
+        "monthly": {},       # YYYY-MM -> total spent
+        "monthly_game": {},  # YYYY-MM -> game purchases, approved or pending
+        "daily_game": {},    # YYYY-MM-DD -> game purchases, last DAILY_BUCKET_DAYS days only
+        "pending_count": 0
+    }
+
+
+def daily_bucket_cutoff():
+    return (datetime.date.today() - datetime.timedelta(days=DAILY_BUCKET_DAYS)).isoformat()
+
+
+def count_transaction(aggregates, transaction, sign=1):
+    # Add (sign=1) or remove (sign=-1) one transaction's share of the running totals
+    amount = transaction["amount"] * sign
+    month = transaction["date"][:7]
+    aggregates["total_spent"] = round(aggregates["total_spent"] + amount, 2)
+    aggregates["monthly"][month] = round(aggregates["monthly"].get(month, 0) + amount, 2)
+    if transaction.get("is_game_purchase", False):
+        aggregates["monthly_game"][month] = round(aggregates["monthly_game"].get(month, 0) + amount, 2)
+        day = transaction["date"][:10]
+        cutoff = daily_bucket_cutoff()
+        if day >= cutoff:
+            daily_game = aggregates["daily_game"]
+            daily_game[day] = round(daily_game.get(day, 0) + amount, 2)
+            for old_day in [d for d in daily_game if d < cutoff]:
+                del daily_game[old_day]
+    if not transaction.get("approved_by_parent", True):
+        aggregates["pending_count"] += sign
+
+
+def game_limits(profile):
+    # {window: limit} for every limit the profile sets (0 means no limit)
+    limits = {}
+    for window, field in GAME_LIMIT_FIELDS.items():
+        if profile.get(field, 0) > 0:
+            limits[window] = profile[field]
+    return limits
+
+
+def game_spending_windows(aggregates, day):
+    # Game spending in each limit window ending on the given YYYY-MM-DD:
+    # the day itself, the rolling 7 days up to it, and its calendar month
+    end = datetime.date.fromisoformat(day)
+    week = [(end - datetime.timedelta(days=i)).isoformat() for i in range(7)]
+    daily_game = aggregates["daily_game"]
+    return {
+        "daily": daily_game.get(day, 0),
+        "weekly": round(sum(daily_game.get(d, 0) for d in week), 2),
+        "monthly": aggregates["monthly_game"].get(day[:7], 0)
+    }
+
+
+def exceeded_game_limit(aggregates, transaction, limits):
+    # Name of the first limit window this purchase would push over, or None
+    if not limits or not transaction.get("is_game_purchase", False):
+        return None
+    spent = game_spending_windows(aggregates, transaction["date"][:10])
+    for window, limit in limits.items():
+        if spent[window] + transaction["amount"] > limit:
+            return window
+    return None
+
+
+def admit_transactions(aggregates, transactions, limits):
+    # Splits a batch of purchases into those that fit under the limits, each
+    # counted into `aggregates` before the next is checked, and
+    # {position in the batch: exceeded limit window} for the rest
+    added, exceeded = [], {}
+    for position, transaction in enumerate(transactions):
+        window = exceeded_game_limit(aggregates, transaction, limits)
+        if window:
+            exceeded[position] = window
+        else:
+            count_transaction(aggregates, transaction)
+            added.append(transaction)
+    return added, exceeded
+
+
+def build_aggregates(transactions):
+    aggregates = empty_aggregates()
+    for transaction in transactions:
+        count_transaction(aggregates, transaction)
+    return aggregates
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def get_storage(engine, data_dir, **options):
+    # Pick the storage engine named in the app configuration
+    if engine == "json":
+        return JsonStorage(
+            data_dir,
+            cache_size=options.get("cache_size", 256),
+            cache_validation=options.get("cache_validation", "stat"),
+            replica=options.get("replica"),
+            search=options.get("search"),
+            loader=options.get("loader")
+        )
+    if engine == "sqlite":
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage(
+            options.get("db_file") or os.path.join(data_dir, "game_tracker.db"), data_dir,
+            replica=options.get("replica"),
+            search=options.get("search"),
+            loader=options.get("loader")
+        )
+    raise ValueError(f"Unknown storage engine: {engine}")
+
+
+def history_filters(filters):
+    # History page filters -> (predicate, first date, end date, index). The date
+    # range is inclusive and found by bisecting the sorted keys. index is the
+    # (field, value) whose own key list is walked instead of the whole history
+    # (platform, else category, else pending status); the predicate still
+    # checks every filter on the transactions it yields.
+    filters = filters or {}
+    since = filters.get("date_from") or None
+    until = None
+    if filters.get("date_to"):
+        until = (datetime.date.fromisoformat(filters["date_to"]) + datetime.timedelta(days=1)).isoformat()
+    checks = []
+    if filters.get("platform"):
+        checks.append(lambda t: t.get("game_platform") == filters["platform"])
+    if filters.get("category"):
+        checks.append(lambda t: t.get("game_category") == filters["category"])
+    if filters.get("status") == "approved":
+        checks.append(lambda t: t.get("approved_by_parent", True))
+    elif filters.get("status") == "pending":
+        checks.append(needs_approval_entry)
+    match = (lambda t: all(check(t) for check in checks)) if checks else None
+    index = None
+    if filters.get("platform"):
+        index = ("game_platform", filters["platform"])
+    elif filters.get("category"):
+        index = ("game_category", filters["category"])
+    elif filters.get("status") == "pending":
+        index = ("approved_by_parent", False)
+    return match, since, until, index
+
+
+def history_key(transaction):
+    # Position in the newest-first history: (date, id)
+    return transaction.get("date", ""), transaction.get("id") or ""
+
+
+def drop_sorted(keys, key):
+    # Remove a key from a sorted key list, found by bisection
+    i = bisect.bisect_left(keys, key)
+    if i < len(keys) and keys[i] == key:
+        del keys[i]
+
+
+class TransactionLog:
+    # A user's transaction history with an id -> slot index, so a single
+    # transaction is found without scanning. Removing one leaves a tombstone
+    # (None) in its slot instead of shifting the rest of the list; the slots
+    # are compacted once tombstones pile up. A (date, id)-ordered key list is
+    # built on first use for paging through the history, and one per filtered
+    # field value for filtered pages.
+
+    def __init__(self, transactions=()):
+        self.slots = list(transactions)
+        self.positions = {t.get("id"): i for i, t in enumerate(self.slots)}
+        self.tombstones = 0
+        self._live = None
+        self._by_date = None
+        self._by_field = {}  # (field, value) -> sorted keys of the transactions with it
+
+    def __len__(self):
+        return len(self.positions)
+
+    def __contains__(self, transaction_id):
+        return transaction_id in self.positions
+
+    def get(self, transaction_id):
+        i = self.positions.get(transaction_id)
+        return None if i is None else self.slots[i]
+
+    def append(self, transaction):
+        self.positions[transaction.get("id")] = len(self.slots)
+        self.slots.append(transaction)
+        if self._live is not None:
+            self._live.append(transaction)
+        # A new purchase is usually the newest and extends the sorted keys.
+        # Anything older (imported history) drops them instead, so they are
+        # sorted once on next use rather than shifted for every insert.
+        key = history_key(transaction)
+        if self._by_date is not None:
+            if not self._by_date or key >= self._by_date[-1]:
+                self._by_date.append(key)
+            else:
+                self._by_date = None
+        for (field, value), keys in list(self._by_field.items()):
+            if transaction.get(field) == value:
+                if not keys or key >= keys[-1]:
+                    keys.append(key)
+                else:
+                    del self._by_field[(field, value)]
+
+    def remove(self, transaction_id):
+        i = self.positions.pop(transaction_id, None)
+        if i is None:
+            return None
+        transaction = self.slots[i]
+        self.slots[i] = None
+        self.tombstones += 1
+        self._live = None
+        key = history_key(transaction)
+        if self._by_date is not None:
+            drop_sorted(self._by_date, key)
+        for (field, value), keys in self._by_field.items():
+            if transaction.get(field) == value:
+                drop_sorted(keys, key)
+        if self.tombstones > len(self.slots) * TOMBSTONE_COMPACT_RATIO:
+            self.compact()
+        return transaction
+
+    def approve(self, transaction_id):
+        # The transaction also leaves the pending-status key list
+        transaction = self.get(transaction_id)
+        if transaction is None:
+            return None
+        keys = self._by_field.get(("approved_by_parent", False))
+        if keys is not None:
+            drop_sorted(keys, history_key(transaction))
+        transaction["approved_by_parent"] = True
+        return transaction
+
+    def compact(self):
+        self.slots = list(self.live())
+        self.positions = {t.get("id"): i for i, t in enumerate(self.slots)}
+        self.tombstones = 0
+        self._by_date = None
+        self._by_field = {}
+
+    def live(self):
+        # The transactions without tombstones, in insertion order
+        if self._live is None:
+            self._live = [t for t in self.slots if t is not None]
+        return self._live
+
+    def _sorted_keys(self, index=None):
+        if index is None:
+            if self._by_date is None:
+                self._by_date = sorted(history_key(t) for t in self.live())
+            return self._by_date
+        if index not in self._by_field:
+            field, value = index
+            self._by_field[index] = sorted(history_key(t) for t in self.live() if t.get(field) == value)
+        return self._by_field[index]
+
+    def page(self, limit, before=None, match=None, since=None, until=None, index=None):
+        # Up to `limit` transactions, newest first, strictly older than the
+        # `before` (date, id) key and dated in [since, until). Only the keys of
+        # `index` are walked when given. Entries of removed or changed
+        # transactions are skipped.
+        keys = self._by_date if index is None else self._by_field.get(index)
+        if keys is None and before is None:
+            # First page before anything is sorted: pick the newest matches
+            # in one pass instead of sorting the whole history
+            return heapq.nlargest(limit, (
+                t for t in self.live()
+                if (since is None or t.get("date", "") >= since)
+                and (until is None or t.get("date", "") < until)
+                and (match is None or match(t))
+            ), key=history_key)
+        keys = self._sorted_keys(index)
+        hi = len(keys) if before is None else bisect.bisect_left(keys, tuple(before))
+        if until is not None:
+            hi = min(hi, bisect.bisect_left(keys, (until,)))
+        lo = 0 if since is None else bisect.bisect_left(keys, (since,))
+        results = []
+        for i in range(hi - 1, lo - 1, -1):
+            transaction = self.get(keys[i][1])
+            if transaction is None or history_key(transaction) != keys[i]:
+                continue
+            if match is None or match(transaction):
+                results.append(transaction)
+                if len(results) == limit:
+                    break
+        return results
+
+
+def replay_journal(log, records):
+    # Apply journal records on top of a transaction snapshot and return the
+    # balance change they imply. Records already reflected in the snapshot
+    # (after an interrupted compaction) are skipped.
+    balance_change = 0
+    for record in records:
+        op = record["op"]
+        if op == "add":
+            transaction = record["transaction"]
+            if transaction["id"] in log:
+                continue
+            log.append(transaction)
+            balance_change -= transaction["amount"]
+        elif op == "approve":
+            log.approve(record["id"])
+        elif op == "deny":
+            transaction = log.remove(record["id"])
+            if transaction is not None:
+                balance_change += transaction["amount"]
+    return balance_change
+
+
+def changes_pending(entry):
+    # Whether a journal record adds or settles a purchase waiting for approval
+    if entry["op"] == "add":
+        return needs_approval_entry(entry["transaction"])
+    if entry["op"] == "approve":
+        return entry.get("pending", False)
+    return entry["op"] == "deny" and needs_approval_entry(entry["transaction"])
+
+
+def apply_journal(record, records):
+    # Fold journal records into a profile record: the balance change each one
+    # carries, the running totals and the data version. pending_seq is the
+    # last record that changed the account's pending purchases. Only records newer
+    # than the record's journal_seq count; records without a sequence number
+    # were written when every change also rewrote the record.
+    for entry in records:
+        if entry.get("seq", 0) <= record.get("journal_seq", 0):
+            continue
+        record["profile"]["account_balance"] += entry.get("balance", 0)
+        if entry["op"] == "add":
+            count_transaction(record["aggregates"], entry["transaction"])
+        elif entry["op"] == "approve" and entry.get("pending"):
+            record["aggregates"]["pending_count"] -= 1
+        elif entry["op"] == "deny":
+            count_transaction(record["aggregates"], entry["transaction"], -1)
+        if changes_pending(entry):
+            record["pending_seq"] = entry["seq"]
+        record["journal_seq"] = entry["seq"]
+        record["data_version"] = record.get("data_version", 0) + 1
+        record["modified"] = entry["at"]
+
+
+def approver_for(username, profile):
+    # Purchases on a child account are approved by the parent, others by the account itself
+    if profile.get("is_child_account", False) and profile.get("parent_account"):
+        return profile["parent_account"]
+    return username
+
+
+def needs_approval_entry(transaction):
+    return transaction.get("is_game_purchase", False) and not transaction.get("approved_by_parent", True)
+
+
+def pending_entry(username, profile, transaction):
+    # What the approval page shows for one pending purchase
+    return {
+        "username": username,
+        "name": profile.get("name") or username,
+        "transaction": {
+            key: transaction.get(key)
+            for key in ["id", "date", "amount", "description", "game_platform", "game_category"]
+        }
+    }
+
+
+# Snapshot offsets are stored as this many zero-padded digits in the index file
+OFFSET_DIGITS = 12
+
+
+def write_offset_index(f, snapshot, offsets):
+    # A JSON header naming the snapshot, then one fixed-width record per
+    # transaction sorted by id: the JSON-encoded id padded with spaces and its
+    # byte offset. Encoded ids are ASCII and never a prefix of one another, so
+    # the padded records sort like the ids and can be binary searched.
+    keys = sorted((json.dumps(transaction_id), offset) for transaction_id, offset in offsets.items())
+    width = max((len(key) for key, _ in keys), default=0)
+    f.write(json.dumps({"snapshot": snapshot, "width": width}) + "\n")
+    for key, offset in keys:
+        f.write(f"{key:<{width}}{offset:0{OFFSET_DIGITS}d}\n")
+
+
+def search_offset_index(f, width, transaction_id):
+    # The offset recorded for an id, or None. `f` is the index file opened in
+    # binary mode and positioned after its header; about log2(n) records are read.
+    key = json.dumps(transaction_id).ljust(width).encode("ascii")
+    if len(key) > width:
+        return None
+    record_size = width + OFFSET_DIGITS + 1
+    start = f.tell()
+    low, high = 0, (f.seek(0, os.SEEK_END) - start) // record_size
+    while low < high:
+        middle = (low + high) // 2
+        f.seek(start + middle * record_size)
+        record = f.read(record_size)
+        if record[:width] < key:
+            low = middle + 1
+        elif record[:width] > key:
+            high = middle
+        else:
+            return int(record[width:width + OFFSET_DIGITS])
+    return None
+
+
+def write_file_atomic(path, write, sync=True):
+    # sync=False skips the fsync, for files that are rebuilt if a crash loses them
+    tmp_file = path + ".tmp"
+    with open(tmp_file, 'w') as f:
+        write(f)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+class JsonStorage:
+    # Per user, on disk:
+    #   {username}_profile.json       the account record (profile, no transactions)
+    #                                 as of its journal_seq
+    #   {username}_transactions.jsonl transaction snapshot, one per line
+    #   {username}_journal.jsonl      add/approve/deny operations since the snapshot,
+    #                                 each with its balance change; the record is
+    #                                 current once the newer ones are applied
+    #   {username}_offsets.idx        byte offset of each transaction in the snapshot,
+    #                                 sorted by id (see write_offset_index)
+    #   {username}_pending.json       purchases waiting for this user's approval,
+    #                                 across the account and its children
+    # Parsed records and histories are kept in LRU caches, validated either by
+    # the files' mtime/size ("stat", safe with several workers) or by an
+    # in-process version counter bumped on every write ("version", no syscalls).
+    # An optional columnar replica (columnar_store.ColumnarReplica) and search
+    # index (search_index.SearchIndex) are kept in sync with every transaction write.
+    # With a family loader (family_loader.FamilyLoader), a family's histories
+    # are read concurrently when its search index is built.
+
+    def __init__(self, data_dir, cache_size=256, cache_validation="stat", replica=None, search=None, loader=None):
+        self.data_dir = data_dir
+        self.replica = replica
+        self.search = search
+        self.loader = loader
+        self.cache = UserDocumentCache(cache_size)
+        self.profile_cache = UserDocumentCache(cache_size)
+        self.cache_validation = cache_validation
+        self._versions = {}
+        self.lock_dir = os.path.join(data_dir, "locks")
+        if not os.path.exists(self.lock_dir):
+            os.makedirs(self.lock_dir)
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+        self._held = threading.local()
+
+    def get_user_file(self, username):
+        # Single-document format used before profiles and histories were split
+        return os.path.join(self.data_dir, f"{username}_data.json")
+
+    def get_profile_file(self, username):
+        return os.path.join(self.data_dir, f"{username}_profile.json")
+
+    def get_transactions_file(self, username):
+        return os.path.join(self.data_dir, f"{username}_transactions.jsonl")
+
+    def get_journal_file(self, username):
+        return os.path.join(self.data_dir, f"{username}_journal.jsonl")
+
+    def get_index_file(self, username):
+        return os.path.join(self.data_dir, f"{username}_offsets.idx")
+
+    def get_pending_file(self, username):
+        return os.path.join(self.data_dir, f"{username}_pending.json")
+
+    @contextmanager
+    def user_lock(self, username):
+        # Serializes writers of one user across threads and worker processes.
+        # Re-entering it from the thread that already holds it is a no-op.
+        held = self._held.__dict__.setdefault("users", set())
+        if username in held:
+            yield
+            return
+        with self._locks_guard:
+            lock = self._locks.setdefault(username, threading.Lock())
+        with lock:
+            held.add(username)
+            try:
+                if fcntl is None:
+                    yield
+                    return
+                with open(os.path.join(self.lock_dir, f"{username}.lock"), 'a') as f:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            finally:
+                held.discard(username)
+
+    def cache_stats(self):
+        return {
+            "profiles": self.profile_cache.stats(),
+            "transactions": self.cache.stats()
+        }
+
+    def _signature(self, kind, username):
+        # A profile record is read together with the journal folded into it
+        if self.cache_validation == "version":
+            if kind == "profile":
+                return self._versions.get(("profile", username), 0), self._versions.get(("transactions", username), 0)
+            return self._versions.get((kind, username), 0)
+        if kind == "profile":
+            return file_signature(self.get_profile_file(username)), file_signature(self.get_journal_file(username))
+        return (
+            file_signature(self.get_transactions_file(username)),
+            file_signature(self.get_journal_file(username))
+        )
+
+    def _bump_version(self, kind, username):
+        self._versions[(kind, username)] = self._versions.get((kind, username), 0) + 1
+
+    # Legacy single-document files
+
+    def _migrate_legacy(self, username):
+        # Split a {username}_data.json (and any journal written against it)
+        # into the profile record and the transaction snapshot
+        with self.user_lock(username):
+            if os.path.exists(self.get_profile_file(username)) or not os.path.exists(self.get_user_file(username)):
+                return
+            with open(self.get_user_file(username), 'r') as f:
+                user_data = json.load(f)
+            log = TransactionLog(user_data["transactions"])
+            user_data["profile"]["account_balance"] += replay_journal(log, self._read_journal(username))
+            user_data["transactions"] = log.live()
+            self._write_transactions(username, user_data["transactions"])
+            self._write_record(username, {
+                "profile": user_data["profile"],
+                "aggregates": build_aggregates(user_data["transactions"])
+            })
+            os.remove(self.get_user_file(username))
+
+    # Profile record
+
+    def _load_record(self, username):
+        signature = self._signature("profile", username)
+        record = self.profile_cache.get(username, signature)
+        if record is not None:
+            return record
+        profile_file = self.get_profile_file(username)
+        if not os.path.exists(profile_file) and os.path.exists(self.get_user_file(username)):
+            self._migrate_legacy(username)
+            signature = self._signature("profile", username)
+        if os.path.exists(profile_file):
+            with open(profile_file, 'r') as f:
+                record = json.load(f)
+        else:
+            record = {"profile": default_profile(), "aggregates": empty_aggregates()}
+        if record.get("aggregates", {}).get("version") != AGGREGATES_VERSION:
+            # Records written before running totals existed get them once. The
+            # journal's balance changes and position are folded in first; the
+            # totals are then rebuilt from the history, which includes it.
+            with self.user_lock(username):
+                if os.path.exists(profile_file):  # as another process may have left it
+                    with open(profile_file, 'r') as f:
+                        record = json.load(f)
+                record["aggregates"] = empty_aggregates()
+                apply_journal(record, self._read_journal(username))
+                record["aggregates"] = build_aggregates(self.load_transactions(username))
+                self._write_record(username, record)
+            return record
+        apply_journal(record, self._read_journal(username))
+        self.profile_cache.put(username, signature, record)
+        return record
+
+    def _write_record(self, username, record):
+        # Caller holds the user lock. Every write bumps the record's data version.
+        record["data_version"] = record.get("data_version", 0) + 1
+        record["modified"] = time.time()
+        write_file_atomic(self.get_profile_file(username), lambda f: json.dump(record, f, indent=4))
+        self._bump_version("profile", username)
+        self.profile_cache.put(username, self._signature("profile", username), record)
+
+    def load_profile(self, username):
+        return self._load_record(username)["profile"]
+
+    def data_version(self, username):
+        # Changes whenever the profile or the transaction history does
+        return self._load_record(username).get("data_version", 0)
+
+    def version_info(self, username):
+        # Validators for the user's pages, without loading any history: the
+        # user's data version, the family version (the signature of the
+        # pending-approval index, rewritten whenever anything waiting for this
+        # user's approval changes) and the time either last changed
+        record = self._load_record(username)
+        modified = record.get("modified")
+        if modified is None and os.path.exists(self.get_profile_file(username)):
+            modified = os.path.getmtime(self.get_profile_file(username))
+        family = file_signature(self.get_pending_file(username))
+        if family is not None:
+            modified = max(modified or 0, family[0] / 1e9)
+        return {"user": record.get("data_version", 0), "family": family, "modified": modified}
+
+    def load_aggregates(self, username):
+        return self._load_record(username)["aggregates"]
+
+    def rebuild_aggregates(self, username):
+        # Recompute the running totals from the history, fixing any drift
+        with self.user_lock(username):
+            record = self._load_record(username)
+            record["aggregates"] = build_aggregates(self.load_transactions(username))
+            self._write_record(username, record)
+
+    def usernames(self):
+        suffix = "_profile.json"
+        return [filename[:-len(suffix)] for filename in os.listdir(self.data_dir) if filename.endswith(suffix)]
+
+    def save_profile(self, username, profile):
+        with self.user_lock(username):
+            record = self._load_record(username)
+            record["profile"] = profile
+            self._write_record(username, record)
+
+    def update_profile(self, username, update):
+        # Read-modify-write of the profile under the user lock
+        with self.user_lock(username):
+            record = self._load_record(username)
+            profile = dict(record["profile"])
+            update(profile)
+            record["profile"] = profile
+            self._write_record(username, record)
+            return profile
+
+    # Pending-approval index
+
+    def _peek_profile(self, username):
+        # Profile without _load_record's one-off upgrades, safe under another user's lock
+        record = self.profile_cache.peek(username, self._signature("profile", username))
+        if record is not None:
+            return record["profile"]
+        if not os.path.exists(self.get_profile_file(username)):
+            return default_profile()
+        with open(self.get_profile_file(username), 'r') as f:
+            return json.load(f)["profile"]
+
+    def _pending_seq(self, username):
+        # The account's pending_seq, without taking its lock
+        record = self.profile_cache.peek(username, self._signature("profile", username))
+        if record is not None:
+            return record.get("pending_seq", 0)
+        seq = 0
+        if os.path.exists(self.get_profile_file(username)):
+            with open(self.get_profile_file(username), 'r') as f:
+                seq = json.load(f).get("pending_seq", 0)
+        for entry in self._read_journal(username):
+            if entry.get("seq", 0) > seq and changes_pending(entry):
+                seq = entry["seq"]
+        return seq
+
+    def _load_pending(self, parent, expected=None):
+        # (entries, {member: pending_seq}, whether the file was current). The
+        # index records the pending_seq of every family member it reflects. If
+        # a member has moved past it, e.g. after a crash between a journal
+        # append and the index update, it is rebuilt from the histories.
+        # `expected` lowers the bar for a member whose write is being applied.
+        members = [parent] + self._peek_profile(parent).get("child_accounts", [])
+        seqs = {member: self._pending_seq(member) for member in members}
+        required = dict(seqs, **(expected or {}))
+        try:
+            with open(self.get_pending_file(parent), 'r') as f:
+                index = json.load(f)
+            # Indexes written before they carried positions are plain lists
+            if isinstance(index, dict) and all(index["seqs"].get(m, 0) >= seq for m, seq in required.items()):
+                return index["entries"], seqs, True
+        except FileNotFoundError:
+            pass
+        except ValueError:  # torn by a crash
+            pass
+        entries = []
+        for username in [parent] + self._peek_profile(parent).get("child_accounts", []):
+            profile = self._peek_profile(username)
+            if approver_for(username, profile) == parent:
+                entries.extend(
+                    pending_entry(username, profile, t)
+                    for t in self.load_transactions(username) if needs_approval_entry(t)
+                )
+        return entries, seqs, False
+
+    def _write_pending(self, parent, entries, seqs):
+        write_file_atomic(
+            self.get_pending_file(parent), lambda f: json.dump({"seqs": seqs, "entries": entries}, f), sync=False
+        )
+
+    def _update_pending(self, parent, username, add=None, remove=None, since=None):
+        # Add a pending entry and/or drop transaction ids of `username` from the
+        # parent's index. `since` is the account's pending_seq before the write
+        # being applied (None when the write was not journaled).
+        with self.user_lock(parent):
+            entries, seqs, _ = self._load_pending(parent, None if since is None else {username: since})
+            entries = [
+                e for e in entries
+                if not (e["username"] == username and e["transaction"]["id"] in (remove or ()))
+            ]
+            for entry in add or ():
+                if not any(e["username"] == username and e["transaction"]["id"] == entry["transaction"]["id"] for e in entries):
+                    entries.append(entry)
+            self._write_pending(parent, entries, seqs)
+
+    def pending_approvals(self, parent):
+        # Everything waiting for this parent's approval, in one read
+        entries, _, current = self._load_pending(parent)
+        if not current:
+            with self.user_lock(parent):
+                entries, seqs, current = self._load_pending(parent)
+                if not current:
+                    self._write_pending(parent, entries, seqs)
+        return entries
+
+    def pending_approval_count(self, parent):
+        return len(self.pending_approvals(parent))
+
+    # Transaction history
+
+    def _read_journal(self, username):
+        journal_file = self.get_journal_file(username)
+        if not os.path.exists(journal_file):
+            return []
+        records = []
+        with open(journal_file, 'r') as f:
+            for line in f:
+                # A torn last line from a crash mid-append is ignored
+                if line.endswith("\n"):
+                    records.append(json.loads(line))
+        return records
+
+    def _append_journal(self, username, *records):
+        # Caller holds the user lock. The append is the one durable step of a
+        # transaction write: each record carries a sequence number and its
+        # balance change, and is folded into the profile record on load, so
+        # the record file is only rewritten on profile edits and compaction.
+        # Several records go out in one write and one fsync. Returns the
+        # account's pending_seq from before the append.
+        profile_record = self._load_record(username)
+        pending_seq = profile_record.get("pending_seq", 0)
+        cached = self.cache.peek(username, self._signature("transactions", username))
+        seq, now = profile_record.get("journal_seq", 0), time.time()
+        for record in records:
+            seq += 1
+            record["seq"], record["at"] = seq, now
+        with open(self.get_journal_file(username), 'a') as f:
+            f.write("".join(json.dumps(record) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+            journal_size = f.tell()
+        self._bump_version("transactions", username)
+        apply_journal(profile_record, records)
+        self.profile_cache.put(username, self._signature("profile", username), profile_record)
+        # Keep an up-to-date cached history current instead of re-parsing it later
+        if cached is not None:
+            replay_journal(cached, records)
+            self.cache.put(username, self._signature("transactions", username), cached)
+        else:
+            self.cache.invalidate(username)
+        if journal_size > JOURNAL_COMPACT_BYTES:
+            self._compact(username)
+        return pending_seq
+
+    def _write_transactions(self, username, transactions):
+        # Caller holds the user lock. The snapshot now includes everything the journal recorded.
+        offsets = {}
+
+        def write(f):
+            offset = 0
+            for transaction in transactions:
+                line = json.dumps(transaction) + "\n"
+                offsets[transaction.get("id")] = offset
+                offset += len(line.encode("utf-8"))
+                f.write(line)
+        write_file_atomic(self.get_transactions_file(username), write)
+        # The index names the snapshot it describes, so a stale one is never used
+        snapshot = list(file_signature(self.get_transactions_file(username)))
+        write_file_atomic(self.get_index_file(username), lambda f: write_offset_index(f, snapshot, offsets))
+        if os.path.exists(self.get_journal_file(username)):
+            os.remove(self.get_journal_file(username))
+        self._bump_version("transactions", username)
+        self.cache.put(username, self._signature("transactions", username), TransactionLog(transactions))
+
+    def _compact(self, username):
+        # Also drops the tombstones left by denied transactions. The profile
+        # record takes in the journal first, so it never depends on a journal
+        # that is gone.
+        self._write_record(username, self._load_record(username))
+        self._write_transactions(username, self.load_transactions(username))
+
+    def compact(self, username):
+        with self.user_lock(username):
+            self._compact(username)
+
+    def compact_all(self):
+        # Fold every pending journal into its snapshot
+        suffix = "_journal.jsonl"
+        for filename in os.listdir(self.data_dir):
+            if filename.endswith(suffix):
+                self.compact(filename[:-len(suffix)])
+
+    def _load_log(self, username):
+        signature = self._signature("transactions", username)
+        log = self.cache.get(username, signature)
+        if log is not None:
+            return log
+        if not os.path.exists(self.get_profile_file(username)) and os.path.exists(self.get_user_file(username)):
+            self._migrate_legacy(username)
+            signature = self._signature("transactions", username)
+        transactions = []
+        transactions_file = self.get_transactions_file(username)
+        if os.path.exists(transactions_file):
+            with open(transactions_file, 'r') as f:
+                transactions = [json.loads(line) for line in f if line.strip()]
+        log = TransactionLog(transactions)
+        replay_journal(log, self._read_journal(username))
+        self.cache.put(username, signature, log)
+        return log
+
+    def load_transactions(self, username):
+        return self._load_log(username).live()
+
+    def _snapshot_offset(self, username, transaction_id):
+        # (whether the index file is usable, the transaction's snapshot offset
+        # or None). Only the header and a few records of the index are read.
+        try:
+            with open(self.get_index_file(username), 'rb') as f:
+                header = json.loads(f.readline())
+                snapshot = file_signature(self.get_transactions_file(username))
+                if snapshot is None or header.get("snapshot") != list(snapshot):
+                    return False, None
+                return True, search_offset_index(f, header["width"], transaction_id)
+        except (FileNotFoundError, ValueError, KeyError):
+            return False, None
+
+    def _find_transaction(self, username, transaction_id):
+        # Caller holds the user lock. A cached history answers from its id index;
+        # otherwise only the indexed snapshot line and the journal are read.
+        log = self.cache.peek(username, self._signature("transactions", username))
+        if log is not None:
+            return log.get(transaction_id)
+        indexed, offset = self._snapshot_offset(username, transaction_id)
+        if not indexed:
+            return self._load_log(username).get(transaction_id)
+        transaction = None
+        if offset is not None:
+            with open(self.get_transactions_file(username), 'rb') as f:
+                f.seek(offset)
+                transaction = json.loads(f.readline())
+        for record in self._read_journal(username):
+            if record["op"] == "add" and record["transaction"]["id"] == transaction_id:
+                transaction = transaction or dict(record["transaction"])
+            elif record.get("id") == transaction_id and transaction is not None:
+                if record["op"] == "approve":
+                    transaction["approved_by_parent"] = True
+                elif record["op"] == "deny":
+                    transaction = None
+        return transaction
+
+    # Whole documents
+
+    def load_user_data(self, username):
+        return {
+            "profile": self.load_profile(username),
+            "transactions": self.load_transactions(username)
+        }
+
+    def save_user_data(self, username, data):
+        with self.user_lock(username):
+            record = self._load_record(username)
+            old_pending = [t["id"] for t in self.load_transactions(username) if needs_approval_entry(t)]
+            record["profile"] = data["profile"]
+            record["aggregates"] = build_aggregates(data["transactions"])
+            self._write_record(username, record)
+            self._write_transactions(username, data["transactions"])
+            if self.replica:
+                self.replica.rebuild(username, data["transactions"])
+            if self.search:
+                self.search.forget(approver_for(username, data["profile"]))
+            self._update_pending(
+                approver_for(username, data["profile"]), username,
+                add=[pending_entry(username, data["profile"], t) for t in data["transactions"] if needs_approval_entry(t)],
+                remove=old_pending
+            )
+
+    # Transactions
+
+    def add_transaction(self, username, transaction, limits=None):
+        # Checks the spending limits and adds the purchase as one step under the
+        # user lock, so two concurrent purchases cannot both slip under a limit.
+        # Returns the exceeded limit window, or None once the purchase is added.
+        with self.user_lock(username):
+            record = self._load_record(username)
+            exceeded = exceeded_game_limit(record["aggregates"], transaction, limits)
+            if exceeded:
+                return exceeded
+            since = self._append_journal(username, {"op": "add", "transaction": transaction, "balance": -transaction["amount"]})
+            if self.replica:
+                self.replica.append(username, [transaction])
+            if self.search:
+                self.search.add(approver_for(username, record["profile"]), username, transaction)
+            if needs_approval_entry(transaction):
+                self._update_pending(
+                    approver_for(username, record["profile"]), username,
+                    add=[pending_entry(username, record["profile"], transaction)], since=since
+                )
+        return None
+
+    def add_transactions(self, username, transactions, limits=None, charge_balance=True):
+        # Batch form of add_transaction: the limits are checked purchase by
+        # purchase, counting the earlier ones in the batch, and everything
+        # accepted is written at once (one journal append and one
+        # pending-index update). Purchases that were paid for elsewhere
+        # (imported history) are added with charge_balance=False.
+        # Returns (added transactions, {position in the batch: exceeded window}).
+        with self.user_lock(username):
+            record = self._load_record(username)
+            # The totals are counted for real when the journal is applied
+            added, exceeded = admit_transactions(copy.deepcopy(record["aggregates"]), transactions, limits)
+            if not added:
+                return added, exceeded
+            since = self._append_journal(username, *[
+                {"op": "add", "transaction": t, "balance": -t["amount"] if charge_balance else 0} for t in added
+            ])
+            if self.replica:
+                self.replica.append(username, added)
+            if self.search:
+                self.search.add_many(approver_for(username, record["profile"]), username, added)
+            pending = [pending_entry(username, record["profile"], t) for t in added if needs_approval_entry(t)]
+            if pending:
+                self._update_pending(approver_for(username, record["profile"]), username, add=pending, since=since)
+        return added, exceeded
+
+    def approve_transaction(self, username, transaction_id):
+        with self.user_lock(username):
+            record = self._load_record(username)
+            transaction = self._find_transaction(username, transaction_id)
+            if transaction is None:
+                return False
+            was_pending = not transaction.get("approved_by_parent", True)
+            since = self._append_journal(username, {"op": "approve", "id": transaction_id, "pending": was_pending})
+            if self.replica:
+                self.replica.approve(username, transaction_id)
+            if was_pending:
+                self._update_pending(approver_for(username, record["profile"]), username, remove=[transaction_id], since=since)
+            return True
+
+    def deny_transaction(self, username, transaction_id):
+        # Removes the transaction and refunds it, returns the removed transaction
+        with self.user_lock(username):
+            record = self._load_record(username)
+            transaction = self._find_transaction(username, transaction_id)
+            if transaction is None:
+                return None
+            since = self._append_journal(username, {
+                "op": "deny", "id": transaction_id, "transaction": transaction, "balance": transaction["amount"]
+            })
+            if self.replica:
+                self.replica.remove(username, transaction_id)
+            if self.search:
+                self.search.remove(approver_for(username, record["profile"]), transaction_id)
+            if needs_approval_entry(transaction):
+                self._update_pending(approver_for(username, record["profile"]), username, remove=[transaction_id], since=since)
+            return transaction
+
+    def decide_transactions(self, username, decisions):
+        # Batch form of approve_transaction and deny_transaction for one account.
+        # decisions is [(transaction_id, "approve" or "deny")]; all of them are
+        # applied under one lock, with one journal append and one pending-index
+        # update. Returns {transaction_id: "approved",
+        # "denied" or "not_found"}; only the first decision for an id counts.
+        with self.user_lock(username):
+            record = self._load_record(username)
+            family = approver_for(username, record["profile"])
+            results, journal, settled, denied = {}, [], [], []
+            for transaction_id, action in decisions:
+                if transaction_id in results:
+                    continue
+                transaction = self._find_transaction(username, transaction_id)
+                if transaction is None:
+                    results[transaction_id] = "not_found"
+                    continue
+                if action == "approve":
+                    results[transaction_id] = "approved"
+                    if transaction.get("approved_by_parent", True):
+                        continue
+                    journal.append({"op": "approve", "id": transaction_id, "pending": True})
+                    if self.replica:
+                        self.replica.approve(username, transaction_id)
+                else:
+                    results[transaction_id] = "denied"
+                    journal.append({
+                        "op": "deny", "id": transaction_id, "transaction": transaction, "balance": transaction["amount"]
+                    })
+                    if self.replica:
+                        self.replica.remove(username, transaction_id)
+                    denied.append(transaction_id)
+                if needs_approval_entry(transaction):
+                    settled.append(transaction_id)
+            if not journal:
+                return results
+            since = self._append_journal(username, *journal)
+            if self.search and denied:
+                self.search.remove_many(family, denied)
+            if settled:
+                self._update_pending(family, username, remove=settled, since=since)
+            return results
+
+    def recent_transactions(self, username, limit):
+        return self.transaction_page(username, limit)[0]
+
+    def transaction_page(self, username, limit, before=None, filters=None):
+        # One page of the history, newest first, and the (date, id) key to pass
+        # as `before` for the next page (None on the last page)
+        match, since, until, index = history_filters(filters)
+        transactions = self._load_log(username).page(limit + 1, before, match, since, until, index)
+        if len(transactions) <= limit:
+            return transactions, None
+        transactions = transactions[:limit]
+        return transactions, history_key(transactions[-1])
+
+    def spending_totals(self, username, month):
+        # (lifetime total, total for the given YYYY-MM month)
+        aggregates = self.load_aggregates(username)
+        return aggregates["total_spent"], aggregates["monthly"].get(month, 0)
+
+    def game_spending_windows(self, username, day):
+        return game_spending_windows(self.load_aggregates(username), day)
+
+    def pending_count(self, username):
+        return self.load_aggregates(username)["pending_count"]
+
+    def pending_transactions(self, username):
+        return [t for t in self.load_transactions(username) if needs_approval_entry(t)]
+
+    def transaction_columns(self, username):
+        # Memory-mapped columns from the analytics replica, built on first use
+        columns = self.replica.load(username)
+        if columns is None:
+            self.rebuild_columns(username)
+            columns = self.replica.load(username)
+        return columns
+
+    def rebuild_columns(self, username):
+        with self.user_lock(username):
+            self.replica.rebuild(username, self.load_transactions(username))
+
+    def _load_histories(self, usernames):
+        # {username: transactions}, read concurrently when a family loader is configured
+        def load(username):
+            return self.load_user_data(username)["transactions"]
+        if self.loader:
+            return self.loader.load_all(load, usernames)
+        return {username: load(username) for username in usernames}
+
+    def search_transactions(self, username, query, limit=50):
+        # Purchases whose descriptions match the query, from the family's index.
+        # Parents search their whole family, children only their own purchases.
+        profile = self.load_profile(username)
+        family = approver_for(username, profile)
+        if not self.search.has(family):
+            members = [family] + self.load_profile(family).get("child_accounts", [])
+            self.search.build(family, lambda: self._load_histories(members))
+        usernames = None if family == username else {username}
+        return self.search.search(family, query, limit, usernames)
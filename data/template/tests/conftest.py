@@ -0,0 +1,36 @@
+import os
+import sys
+import datetime
+
+import pytest
+
+# The app's modules live in the directory above
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import JsonStorage
+from sqlite_storage import SQLiteStorage
+
+
+def purchase(transaction_id, amount, approved=True, date=None, description="V-Bucks", platform="Fortnite"):
+    return {
+        "id": transaction_id,
+        "date": date or datetime.datetime.now().isoformat(),
+        "amount": amount,
+        "description": description,
+        "game_platform": platform,
+        "game_category": "In-App Purchases",
+        "is_game_purchase": True,
+        "approved_by_parent": approved,
+    }
+
+
+def open_store(engine, data_dir):
+    # A new store instance over the same data, as another worker process would have
+    if engine == "json":
+        return JsonStorage(str(data_dir))
+    return SQLiteStorage(os.path.join(str(data_dir), "game_tracker.db"), str(data_dir))
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def engine(request):
+    return request.param
@@ -0,0 +1,48 @@
+import io
+
+from transaction_export import export_chunks
+from transaction_import import CsvImporter
+from conftest import purchase, open_store
+
+PLATFORMS = ["Fortnite", "Steam", "Other"]
+CATEGORIES = ["PC Games", "In-App Purchases"]
+
+RECEIPTS = (
+    "Order ID,Purchase Date,Item Name,Store,Amount Paid\n"
+    "A1,2024-03-01,Skin pack,Steam,9.99\n"
+    "A2,2024-03-01,Skin pack,Steam,9.99\n"
+    "A3,2024-03-02,Battle pass,Steam,4.99\n"
+)
+
+
+def import_csv(store, text):
+    return CsvImporter(PLATFORMS, CATEGORIES).import_file(store, "kid", io.BytesIO(text.encode()))
+
+
+def test_reimporting_receipts_adds_nothing(engine, tmp_path):
+    store = open_store(engine, tmp_path)
+    assert import_csv(store, RECEIPTS)["imported"] == 3
+    summary = import_csv(store, RECEIPTS)
+    assert (summary["imported"], summary["duplicates"]) == (0, 3)
+    assert len(store.load_user_data("kid")["transactions"]) == 3
+
+
+def test_reimporting_own_export_adds_nothing(engine, tmp_path):
+    store = open_store(engine, tmp_path)
+    store.add_transaction("kid", purchase("t1", 50.0, date="2024-03-05T10:00:00"))
+    import_csv(store, RECEIPTS)
+    exported = b"".join(export_chunks(store, ["kid"], "csv")).decode()
+    summary = import_csv(store, exported)
+    assert (summary["imported"], summary["duplicates"]) == (0, 4)
+    assert len(store.load_user_data("kid")["transactions"]) == 4
+
+
+def test_receipt_for_hand_entered_purchase_is_duplicate(engine, tmp_path):
+    store = open_store(engine, tmp_path)
+    store.add_transaction("kid", purchase("t1", 50.0, date="2024-03-05T10:00:00"))
+    summary = import_csv(store, (
+        "Order ID,Purchase Date,Item Name,Store,Amount Paid\n"
+        "R-7,2024-03-05 18:30,V-Bucks,Fortnite,50\n"
+    ))
+    assert (summary["imported"], summary["duplicates"]) == (0, 1)
+    assert [t["id"] for t in store.load_user_data("kid")["transactions"]] == ["t1"]
@@ -0,0 +1,69 @@
+import json
+
+from storage import JsonStorage
+from conftest import purchase
+
+
+def make_store(tmp_path):
+    store = JsonStorage(str(tmp_path))
+    parent = store.load_profile("mom")
+    parent["child_accounts"] = ["kid"]
+    store.save_profile("mom", parent)
+    child = store.load_profile("kid")
+    child.update(account_balance=1000, is_child_account=True, parent_account="mom")
+    store.save_profile("kid", child)
+    return store
+
+
+def test_aggregates_upgrade_applies_journal_once(tmp_path):
+    store = make_store(tmp_path)
+    store.add_transaction("kid", purchase("t1", 30.0))
+    # A record from before the current running totals, with the purchase
+    # still only in the journal
+    profile_file = store.get_profile_file("kid")
+    with open(profile_file) as f:
+        record = json.load(f)
+    assert record["profile"]["account_balance"] == 1000
+    record["aggregates"]["version"] = 1
+    with open(profile_file, 'w') as f:
+        json.dump(record, f)
+
+    upgraded = JsonStorage(str(tmp_path))
+    assert upgraded.load_profile("kid")["account_balance"] == 970
+    assert upgraded.load_aggregates("kid")["total_spent"] == 30
+
+    reloaded = JsonStorage(str(tmp_path))
+    assert reloaded.load_profile("kid")["account_balance"] == 970
+    assert reloaded.load_aggregates("kid")["total_spent"] == 30
+
+
+def test_journal_survives_compaction(tmp_path):
+    store = make_store(tmp_path)
+    store.add_transaction("kid", purchase("t1", 30.0, approved=False))
+    store.add_transaction("kid", purchase("t2", 20.0, approved=False))
+    store.approve_transaction("kid", "t1")
+    store.deny_transaction("kid", "t2")
+    before = store.load_profile("kid"), store.load_aggregates("kid")
+    store.compact("kid")
+
+    fresh = JsonStorage(str(tmp_path))
+    assert (fresh.load_profile("kid"), fresh.load_aggregates("kid")) == before
+    assert fresh.load_profile("kid")["account_balance"] == 970
+    assert [t["id"] for t in fresh.load_transactions("kid")] == ["t1"]
+
+
+def test_pending_index_rebuilt_after_crash(tmp_path):
+    store = make_store(tmp_path)
+    store.add_transaction("kid", purchase("t1", 30.0, approved=False))
+    assert len(store.pending_approvals("mom")) == 1
+
+    # The journal append lands but the index rewrite does not
+    crashed = JsonStorage(str(tmp_path))
+    crashed._update_pending = lambda *args, **kwargs: None
+    crashed.add_transaction("kid", purchase("t2", 20.0, approved=False))
+
+    restarted = JsonStorage(str(tmp_path))
+    pending = restarted.pending_approvals("mom")
+    assert sorted(entry["transaction"]["id"] for entry in pending) == ["t1", "t2"]
+    restarted.deny_transaction("kid", "t2")
+    assert [entry["transaction"]["id"] for entry in JsonStorage(str(tmp_path)).pending_approvals("mom")] == ["t1"]
@@ -0,0 +1,33 @@
+import threading
+
+from storage import game_limits
+from conftest import purchase, open_store
+
+
+def test_concurrent_purchases_respect_monthly_limit(engine, tmp_path):
+    # 40 purchases of 10 against a monthly limit of 100, from two store
+    # instances at once: exactly 10 get in
+    stores = [open_store(engine, tmp_path), open_store(engine, tmp_path)]
+    profile = stores[0].load_profile("kid")
+    profile["game_spending_limit"] = 100
+    stores[0].save_profile("kid", profile)
+    limits = game_limits(stores[0].load_profile("kid"))
+
+    results = []
+    start = threading.Barrier(40)
+
+    def buy(i):
+        start.wait()
+        results.append(stores[i % 2].add_transaction("kid", purchase(f"t{i}", 10.0), limits))
+
+    threads = [threading.Thread(target=buy, args=(i,)) for i in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(None) == 10
+    assert results.count("monthly") == 30
+    fresh = open_store(engine, tmp_path)
+    assert len(fresh.load_user_data("kid")["transactions"]) == 10
+    assert fresh.load_profile("kid")["account_balance"] == -100
@@ -0,0 +1,30 @@
+import os
+
+import pytest
+
+from columnar_store import ColumnarReplica
+from user_registry import valid_username
+
+
+@pytest.mark.parametrize("username", ["", "..", ".", ".hidden", "../data", "a/b", "a\\b", "a\0b"])
+def test_path_like_usernames_rejected(username):
+    assert not valid_username(username)
+
+
+@pytest.mark.parametrize("username", ["kid", "jo.doe", "Mom 2"])
+def test_plain_usernames_accepted(username):
+    assert valid_username(username)
+
+
+def test_replica_stays_inside_its_directory(tmp_path):
+    replica_dir = tmp_path / "columns"
+    keep = tmp_path / "keep.txt"
+    keep.write_text("data")
+    replica = ColumnarReplica(str(replica_dir), ["Steam"], ["PC Games"])
+    for username in ["..", "../..", "/", "."]:
+        user_dir = replica.user_dir(username)
+        assert os.path.dirname(user_dir) == str(replica_dir)
+        replica.rebuild(username, [])
+        assert replica.load(username) is not None
+    assert keep.read_text() == "data"
+    assert sorted(os.listdir(tmp_path)) == ["columns", "keep.txt"]
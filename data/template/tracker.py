@@ -1,4 +1,6 @@
-from flask import Flask, render_template_string, request, redirect, session, flash
+from flask import Flask, render_template, render_template_string, request, redirect, session, flash, Response, stream_with_context
+from jinja2 import DictLoader
+from markupsafe import escape
 import os
 import json
 import datetime
@@ -15,6 +17,14 @@ if not os.path.exists('data'):
 GAME_CATEGORIES = ["Mobile Games", "Console Games", "PC Games", "In-App Purchases", "Game Subscriptions"]
 GAME_PLATFORMS = ["Fortnite", "Minecraft", "PlayStation", "Xbox", "Nintendo Switch", "Steam", "Other"]
 
+# Denied transactions leave a tombstone (None) in the list; it is compacted
+# once tombstones make up this share of the slots
+TOMBSTONE_COMPACT_RATIO = 0.25
+
+# Approvals and denials are appended to data/{username}.log; it is folded into
+# the user file once it holds this many entries
+UPDATE_LOG_COMPACT_ENTRIES = 500
+
 # User data functions
 def save_user(username, password):
     with open(f'data/{username}.json', 'w') as f:
@@ -35,19 +45,86 @@ def save_user(username, password):
 def load_user(username):
     try:
         with open(f'data/{username}.json', 'r') as f:
-            return json.load(f)
+            user_data = json.load(f)
     except:
         return None
+    build_index(user_data)
+    updates = apply_updates(user_data, read_updates(username))
+    if updates > UPDATE_LOG_COMPACT_ENTRIES:
+        write_user(username, user_data)
+    return user_data
+
+def write_user(username, user_data):
+    # Saves the live transactions only, without tombstones or the index, and
+    # folds in the update log
+    saved = {key: value for key, value in user_data.items() if key != "index"}
+    saved["transactions"] = live_transactions(user_data)
+    with open(f'data/{username}.json', 'w') as f:
+        json.dump(saved, f)
+    if os.path.exists(f'data/{username}.log'):
+        os.remove(f'data/{username}.log')
+
+# Update log: approve and deny append one line instead of rewriting the user file
+def log_update(username, op, transaction_id):
+    with open(f'data/{username}.log', 'a') as f:
+        f.write(json.dumps({"op": op, "id": transaction_id}) + "\n")
+
+def read_updates(username):
+    try:
+        with open(f'data/{username}.log', 'r') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def apply_updates(user_data, updates):
+    # Replaying an update twice changes nothing: a denied transaction is gone
+    # the second time, so it is not refunded again
+    for update in updates:
+        if update["op"] == "approve":
+            transaction = find_transaction(user_data, update["id"])
+            if transaction:
+                transaction["approved"] = True
+        elif update["op"] == "deny":
+            transaction = remove_transaction(user_data, update["id"])
+            if transaction:
+                user_data["profile"]["balance"] += transaction["amount"]
+    return len(updates)
+
+# Transaction index: "index" maps each transaction id to its position in "transactions"
+def build_index(user_data):
+    user_data["transactions"] = live_transactions(user_data)
+    user_data["index"] = {t["id"]: i for i, t in enumerate(user_data["transactions"])}
+
+def live_transactions(user_data):
+    return [t for t in user_data["transactions"] if t is not None]
+
+def find_transaction(user_data, transaction_id):
+    i = user_data["index"].get(transaction_id)
+    return None if i is None else user_data["transactions"][i]
+
+def append_transaction(user_data, transaction):
+    user_data["index"][transaction["id"]] = len(user_data["transactions"])
+    user_data["transactions"].append(transaction)
+
+def remove_transaction(user_data, transaction_id):
+    i = user_data["index"].pop(transaction_id, None)
+    if i is None:
+        return None
+    transaction = user_data["transactions"][i]
+    user_data["transactions"][i] = None
+    tombstones = len(user_data["transactions"]) - len(user_data["index"])
+    if tombstones > len(user_data["transactions"]) * TOMBSTONE_COMPACT_RATIO:
+        build_index(user_data)
+    return transaction
 
 def save_transaction(username, data):
     user_data = load_user(username)
-    user_data["transactions"].append(data)
-    with open(f'data/{username}.json', 'w') as f:
-        json.dump(user_data, f)
+    append_transaction(user_data, data)
+    write_user(username, user_data)
 
 def add_sample_data(username):
     user_data = load_user(username)
-    if not user_data["transactions"]:
+    if not live_transactions(user_data):
         now = datetime.datetime.now()
         transactions = [
             {
@@ -79,8 +156,8 @@ def add_sample_data(username):
             }
         ]
         user_data["transactions"] = transactions
-        with open(f'data/{username}.json', 'w') as f:
-            json.dump(user_data, f)
+        build_index(user_data)
+        write_user(username, user_data)
         return True
     return False
 
@@ -148,6 +225,35 @@ BASE_HTML = """
 </html>
 """
 
+# Streamed pages send the part of BASE_HTML before the content first, then the
+# content in chunks, then the rest. The head is compiled once and kept by Jinja.
+PAGE_HEAD, PAGE_TAIL = BASE_HTML.split("{{ content | safe }}")
+app.jinja_options = {**app.jinja_options, "loader": DictLoader({"page_head": PAGE_HEAD}), "autoescape": True}
+
+# Table rows sent per chunk of a streamed page
+ROW_CHUNK = 100
+
+def stream_page(*parts):
+    # The head is rendered before streaming starts, so flashed messages are
+    # consumed while the session can still be saved
+    head = render_template("page_head")
+    
+    def generate():
+        yield head
+        for part in parts:
+            if isinstance(part, str):
+                yield part
+            else:
+                yield from part
+        yield PAGE_TAIL
+    
+    return Response(stream_with_context(generate()), mimetype="text/html")
+
+def table_rows(transactions, row):
+    # Rows joined a chunk at a time, never the whole table at once
+    for start in range(0, len(transactions), ROW_CHUNK):
+        yield "".join(row(t) for t in transactions[start:start + ROW_CHUNK])
+
 # Routes
 @app.route('/')
 def index():
@@ -291,60 +397,17 @@ def dashboard():
     
     username = session['username']
     user_data = load_user(username)
+    transactions = live_transactions(user_data)
     
     # Calculate stats
-    total_spent = sum(t["amount"] for t in user_data["transactions"])
-    approved_spent = sum(t["amount"] for t in user_data["transactions"] if t["approved"])
-    pending_count = sum(1 for t in user_data["transactions"] if not t["approved"])
-    
-    transactions_html = ""
-    if user_data["transactions"]:
-        transactions_html = """
-        <div class="table-responsive">
-            <table class="table table-hover">
-                <thead class="table-light">
-                    <tr>
-                        <th>Date</th>
-                        <th>Description</th>
-                        <th>Platform</th>
-                        <th>Category</th>
-                        <th>Amount</th>
-                        <th>Status</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
-        
-        for t in sorted(user_data["transactions"], key=lambda x: x["date"], reverse=True):
-            status = '<span class="badge bg-success">Approved</span>' if t["approved"] else '<span class="badge bg-warning">Pending</span>'
-            transactions_html += f"""
-                <tr>
-                    <td>{t["date"]}</td>
-                    <td>{t["description"]}</td>
-                    <td>{t["platform"]}</td>
-                    <td>{t["category"]}</td>
-                    <td>₹{t["amount"]}</td>
-                    <td>{status}</td>
-                </tr>
-            """
-        
-        transactions_html += """
-                </tbody>
-            </table>
-        </div>
-        """
-    else:
-        transactions_html = """
-        <div class="text-center p-4">
-            <p class="text-muted">No transactions yet</p>
-            <a href="/add" class="btn btn-primary"><i class="fas fa-plus me-1"></i>Add First Transaction</a>
-        </div>
-        """
+    total_spent = sum(t["amount"] for t in transactions)
+    approved_spent = sum(t["amount"] for t in transactions if t["approved"])
+    pending_count = sum(1 for t in transactions if not t["approved"])
     
-    content = f"""
+    header = f"""
     <div class="row mb-4">
         <div class="col-md-8">
-            <h2>Welcome, {username}</h2>
+            <h2>Welcome, {escape(username)}</h2>
             <p class="text-muted">Parent Account</p>
         </div>
         <div class="col-md-4 text-end">
@@ -382,7 +445,9 @@ def dashboard():
             <a href="/add" class="btn btn-sm btn-primary"><i class="fas fa-plus me-1"></i>Add</a>
         </div>
         <div class="card-body p-0">
-            {transactions_html}
+    """
+    
+    footer = """
         </div>
     </div>
 
@@ -394,7 +459,50 @@ def dashboard():
     </div>
     """
     
-    return render_template_string(BASE_HTML, content=content)
+    if not transactions:
+        return stream_page(header, """
+        <div class="text-center p-4">
+            <p class="text-muted">No transactions yet</p>
+            <a href="/add" class="btn btn-primary"><i class="fas fa-plus me-1"></i>Add First Transaction</a>
+        </div>
+        """, footer)
+    
+    def row(t):
+        status = '<span class="badge bg-success">Approved</span>' if t["approved"] else '<span class="badge bg-warning">Pending</span>'
+        return f"""
+                <tr>
+                    <td>{t["date"]}</td>
+                    <td>{escape(t["description"])}</td>
+                    <td>{escape(t["platform"])}</td>
+                    <td>{escape(t["category"])}</td>
+                    <td>₹{t["amount"]}</td>
+                    <td>{status}</td>
+                </tr>
+            """
+    
+    table_head = """
+        <div class="table-responsive">
+            <table class="table table-hover">
+                <thead class="table-light">
+                    <tr>
+                        <th>Date</th>
+                        <th>Description</th>
+                        <th>Platform</th>
+                        <th>Category</th>
+                        <th>Amount</th>
+                        <th>Status</th>
+                    </tr>
+                </thead>
+                <tbody>
+        """
+    table_foot = """
+                </tbody>
+            </table>
+        </div>
+        """
+    
+    transactions = sorted(transactions, key=lambda x: x["date"], reverse=True)
+    return stream_page(header, table_head, table_rows(transactions, row), table_foot, footer)
 
 @app.route('/add', methods=['GET', 'POST'])
 def add_transaction():
@@ -424,11 +532,10 @@ def add_transaction():
             "approved": False
         }
         
-        user_data["transactions"].append(transaction)
+        append_transaction(user_data, transaction)
         user_data["profile"]["balance"] -= amount
         
-        with open(f'data/{username}.json', 'w') as f:
-            json.dump(user_data, f)
+        write_user(username, user_data)
         
         flash('Transaction added successfully! Waiting for approval.')
         return redirect('/dashboard')
@@ -511,32 +618,47 @@ def approvals():
     username = session['username']
     user_data = load_user(username)
     
-    pending_transactions = [t for t in user_data["transactions"] if not t["approved"]]
+    pending_transactions = [t for t in live_transactions(user_data) if not t["approved"]]
     
-    if pending_transactions:
-        transactions_html = """
-        <div class="table-responsive">
-            <table class="table table-hover">
-                <thead>
-                    <tr>
-                        <th>Date</th>
-                        <th>Description</th>
-                        <th>Platform</th>
-                        <th>Category</th>
-                        <th>Amount</th>
-                        <th>Action</th>
-                    </tr>
-                </thead>
-                <tbody>
-        """
-        
-        for t in pending_transactions:
-            transactions_html += f"""
+    header = """
+    <div class="row mb-4">
+        <div class="col">
+            <h2><i class="fas fa-check-circle me-2"></i>Parent Approval</h2>
+            <p class="text-muted">Review and approve game purchases</p>
+        </div>
+    </div>
+
+    <div class="card">
+        <div class="card-header bg-light">
+            <h5 class="mb-0">Pending Approvals</h5>
+        </div>
+        <div class="card-body p-0">
+    """
+    
+    footer = """
+        </div>
+    </div>
+    """
+    
+    if not pending_transactions:
+        return stream_page(header, """
+        <div class="text-center p-5">
+            <i class="fas fa-check-circle fa-4x text-success mb-3"></i>
+            <h4>No Pending Approvals</h4>
+            <p class="text-muted">There are no game purchases waiting for your approval.</p>
+            <a href="/dashboard" class="btn btn-primary mt-2">
+                <i class="fas fa-home me-1"></i>Return to Dashboard
+            </a>
+        </div>
+        """, footer)
+    
+    def row(t):
+        return f"""
                 <tr>
                     <td>{t["date"]}</td>
-                    <td>{t["description"]}</td>
-                    <td>{t["platform"]}</td>
-                    <td>{t["category"]}</td>
+                    <td>{escape(t["description"])}</td>
+                    <td>{escape(t["platform"])}</td>
+                    <td>{escape(t["category"])}</td>
                     <td>₹{t["amount"]}</td>
                     <td>
                         <div class="btn-group btn-group-sm">
@@ -550,43 +672,29 @@ def approvals():
                     </td>
                 </tr>
             """
-        
-        transactions_html += """
+    
+    table_head = """
+        <div class="table-responsive">
+            <table class="table table-hover">
+                <thead>
+                    <tr>
+                        <th>Date</th>
+                        <th>Description</th>
+                        <th>Platform</th>
+                        <th>Category</th>
+                        <th>Amount</th>
+                        <th>Action</th>
+                    </tr>
+                </thead>
+                <tbody>
+        """
+    table_foot = """
                 </tbody>
             </table>
         </div>
         """
-    else:
-        transactions_html = """
-        <div class="text-center p-5">
-            <i class="fas fa-check-circle fa-4x text-success mb-3"></i>
-            <h4>No Pending Approvals</h4>
-            <p class="text-muted">There are no game purchases waiting for your approval.</p>
-            <a href="/dashboard" class="btn btn-primary mt-2">
-                <i class="fas fa-home me-1"></i>Return to Dashboard
-            </a>
-        </div>
-        """
     
-    content = f"""
-    <div class="row mb-4">
-        <div class="col">
-            <h2><i class="fas fa-check-circle me-2"></i>Parent Approval</h2>
-            <p class="text-muted">Review and approve game purchases</p>
-        </div>
-    </div>
-
-    <div class="card">
-        <div class="card-header bg-light">
-            <h5 class="mb-0">Pending Approvals</h5>
-        </div>
-        <div class="card-body p-0">
-            {transactions_html}
-        </div>
-    </div>
-    """
-    
-    return render_template_string(BASE_HTML, content=content)
+    return stream_page(header, table_head, table_rows(pending_transactions, row), table_foot, footer)
 
 @app.route('/approve/<transaction_id>')
 def approve(transaction_id):
@@ -594,15 +702,7 @@ def approve(transaction_id):
         return redirect('/login')
     
     username = session['username']
-    user_data = load_user(username)
-    
-    for t in user_data["transactions"]:
-        if t["id"] == transaction_id:
-            t["approved"] = True
-            break
-    
-    with open(f'data/{username}.json', 'w') as f:
-        json.dump(user_data, f)
+    log_update(username, "approve", transaction_id)
     
     flash('Transaction approved')
     return redirect('/approvals')
@@ -613,18 +713,8 @@ def deny(transaction_id):
         return redirect('/login')
     
     username = session['username']
-    user_data = load_user(username)
-    
-    for i, t in enumerate(user_data["transactions"]):
-        if t["id"] == transaction_id:
-            # Refund the amount
-            user_data["profile"]["balance"] += t["amount"]
-            # Remove the transaction
-            user_data["transactions"].pop(i)
-            break
-    
-    with open(f'data/{username}.json', 'w') as f:
-        json.dump(user_data, f)
+    # The transaction is removed and its amount refunded when the log is replayed
+    log_update(username, "deny", transaction_id)
     
     flash('Transaction denied and amount refunded')
     return redirect('/approvals')
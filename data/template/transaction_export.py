@@ -0,0 +1,117 @@
+import io
+import csv
+import json
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is unavailable without pyarrow
+    pa = pq = None
+
+# Columns of every export, in order
+EXPORT_FIELDS = [
+    "username", "id", "date", "amount", "description", "game_platform",
+    "game_category", "is_game_purchase", "approved_by_parent"
+]
+
+# Transactions read per page; only one page is held in memory at a time
+EXPORT_CHUNK = 1000
+
+
+def export_pages(store, usernames, chunk_size=EXPORT_CHUNK):
+    # Each account's history, newest first, one keyset page at a time
+    for username in usernames:
+        before = None
+        while True:
+            transactions, before = store.transaction_page(username, chunk_size, before)
+            if transactions:
+                yield [dict(transaction, username=username) for transaction in transactions]
+            if before is None:
+                break
+
+
+def csv_chunks(pages):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for page in pages:
+        writer.writerows(page)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def ndjson_chunks(pages):
+    for page in pages:
+        yield "".join(
+            json.dumps({field: transaction.get(field) for field in EXPORT_FIELDS}) + "\n"
+            for transaction in page
+        ).encode("utf-8")
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only file that hands back whatever was written since the last drain
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._size
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def parquet_chunks(pages):
+    # One row group per page, sent as soon as it is encoded
+    schema = pa.schema([
+        ("username", pa.string()),
+        ("id", pa.string()),
+        ("date", pa.string()),
+        ("amount", pa.float64()),
+        ("description", pa.string()),
+        ("game_platform", pa.string()),
+        ("game_category", pa.string()),
+        ("is_game_purchase", pa.bool_()),
+        ("approved_by_parent", pa.bool_()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for page in pages:
+        writer.write_table(pa.Table.from_pylist(
+            [{field: transaction.get(field) for field in EXPORT_FIELDS} for transaction in page], schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+# format -> (MIME type, chunk encoder)
+EXPORT_FORMATS = {
+    "csv": ("text/csv", csv_chunks),
+    "ndjson": ("application/x-ndjson", ndjson_chunks),
+    "parquet": ("application/vnd.apache.parquet", parquet_chunks),
+}
+
+
+def format_available(export_format):
+    return export_format in EXPORT_FORMATS and (export_format != "parquet" or pq is not None)
+
+
+def export_chunks(store, usernames, export_format, chunk_size=EXPORT_CHUNK):
+    # Encoded export of the given accounts' transactions as a stream of bytes
+    return EXPORT_FORMATS[export_format][1](export_pages(store, usernames, chunk_size))
@@ -0,0 +1,215 @@
+import uuid
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from transaction_export import export_pages
+
+# CSV rows parsed and validated per batch
+IMPORT_CHUNK = 10000
+
+# Invalid rows listed in an import summary (all of them are counted)
+MAX_REPORTED_ERRORS = 100
+
+# Header spellings seen in store exports, per transaction field
+# ("id" is the app's own transaction id, as in its exports; store receipt
+# numbers are "receipt_id")
+COLUMN_ALIASES = {
+    "id": ["id"],
+    "receipt_id": ["transaction id", "order id", "order number", "receipt id"],
+    "date": ["date", "purchase date", "transaction date", "order date", "date purchased"],
+    "amount": ["amount", "price", "total", "cost", "item price", "amount paid"],
+    "description": ["description", "item", "items", "item name", "title", "product", "game"],
+    "game_platform": ["game platform", "platform", "store"],
+    "game_category": ["game category", "category", "type"],
+}
+
+# Store names as they appear in receipts -> platform
+PLATFORM_ALIASES = {
+    "playstation store": "PlayStation", "playstation network": "PlayStation", "psn": "PlayStation",
+    "microsoft store": "Xbox", "xbox live": "Xbox",
+    "nintendo eshop": "Nintendo Switch", "eshop": "Nintendo Switch",
+    "apple": "App Store", "itunes": "App Store", "apple app store": "App Store",
+    "google play store": "Google Play", "google": "Google Play",
+    "epic games store": "Epic Games", "steam store": "Steam",
+}
+
+# Category for rows that name none (or an unknown one), by platform
+PLATFORM_CATEGORIES = {
+    "Steam": "PC Games", "Epic Games": "PC Games",
+    "PlayStation": "Console Games", "Xbox": "Console Games", "Nintendo Switch": "Console Games",
+    "App Store": "Mobile Games", "Google Play": "Mobile Games", "PUBG Mobile": "Mobile Games",
+}
+DEFAULT_CATEGORY = "In-App Purchases"
+
+# Ids of imported rows that carry a receipt id are derived from it, so
+# importing the same receipt twice yields the same transaction id
+IMPORT_NAMESPACE = uuid.UUID("6f1c2a4e-8a53-4d4e-9b0e-2f3c8d7e5a91")
+
+
+def header_key(name):
+    return " ".join(str(name).replace("_", " ").split()).casefold()
+
+
+def parse_dates(values):
+    # Naive datetimes; values with an offset are converted to UTC. Newer pandas
+    # infers one format per batch, so values written differently from the
+    # first one are retried on their own.
+    dates = pd.to_datetime(values, errors="coerce", utc=True)
+    retry = dates.isna() & (values != "")
+    if retry.any():
+        dates[retry] = values[retry].map(lambda value: pd.to_datetime(value, errors="coerce", utc=True))
+    return dates.dt.tz_convert(None)
+
+
+def fingerprints(frame):
+    # 64-bit hash of (day, amount in paise, description, platform) per row:
+    # the same purchase as recorded by the app or by a store's receipt
+    return pd.util.hash_pandas_object(pd.DataFrame({
+        "day": frame["date"].str[:10],
+        "paise": (frame["amount"].astype(float) * 100).round().astype(np.int64),
+        "description": frame["description"].str.strip().str.casefold(),
+        "platform": frame["game_platform"],
+    }), index=False)
+
+
+class CsvImporter:
+    # Imports purchase history from store CSV exports. Files are parsed in
+    # batches of IMPORT_CHUNK rows; each batch is mapped to the app's
+    # platforms and categories, validated column-wise and deduplicated
+    # against the account's existing transactions: rows whose app id or
+    # receipt-derived id is already there, and rows matching a recorded
+    # purchase by fingerprint, are skipped. Everything new is then stored
+    # with one add_transactions call. Imported purchases are historical: they
+    # are recorded as approved, outside the spending limits, and do not
+    # change the account balance.
+
+    def __init__(self, platforms, categories):
+        self.platforms = list(platforms)
+        self.categories = list(categories)
+        self._platform_lookup = {name.casefold(): name for name in self.platforms}
+        self._platform_lookup.update({
+            alias: name for alias, name in PLATFORM_ALIASES.items() if name in self.platforms
+        })
+        self._category_lookup = {name.casefold(): name for name in self.categories}
+
+    def map_columns(self, columns):
+        # {field: CSV column}; raises ValueError without a date and an amount column
+        by_key = {header_key(column): column for column in columns}
+        mapping = {}
+        for field, aliases in COLUMN_ALIASES.items():
+            for alias in aliases:
+                if alias in by_key:
+                    mapping[field] = by_key[alias]
+                    break
+        missing = [field for field in ("date", "amount") if field not in mapping]
+        if missing:
+            raise ValueError(f"The file has no {' or '.join(missing)} column")
+        return mapping
+
+    def prepare(self, chunk, mapping, default_platform=None):
+        # One parsed batch as a frame of transaction fields plus an "error"
+        # column ("" for valid rows), computed column-wise
+        def column(field):
+            if field in mapping:
+                return chunk[mapping[field]].astype(str).str.strip()
+            return pd.Series("", index=chunk.index)
+
+        amount = pd.to_numeric(column("amount").str.replace(r"[^0-9.\-]", "", regex=True), errors="coerce")
+        date = parse_dates(column("date"))
+        tomorrow = pd.Timestamp(datetime.date.today() + datetime.timedelta(days=1))
+
+        fallback = default_platform if default_platform in self.platforms else "Other"
+        platform = column("game_platform").str.casefold().map(self._platform_lookup).fillna(fallback)
+        category = column("game_category").str.casefold().map(self._category_lookup)
+        category = category.fillna(platform.map(PLATFORM_CATEGORIES)).fillna(DEFAULT_CATEGORY)
+        description = column("description")
+        description = description.where(description != "", platform + " purchase")
+
+        frame = pd.DataFrame({
+            "source_id": column("id"),
+            "receipt_id": column("receipt_id"),
+            "date": date.dt.strftime("%Y-%m-%dT%H:%M:%S"),
+            "amount": amount.round(2),
+            "description": description,
+            "game_platform": platform,
+            "game_category": category,
+        })
+        frame["error"] = np.select(
+            [amount.isna(), amount <= 0, date.isna(), date >= tomorrow],
+            ["amount is not a number", "amount must be greater than 0",
+             "date is not a valid date", "date is in the future"],
+            default=""
+        )
+        return frame
+
+    def existing_keys(self, store, username):
+        # (transaction ids, fingerprints) of the account's history, read page by page
+        ids, seen = set(), set()
+        for page in export_pages(store, [username]):
+            frame = pd.DataFrame(page)
+            ids.update(frame["id"])
+            seen.update(fingerprints(frame.fillna("")).tolist())
+        return ids, seen
+
+    def import_file(self, store, username, file, default_platform=None, dry_run=False):
+        # Returns {"imported", "duplicates", "invalid", "errors": [{"line", "error"}]}
+        ids, seen = self.existing_keys(store, username)
+        summary = {"imported": 0, "duplicates": 0, "invalid": 0, "errors": []}
+        transactions = []
+        mapping = None
+        reader = pd.read_csv(
+            file, dtype=str, keep_default_na=False, chunksize=IMPORT_CHUNK, encoding="utf-8-sig"
+        )
+        for chunk in reader:
+            if mapping is None:
+                mapping = self.map_columns(chunk.columns)
+            frame = self.prepare(chunk, mapping, default_platform)
+
+            invalid = frame[frame["error"] != ""]
+            summary["invalid"] += len(invalid)
+            room = MAX_REPORTED_ERRORS - len(summary["errors"])
+            summary["errors"].extend(
+                # Line numbers count the header as line 1
+                {"line": int(index) + 2, "error": error}
+                for index, error in invalid["error"].head(max(room, 0)).items()
+            )
+            frame = frame[frame["error"] == ""].copy()
+
+            # Rows of the app's own export carry ids already in the history
+            exported = frame["source_id"].isin(ids)
+            frame["id"] = [
+                str(uuid.uuid5(IMPORT_NAMESPACE, f"{username}:{platform}:{receipt_id}")) if receipt_id else str(uuid.uuid4())
+                for receipt_id, platform in zip(frame["receipt_id"], frame["game_platform"])
+            ]
+            frame["fingerprint"] = fingerprints(frame)
+            has_receipt = frame["receipt_id"] != ""
+            # Every row is checked against the history by fingerprint, which
+            # catches receipts for purchases entered by hand. Within the file,
+            # rows with receipts are told apart by them.
+            duplicate = exported | frame["id"].isin(ids) | frame["fingerprint"].isin(seen)
+            duplicate |= np.where(has_receipt, frame["id"].duplicated(), frame["fingerprint"].duplicated())
+            summary["duplicates"] += int(duplicate.sum())
+            frame = frame[~duplicate]
+            ids.update(frame["id"])
+            seen.update(frame.loc[frame["receipt_id"] == "", "fingerprint"].tolist())
+
+            transactions.extend(
+                {
+                    "id": row.id,
+                    "date": row.date,
+                    "amount": float(row.amount),
+                    "description": row.description,
+                    "game_platform": row.game_platform,
+                    "game_category": row.game_category,
+                    "is_game_purchase": True,
+                    "approved_by_parent": True,
+                }
+                for row in frame.itertuples(index=False)
+            )
+
+        if transactions and not dry_run:
+            store.add_transactions(username, transactions, charge_balance=False)
+        summary["imported"] = len(transactions)
+        return summary
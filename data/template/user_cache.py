@@ -0,0 +1,66 @@
+import threading
+from collections import OrderedDict
+
+
+class UserDocumentCache:
+    # Bounded LRU of parsed user documents keyed by username. Each entry
+    # remembers the signature it was loaded under (file stats or a version
+    # counter) and is only served while the caller's signature still matches.
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, username, signature):
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != signature:
+                del self._entries[username]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[1]
+
+    def peek(self, username, signature):
+        # Like get(), but without touching the LRU order or the stats
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[0] != signature:
+                return None
+            return entry[1]
+
+    def put(self, username, signature, document):
+        with self._lock:
+            self._entries[username] = (signature, document)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, username):
+        with self._lock:
+            if self._entries.pop(username, None) is not None:
+                self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0
+            }
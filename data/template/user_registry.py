@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+# Bloom filter sizing: 2^23 bits (1 MB) keeps false positives under 1%
+# for a few hundred thousand accounts with 7 hash functions
+BLOOM_BITS = 1 << 23
+BLOOM_HASHES = 7
+
+
+def username_digest(username):
+    return hashlib.sha256(username.encode("utf-8")).hexdigest()
+
+
+def valid_username(username):
+    # Usernames name files and directories in the data store, so nothing path-like
+    return bool(username) and not username.startswith(".") and not any(c in username for c in "/\\\0")
+
+
+class BloomFilter:
+    # Probabilistic set of username digests: "no" is definite, "yes" means maybe
+
+    def __init__(self, size=BLOOM_BITS, hashes=BLOOM_HASHES):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray(size // 8)
+
+    def _positions(self, digest):
+        # Slice the 256-bit digest into independent 32-bit hash values
+        for i in range(self.hashes):
+            yield int(digest[i * 8:(i + 1) * 8], 16) % self.size
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+class UserRegistry:
+    # One small JSON record per account in a hash-sharded directory:
+    #   users/<first two hex digits of sha256(username)>/<sha256(username)>.json
+    # Lookups and inserts touch a single file. Inserts are exclusive creates,
+    # so concurrent registrations can never overwrite each other.
+
+    def __init__(self, registry_dir, legacy_file=None):
+        self.registry_dir = registry_dir
+        self.bloom = BloomFilter()
+        self._lock = threading.Lock()
+        os.makedirs(registry_dir, exist_ok=True)
+        self._load_bloom()
+        if legacy_file:
+            self._import_legacy(legacy_file)
+
+    def _record_file(self, digest):
+        return os.path.join(self.registry_dir, digest[:2], digest + ".json")
+
+    def _load_bloom(self):
+        # File names are the digests, so no record has to be opened
+        for shard in os.scandir(self.registry_dir):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".json"):
+                        self.bloom.add(entry.name[:-len(".json")])
+
+    def _import_legacy(self, legacy_file):
+        # One-time move from the monolithic users.json. Every worker tries it
+        # at startup; the first to take the lock migrates the file, the rest
+        # find it gone. An import cut short is redone, as create() skips
+        # accounts that already exist.
+        with open(os.path.join(self.registry_dir, "import.lock"), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(legacy_file, 'r') as f:
+                    users = json.load(f)
+            except FileNotFoundError:
+                return
+            for username, record in users.items():
+                self.create(username, record)
+            os.replace(legacy_file, legacy_file + ".migrated")
+
+    def _known(self, digest):
+        # The filter only says no for accounts this process has not seen;
+        # another worker may have registered one since it was built, so a
+        # lookup that must find existing accounts falls back to the disk
+        if digest in self.bloom:
+            return True
+        if not os.path.exists(self._record_file(digest)):
+            return False
+        with self._lock:
+            self.bloom.add(digest)
+        return True
+
+    def exists(self, username):
+        # Pre-check for new usernames: a filter miss is answered without
+        # touching the disk. A name registered by another worker since the
+        # filter was built is caught by the exclusive create().
+        digest = username_digest(username)
+        return digest in self.bloom and os.path.exists(self._record_file(digest))
+
+    def get(self, username):
+        digest = username_digest(username)
+        if not self._known(digest):
+            return None
+        try:
+            with open(self._record_file(digest), 'r') as f:
+                return json.load(f)["user"]
+        except FileNotFoundError:
+            return None
+
+    def create(self, username, user):
+        # Returns False if the username is already taken
+        digest = username_digest(username)
+        record_file = self._record_file(digest)
+        os.makedirs(os.path.dirname(record_file), exist_ok=True)
+        tmp_file = f"{record_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"username": username, "user": user}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            # link() fails if the target exists, unlike rename()
+            os.link(tmp_file, record_file)
+            created = True
+        except FileExistsError:
+            created = False
+        finally:
+            os.remove(tmp_file)
+        with self._lock:
+            self.bloom.add(digest)
+        return created
+
+    def update(self, username, **fields):
+        digest = username_digest(username)
+        record_file = self._record_file(digest)
+        with self._lock:
+            with open(record_file, 'r') as f:
+                record = json.load(f)
+            record["user"].update(fields)
+            tmp_file = f"{record_file}.{os.getpid()}.tmp"
+            with open(tmp_file, 'w') as f:
+                json.dump(record, f)
+            os.replace(tmp_file, record_file)